@@ -3,35 +3,100 @@ from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 from flask import Flask
 
 from app.utils.logging import setup_logging, get_logger
+from app.utils.metrics import metrics
 from app.config import *
+from contextlib import contextmanager
+from datetime import datetime
 import asyncio
+import time
 
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 
 from sqlalchemy.ext.asyncio import AsyncEngine
+from app.database.instrumentation import TimedQueuePool, instrument_engine
 
 # from app.database.models import *
 
 db = SQLAlchemy()
 async_session = None
+background_tasks = set()
 
 
-async def setup_database(app):
-    app.config["SQLALCHEMY_DATABASE_URI"] = (
-        f"mysql+asyncmy://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
-    )
+async def setup_database(app, create=True):
+    if DATABASE_BACKEND == "sqlite":
+        os.makedirs(os.path.dirname(os.path.abspath(SQLITE_PATH)), exist_ok=True)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri()
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.init_app(app)
 
     global async_session
-    async_engine = create_async_engine(app.config["SQLALCHEMY_DATABASE_URI"], echo=True)
+    async_engine = create_database_engine(app.config["SQLALCHEMY_DATABASE_URI"])
     async_session = sessionmaker(
         async_engine, expire_on_commit=False, class_=AsyncSession
     )
     # Create tables if needed
-    await create_tables(async_engine)
+    if create:
+        await create_tables(async_engine)
+    return async_engine
+
+
+def database_uri():
+    if DATABASE_BACKEND == "sqlite":
+        return f"sqlite+aiosqlite:///{os.path.abspath(SQLITE_PATH)}"
+    if DATABASE_BACKEND != "mysql":
+        raise ValueError(f"Unknown DATABASE_BACKEND: {DATABASE_BACKEND}")
+    return f"mysql+asyncmy://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+
+
+def create_database_engine(uri):
+    """
+    Creates the instrumented async engine for a MySQL or SQLite database URI.
+    """
+    backend = make_url(uri).get_backend_name()
+    async_engine = create_async_engine(uri, **engine_options(backend))
+    if backend == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+    instrument_engine(async_engine.sync_engine)
+    return async_engine
+
+
+def engine_options(backend):
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if backend == "sqlite":
+        # sqlite3's busy timeout: how long a writer waits for the write lock.
+        options["connect_args"] = {"timeout": SQLITE_BUSY_TIMEOUT}
+        return options
+
+    connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS:
+        connect_args["init_command"] = (
+            f"SET SESSION max_execution_time={DB_STATEMENT_TIMEOUT_MS}"
+        )
+    return {
+        **options,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer, and NORMAL sync is
+    # durable across application crashes in WAL mode.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
 
 
 async def create_tables(engine: AsyncEngine):
@@ -44,66 +109,246 @@ async def create_tables(engine: AsyncEngine):
     except Exception as e:
         print(f"Error creating tables: {e}")
 
+    from app.database.migrations import run_migrations
+
+    async with engine.begin() as conn:
+        await conn.run_sync(run_migrations)
+
+
+async def preload_identity_cache(bot_names):
+    from app.database.dao import preload_bot_ids
 
-async def create_app():
+    try:
+        await preload_bot_ids(bot_names)
+    except Exception as e:
+        # The DAO looks ids up on first use instead.
+        logger.error(f"Failed to preload bot ids: {e}")
+
+
+async def prepare_database(bot_names):
+    """
+    Creates the schema and runs the one-off backfills, for a supervisor to do
+    once before it starts workers that skip them.
+    """
+    from slack_sdk.web.async_client import AsyncWebClient
+
+    setup_logging()
+    async_engine = await setup_database(Flask(__name__))
+    try:
+        await preload_identity_cache(bot_names)
+        bot_user_ids = {}
+        for bot_name in bot_names:
+            client = AsyncWebClient(token=SLACK_BOTS[bot_name].get("bot_token"))
+            try:
+                bot_user_ids[bot_name] = await get_bot_user_id(client)
+            except Exception as e:
+                logger.error(f"Failed to look up the user id of {bot_name}: {e}")
+        await backfill_sender_types(bot_user_ids)
+    finally:
+        await async_engine.dispose()
+
+
+async def create_app(bot_names=None, prepare=True, archive=True, log_metrics=True):
+    """
+    Starts the bots in `bot_names`, or all of them, and serves their events.
+
+    Args:
+    prepare (bool): Whether to create the schema and run the one-off backfills,
+        which prepare_database has already done for supervised workers.
+    archive (bool): Whether this process runs archival. Only one process should.
+    log_metrics (bool): Whether to log this process's metrics periodically.
+        Supervised workers send them to the supervisor, which logs the total.
+    """
+    from app.database.write_behind import write_queue
+    from app.slackbot.downloads import slack_file_downloader
+
+    started_at = datetime.utcnow()
     flask_app = Flask(__name__)
     setup_logging()
     logger = get_logger(__name__)
 
-    await setup_database(flask_app)
+    slack_bots = {
+        bot_name: bot_config
+        for bot_name, bot_config in SLACK_BOTS.items()
+        if bot_names is None or bot_name in bot_names
+    }
+
+    startup_timer = StartupTimer()
+    with startup_timer.phase("database"):
+        await setup_database(flask_app, create=prepare)
+        await preload_identity_cache(list(slack_bots))
+        write_queue.start()
+    with startup_timer.phase("initialize_bolt_apps"):
+        bolt_apps = await initialize_bolt_apps(slack_bots, startup_timer)
+    with startup_timer.phase("register_listeners"):
+        register_bolt_apps(bolt_apps)
+    with startup_timer.phase("connect_handlers"):
+        await connect_bolt_handlers(bolt_apps)
+    logger.info(f"Application startup: {startup_timer.report()}")
+
+    # Channel cleanup and wake-up messages don't need to hold up the sockets.
+    start_background_task(cleanup_bolt_apps(bolt_apps, started_at))
+    if prepare:
+        start_background_task(
+            backfill_sender_types(
+                {
+                    bot_name: bot_info["bot_user_id"]
+                    for bot_name, bot_info in bolt_apps.items()
+                }
+            )
+        )
+    if WARM_UP_AGENTS:
+        start_background_task(warm_up_agents(list(bolt_apps)))
+    if log_metrics:
+        start_background_task(log_process_metrics())
+    if archive and ARCHIVE_AFTER_DAYS:
+        from app.database.archive import run_archival
 
-    bolt_apps = await initialize_bolt_apps(SLACK_BOTS)
-    await register_and_cleanup_bolt_apps(bolt_apps)
-    await start_bolt_handlers(bolt_apps)
+        start_background_task(run_archival())
 
-    logger.info("Application startup")
+    # Keep the process serving events, as AsyncSocketModeHandler.start_async does.
+    try:
+        await asyncio.sleep(float("inf"))
+    finally:
+        # Commit what is still queued before the process exits.
+        await write_queue.stop()
+        await slack_file_downloader.close()
     return flask_app, bolt_apps
 
 
-async def initialize_bolt_apps(slack_bots):
-    # from app.database.dao import create_bot
+async def backfill_sender_types(bot_user_ids):
+    from app.database.dao import record_bot_user_ids, fill_missing_sender_types
+
+    try:
+        await record_bot_user_ids(
+            {
+                bot_name: bot_user_id
+                for bot_name, bot_user_id in bot_user_ids.items()
+                if bot_user_id
+            }
+        )
+        updated = await fill_missing_sender_types(list(SLACK_BOTS))
+        if updated:
+            logger.info(f"Filled in the sender type of {updated} stored messages")
+    except Exception as e:
+        logger.error(f"Failed to fill in sender types: {e}")
+
+
+async def log_process_metrics():
+    while True:
+        await asyncio.sleep(METRICS_REPORT_INTERVAL)
+        logger.info(f"Metrics: {metrics.snapshot()}")
+
+
+def start_background_task(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
-    bolt_apps = {}
-    for bot_name, bot_config in slack_bots.items():
-        bolt_app = AsyncApp(token=bot_config.get("bot_token"), name=bot_name)
-        handler = AsyncSocketModeHandler(bolt_app, bot_config.get("app_token"))
-        client = bolt_app.client
-        bot_user_id = await get_bot_user_id(client)
 
-        # await create_bot(bot_name)
+async def warm_up_agents(bot_names):
+    from app.slackbot.message_handler import agent_manager
+
+    start = time.monotonic()
+    try:
+        await asyncio.to_thread(agent_manager.warm_up, bot_names)
+        logger.info(f"Agents warmed up in {time.monotonic() - start:.2f}s")
+    except Exception as e:
+        logger.error(f"Failed to warm up agents: {e}")
+
+
+class StartupTimer:
+    """Records how long each startup phase takes, for the startup timing report."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            self.phases[name] = duration
+            metrics.gauge("startup_phase_seconds", phase=name).set(duration)
+
+    def report(self):
+        return ", ".join(
+            f"{name}={duration:.2f}s" for name, duration in self.phases.items()
+        )
+
+
+async def initialize_bolt_apps(slack_bots, startup_timer):
+    initialized = await asyncio.gather(
+        *(
+            initialize_bolt_app(bot_name, bot_config, startup_timer)
+            for bot_name, bot_config in slack_bots.items()
+        )
+    )
+    return dict(zip(slack_bots, initialized))
 
-        bolt_apps[bot_name] = {
-            "bolt_app": bolt_app,
-            "handler": handler,
-            "client": client,
-            "bot_user_id": bot_user_id,
-        }
-    return bolt_apps
 
+async def initialize_bolt_app(bot_name, bot_config, startup_timer):
+    bolt_app = AsyncApp(token=bot_config.get("bot_token"), name=bot_name)
+    handler = AsyncSocketModeHandler(bolt_app, bot_config.get("app_token"))
+    client = bolt_app.client
+    with startup_timer.phase(f"auth_test[{bot_name}]"):
+        bot_user_id = await get_bot_user_id(client)
+
+    return {
+        "bolt_app": bolt_app,
+        "handler": handler,
+        "client": client,
+        "bot_user_id": bot_user_id,
+    }
 
-async def register_and_cleanup_bolt_apps(bolt_apps):
+
+def register_bolt_apps(bolt_apps):
     from app.slackbot.listeners import register_listeners
 
     for bot_name, bot_info in bolt_apps.items():
-        bolt_app = bot_info.get("bolt_app")
-        bolt_client = bot_info.get("client")
-        bot_user_id = bot_info.get("bot_user_id")
         register_listeners(
-            bolt_app,
+            bot_info.get("bolt_app"),
             bot_name,
-            bolt_client,
-            bot_user_id,
+            bot_info.get("client"),
+            bot_info.get("bot_user_id"),
         )
-        await leave_unallowed_channels(bolt_client, bot_name)
-        await send_wake_up_message(bolt_client)
 
 
-async def start_bolt_handlers(bolt_apps):
-    handlers = [
-        bot_info.get("handler").start_async() for bot_info in bolt_apps.values()
-    ]
-    await asyncio.gather(*handlers)
-    logger.info("All handlers started")
+async def connect_bolt_handlers(bolt_apps):
+    await asyncio.gather(
+        *(bot_info.get("handler").connect_async() for bot_info in bolt_apps.values())
+    )
+    logger.info("All handlers connected")
+
+
+async def cleanup_bolt_apps(bolt_apps, started_at=None):
+    cleanup_timer = StartupTimer()
+    started_at = started_at or datetime.utcnow()
+
+    async def cleanup_bolt_app(bot_name, bot_info):
+        bolt_client = bot_info.get("client")
+        try:
+            with cleanup_timer.phase(f"cleanup[{bot_name}]"):
+                await leave_unallowed_channels(bolt_client, bot_name)
+                await send_wake_up_message(bolt_client)
+        except Exception as e:
+            logger.error(f"Startup cleanup failed for {bot_name}: {e}")
+        try:
+            with cleanup_timer.phase(f"reconcile[{bot_name}]"):
+                await reconcile_unfinished_streams(bolt_client, bot_name, started_at)
+        except Exception as e:
+            logger.error(f"Reconciling unfinished replies failed for {bot_name}: {e}")
+
+    await asyncio.gather(
+        *(
+            cleanup_bolt_app(bot_name, bot_info)
+            for bot_name, bot_info in bolt_apps.items()
+        )
+    )
+    logger.info(f"Startup cleanup finished: {cleanup_timer.report()}")
 
 
 async def get_bot_user_id(client):
@@ -115,8 +360,12 @@ async def get_bot_user_id(client):
 async def leave_unallowed_channels(client, bot_name):
     cursor = None
     while True:
-        response = await client.conversations_list(
-            cursor=cursor, types="public_channel,private_channel"
+        # Only the channels the bot is in, rather than every channel in the workspace.
+        response = await client.users_conversations(
+            cursor=cursor,
+            types="public_channel,private_channel",
+            exclude_archived=True,
+            limit=200,
         )
         if not response["ok"]:
             break
@@ -124,8 +373,7 @@ async def leave_unallowed_channels(client, bot_name):
         channels = response.get("channels", [])
         for channel in channels:
             channel_id = channel.get("id")
-            bot_is_member = channel.get("is_member")
-            if bot_is_member and channel_id not in LIST_OF_ALLOWED_CHANNELS:
+            if channel_id not in LIST_OF_ALLOWED_CHANNELS:
                 await client.conversations_leave(channel=channel_id)
                 logger.info(f"{bot_name} left channel {channel_id}")
 
@@ -134,6 +382,38 @@ async def leave_unallowed_channels(client, bot_name):
             break
 
 
+async def reconcile_unfinished_streams(client, bot_name, started_before):
+    """
+    Finishes replies that were still streaming when an earlier process stopped:
+    stores the text Slack has for them and removes their typing indicator.
+    """
+    from app.database.dao import get_unfinished_streams, update_message_text
+
+    unfinished = await get_unfinished_streams(bot_name, started_before)
+    for channel_id, thread_ts, message_ts, stored_text in unfinished:
+        try:
+            response = await client.conversations_replies(
+                channel=channel_id,
+                ts=thread_ts,
+                oldest=message_ts,
+                inclusive=True,
+                limit=2,
+            )
+            text = stored_text or ""
+            for message in response.get("messages", []):
+                if message.get("ts") == message_ts:
+                    text = message.get("text") or ""
+                    break
+            if TYPING_INDICATOR in text:
+                text = text.replace(f"\n\n{TYPING_INDICATOR}", "")
+                await client.chat_update(channel=channel_id, ts=message_ts, text=text)
+            await update_message_text(message_ts, text, is_streaming=False)
+        except Exception as e:
+            logger.error(f"Failed to reconcile {bot_name} reply {message_ts}: {e}")
+    if unfinished:
+        logger.info(f"Reconciled {len(unfinished)} unfinished {bot_name} replies")
+
+
 async def send_wake_up_message(client):
     await client.chat_postMessage(
         channel=MAINTAINER_SLACK_USER_ID, text="I've just been restarted."
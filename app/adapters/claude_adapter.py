@@ -35,6 +35,8 @@ class ClaudeAdapter(LLMAdapter):
                     raise ValueError(f"MIME type not found for file type: {file_type}")
                 try:
                     base64_image = await image_bytes_to_base64(file.file_bytes)
+                    if file.description:
+                        content.append({"type": "text", "text": file.description})
                     # Adjusting image content to match the API's expected format
                     content.append(
                         {
@@ -1,3 +1,4 @@
+import asyncio
 import importlib
 
 
@@ -19,17 +20,44 @@ class Agent:
 
 
 class AgentManager:
+    """
+    Creates each bot's agent the first time it is needed.
+
+    Agent modules pull in model clients and media libraries, so importing them
+    at boot would make every process pay for every bot. Replies load them with
+    `get_agent_async`, which keeps the import from blocking the other bots, and
+    `warm_up` loads them ahead of time when the first reply shouldn't wait.
+    """
+
     def __init__(self, slack_bots_config):
         self.agents = {}
+        self.agent_classes = {}
         self.initialise_agents(slack_bots_config)
 
     def initialise_agents(self, slack_bots_config):
         for bot_name, bot_info in slack_bots_config.items():
-            agent_class_str = bot_info["agent"]
-            module_name, class_name = agent_class_str.rsplit(".", 1)
-            module = importlib.import_module(module_name)
-            agent_class = getattr(module, class_name)
-            self.agents[bot_name] = agent_class()
+            self.agent_classes[bot_name] = bot_info["agent"]
+
+    def load_agent(self, bot_name):
+        agent_class_str = self.agent_classes[bot_name]
+        module_name, class_name = agent_class_str.rsplit(".", 1)
+        module = importlib.import_module(module_name)
+        agent_class = getattr(module, class_name)
+        return agent_class()
 
     def get_agent(self, bot_name):
+        if bot_name not in self.agents and bot_name in self.agent_classes:
+            self.agents[bot_name] = self.load_agent(bot_name)
         return self.agents.get(bot_name)
+
+    async def get_agent_async(self, bot_name):
+        """Like get_agent, but imports the agent's module off the event loop."""
+        if bot_name in self.agents:
+            return self.agents[bot_name]
+        return await asyncio.to_thread(self.get_agent, bot_name)
+
+    def warm_up(self, bot_names=None):
+        if bot_names is None:
+            bot_names = list(self.agent_classes)
+        for bot_name in bot_names:
+            self.get_agent(bot_name)
@@ -128,13 +128,22 @@ class ChatGPT(Agent):
                 raise PDFProcessingError(
                     f"Your PDF has {page_count} pages, which exceeds the {PDF_PAGE_LIMIT}-page limit."
                 )
-            file_type, images_bytes, pixel_count = await pdf_to_images(
-                file_bytes, slack_file_id
-            )
-            for image in images_bytes:
-                transformed_message.add_file(
-                    ProcessedFile(file_type, image, slack_file_id=slack_file_id)
-                )
+            pixel_count = 0
+            async for page_number, text, image_bytes, page_pixels in pdf_to_pages(
+                file_bytes, slack_file_id, pdf_reader=pdf_reader
+            ):
+                pixel_count += page_pixels
+                if text is not None:
+                    transformed_message.add_text(f"PDF page {page_number}:\n{text}\n")
+                else:
+                    transformed_message.add_file(
+                        ProcessedFile(
+                            "jpeg",
+                            image_bytes,
+                            description=f"PDF page {page_number}",
+                            slack_file_id=slack_file_id,
+                        )
+                    )
             await update_file(
                 slack_file_id,
                 properties={"page_count": page_count, "pixel_count": pixel_count},
@@ -165,7 +174,7 @@ class ChatGPT(Agent):
     ):
         if file_type not in self.supported_image_types:
             converted_file_type, converted_file_bytes = await convert_image_to_png(
-                file_type, file_bytes
+                file_type, file_bytes, slack_file_id=slack_file_id
             )
             transformed_message.add_file(
                 ProcessedFile(
@@ -202,12 +211,14 @@ class ChatGPT(Agent):
                 converted_file_bytes, converted_file_type
             )
             transcribed_text = await self.transcription_model.call_model(
-                converted_file_type, converted_file_bytes
+                converted_file_type,
+                converted_file_bytes,
+                slack_file_id=slack_file_id,
             )
         else:
             audio_length = await get_audio_length(file_bytes, file_type)
             transcribed_text = await self.transcription_model.call_model(
-                file_type, file_bytes
+                file_type, file_bytes, slack_file_id=slack_file_id
             )
 
         await transformed_message.add_text(
@@ -106,7 +106,7 @@ class StableDiffusion(Agent):
     ):
         if file_type not in self.supported_image_types:
             converted_file_type, converted_file_bytes = await convert_image_to_png(
-                file_type, file_bytes
+                file_type, file_bytes, slack_file_id=slack_file_id
             )
             transformed_message.add_file(
                 ProcessedFile(
@@ -12,26 +12,36 @@ SLACK_BOTS = {
         "bot_token": os.environ.get("DALLE_SLACK_BOT_TOKEN"),
         "app_token": os.environ.get("DALLE_SLACK_APP_TOKEN"),
         "agent": "app.agents.dalle.DALLE",
+        "provider": "openai",
+        "max_concurrency": int(os.environ.get("DALLE_MAX_CONCURRENCY", 2)),
     },
     "chatgpt": {
         "bot_token": os.environ.get("CHATGPT_SLACK_BOT_TOKEN"),
         "app_token": os.environ.get("CHATGPT_SLACK_APP_TOKEN"),
         "agent": "app.agents.chatgpt.ChatGPT",
+        "provider": "openai",
+        "max_concurrency": int(os.environ.get("CHATGPT_MAX_CONCURRENCY", 8)),
     },
     "claude": {
         "bot_token": os.environ.get("CLAUDE_SLACK_BOT_TOKEN"),
         "app_token": os.environ.get("CLAUDE_SLACK_APP_TOKEN"),
         "agent": "app.agents.claude.Claude",
+        "provider": "anthropic",
+        "max_concurrency": int(os.environ.get("CLAUDE_MAX_CONCURRENCY", 8)),
     },
     "stable_diffusion": {
         "bot_token": os.environ.get("STABLE_DIFF_SLACK_BOT_TOKEN"),
         "app_token": os.environ.get("STABLE_DIFF_SLACK_APP_TOKEN"),
         "agent": "app.agents.stable_diffusion.StableDiffusion",
+        "provider": "stability",
+        "max_concurrency": int(os.environ.get("STABLE_DIFF_MAX_CONCURRENCY", 2)),
     },
     "gemini": {
         "bot_token": os.environ.get("GEMINI_SLACK_BOT_TOKEN"),
         "app_token": os.environ.get("GEMINI_SLACK_APP_TOKEN"),
         "agent": "app.agents.gemini.Gemini",
+        "provider": "google",
+        "max_concurrency": int(os.environ.get("GEMINI_MAX_CONCURRENCY", 4)),
     },
 }
 
@@ -42,6 +52,12 @@ ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 STABILITY_API_KEY = os.environ.get("STABILITY_API_KEY")
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 
+# "mysql", or "sqlite" for an embedded database file at SQLITE_PATH, which suits
+# single-node deployments.
+DATABASE_BACKEND = os.environ.get("DATABASE_BACKEND", "mysql").lower()
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/slackbot.db")
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", 5))
+
 # MySQL database connection settings
 MYSQL_HOST = os.environ.get("MYSQL_HOST")
 MYSQL_PORT = os.environ.get("MYSQL_PORT")
@@ -52,6 +68,19 @@ except ValueError:
 MYSQL_USER = os.environ.get("MYSQL_USER")
 MYSQL_PASSWORD = os.environ.get("MYSQL_PASSWORD")
 MYSQL_DB = os.environ.get("MYSQL_DB")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+# Recycle connections before MySQL's wait_timeout closes them server-side.
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 3600))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+# Sets MySQL's max_execution_time for each connection, which applies to SELECTs;
+# 0 leaves statements unbounded.
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 10000))
+# Statements slower than SLOW_QUERY_SECONDS are counted, and a
+# SLOW_QUERY_LOG_SAMPLE_RATE fraction of them is logged with their SQL.
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_SECONDS", 0.5))
+SLOW_QUERY_LOG_SAMPLE_RATE = float(os.environ.get("SLOW_QUERY_LOG_SAMPLE_RATE", 0.1))
 
 # # Logging settings
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
@@ -73,6 +102,37 @@ logging.basicConfig(
 )
 
 MAX_SLACK_FILE_SIZE = int(os.environ.get("MAX_SLACK_FILE_SIZE"))
+# Slack file downloads share one keep-alive connection pool per bot token.
+SLACK_DOWNLOAD_CONNECTIONS_PER_HOST = int(
+    os.environ.get("SLACK_DOWNLOAD_CONNECTIONS_PER_HOST", 10)
+)
+SLACK_DOWNLOAD_DNS_CACHE_TTL = int(os.environ.get("SLACK_DOWNLOAD_DNS_CACHE_TTL", 300))
+SLACK_DOWNLOAD_KEEPALIVE_TIMEOUT = int(
+    os.environ.get("SLACK_DOWNLOAD_KEEPALIVE_TIMEOUT", 30)
+)
+SLACK_DOWNLOAD_TIMEOUT = int(os.environ.get("SLACK_DOWNLOAD_TIMEOUT", 300))
+SLACK_DOWNLOAD_CONNECT_TIMEOUT = int(
+    os.environ.get("SLACK_DOWNLOAD_CONNECT_TIMEOUT", 10)
+)
+SLACK_DOWNLOAD_READ_TIMEOUT = int(os.environ.get("SLACK_DOWNLOAD_READ_TIMEOUT", 60))
+# Downloads are streamed in chunks; bodies past the threshold are spooled to disk.
+SLACK_DOWNLOAD_CHUNK_SIZE = int(os.environ.get("SLACK_DOWNLOAD_CHUNK_SIZE", 65536))
+SLACK_DOWNLOAD_SPOOL_THRESHOLD = int(
+    os.environ.get("SLACK_DOWNLOAD_SPOOL_THRESHOLD", 1048576)
+)
+# Downloaded attachments are shared across turns and bots: a memory LRU bounded
+# in bytes, backed by a disk tier. Set either size to 0 to turn that tier off.
+ATTACHMENT_CACHE_MEMORY_BYTES = int(
+    os.environ.get("ATTACHMENT_CACHE_MEMORY_BYTES", 268435456)
+)
+ATTACHMENT_CACHE_DISK_BYTES = int(
+    os.environ.get("ATTACHMENT_CACHE_DISK_BYTES", 2147483648)
+)
+ATTACHMENT_CACHE_DIR = os.environ.get("ATTACHMENT_CACHE_DIR", "data/attachments")
+# Rendered pages, video frames and converted images, reused across turns. Set the
+# size to 0 to turn the store off; transcripts are kept in File.properties.
+ARTIFACT_STORE_DIR = os.environ.get("ARTIFACT_STORE_DIR", "data/artifacts")
+ARTIFACT_STORE_BYTES = int(os.environ.get("ARTIFACT_STORE_BYTES", 4294967296))
 GPT_MODEL = os.environ.get("GPT_MODEL")
 DALLE_MODEL = os.environ.get("DALLE_MODEL")
 WHISPER_MODEL = os.environ.get("WHISPER_MODEL")
@@ -81,11 +141,80 @@ GEMINI_MODEL = os.environ.get("GEMINI_MODEL")
 WHISPER_CHUNK_LIMIT = 20 * 1024 * 1024
 VIDEO_PROCESSING_DURATION_LIMIT = 60
 PDF_PAGE_LIMIT = 60
+# PDF pages are rendered by poppler's pdftoppm, a few pages at a time. Each
+# process parses the PDF once and renders up to PDF_RENDER_BATCH_PAGES pages.
+PDFTOPPM_PATH = os.environ.get("PDFTOPPM_PATH", "pdftoppm")
+PDF_RENDER_CONCURRENCY = int(
+    os.environ.get("PDF_RENDER_CONCURRENCY", os.cpu_count() or 2)
+)
+PDF_RENDER_BATCH_PAGES = int(os.environ.get("PDF_RENDER_BATCH_PAGES", 20))
+# Seconds per page; a batch gets this times its page count.
+PDF_RENDER_TIMEOUT = int(os.environ.get("PDF_RENDER_TIMEOUT", 60))
+# Pages with a good text layer and no figures are sent as text, not rendered.
+PDF_TEXT_LAYER = os.environ.get("PDF_TEXT_LAYER", "true").lower() == "true"
+PDF_TEXT_MIN_CHARS = int(os.environ.get("PDF_TEXT_MIN_CHARS", 100))
+PDF_FIGURE_MIN_PIXELS = int(os.environ.get("PDF_FIGURE_MIN_PIXELS", 40000))
 SLACK_MESSAGE_UPDATE_INTERVAL = 2
 LIST_OF_ALLOWED_CHANNELS = os.environ.get("LIST_OF_ALLOWED_CHANNELS", "").split(",")
 MAINTAINER_SLACK_USER_ID = os.environ.get("MAINTAINER_SLACK_USER_ID")
 TYPING_INDICATOR = ":typing-bubble:"
 SLACK_THREAD_MESSAGE_LIMIT = 50
+THREAD_SNAPSHOT_CACHE_SIZE = int(os.environ.get("THREAD_SNAPSHOT_CACHE_SIZE", 1000))
+THREAD_SNAPSHOT_TTL = int(os.environ.get("THREAD_SNAPSHOT_TTL", 1800))
+CONVERSATION_ID_CACHE_SIZE = int(os.environ.get("CONVERSATION_ID_CACHE_SIZE", 10000))
+CONVERSATION_ID_CACHE_TTL = int(os.environ.get("CONVERSATION_ID_CACHE_TTL", 86400))
+# Conversations with no new message for ARCHIVE_AFTER_DAYS are moved to the archive
+# tables every ARCHIVE_INTERVAL seconds, ARCHIVE_BATCH_SIZE conversations per
+# transaction; 0 days, the default, turns archival off. A later reply in an
+# archived thread is saved again from Slack's copy of the thread. The age must
+# exceed CONVERSATION_ID_CACHE_TTL so that no worker still has an archived id cached.
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 0))
+ARCHIVE_INTERVAL = int(os.environ.get("ARCHIVE_INTERVAL", 3600))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 100))
+ARCHIVE_BATCH_PAUSE = 0.5
+# Write-behind persistence: DB writes are queued and committed in batches off the
+# response path; submitting waits once WRITE_BEHIND_MAX_PENDING writes are queued.
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", 1000))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 100))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", 0.05))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.environ.get("WRITE_BEHIND_MAX_ATTEMPTS", 3))
+WRITE_BEHIND_RETRY_BACKOFF = 0.5
+# A streamed reply's text is stored when it finishes. While it streams, it is also
+# checkpointed every STREAM_CHECKPOINT_INTERVAL seconds and/or every
+# STREAM_CHECKPOINT_BYTES new bytes; 0 turns either checkpoint off. Replies cut
+# off by a crash are reconciled from Slack on the next start.
+STREAM_CHECKPOINT_INTERVAL = float(os.environ.get("STREAM_CHECKPOINT_INTERVAL", 0))
+STREAM_CHECKPOINT_BYTES = int(os.environ.get("STREAM_CHECKPOINT_BYTES", 0))
+# Slack retries an unacknowledged event after ~1 and ~5 minutes, so dedup keys
+# only need to outlive that window.
+SLACK_EVENT_DEDUP_TTL = int(os.environ.get("SLACK_EVENT_DEDUP_TTL", 600))
+SLACK_EVENT_DEDUP_MAX_SIZE = int(os.environ.get("SLACK_EVENT_DEDUP_MAX_SIZE", 10000))
+# When a newer message arrives in a thread, cancel the reply still being generated
+# for the older one instead of letting it finish first.
+CANCEL_SUPERSEDED_GENERATIONS = (
+    os.environ.get("CANCEL_SUPERSEDED_GENERATIONS", "false").lower() == "true"
+)
+
+# Admission control: replies beyond these limits wait in the work queue, and new
+# requests are turned away once WORK_QUEUE_MAX_DEPTH replies are already waiting.
+PROVIDER_CONCURRENCY_LIMITS = {
+    "openai": int(os.environ.get("OPENAI_MAX_CONCURRENCY", 10)),
+    "anthropic": int(os.environ.get("ANTHROPIC_MAX_CONCURRENCY", 8)),
+    "google": int(os.environ.get("GOOGLE_MAX_CONCURRENCY", 4)),
+    "stability": int(os.environ.get("STABILITY_MAX_CONCURRENCY", 2)),
+}
+DEFAULT_BOT_CONCURRENCY = 4
+WORK_QUEUE_MAX_DEPTH = int(os.environ.get("WORK_QUEUE_MAX_DEPTH", 50))
+
+# Multi-process mode: empty runs every bot in one process, "per_bot" runs one
+# worker process per bot, and e.g. "chatgpt,claude;gemini;dalle,stable_diffusion"
+# runs one worker per ";"-separated group. Limits above apply per worker.
+BOT_PROCESS_GROUPS = os.environ.get("BOT_PROCESS_GROUPS", "")
+WORKER_RESTART_MAX_BACKOFF = int(os.environ.get("WORKER_RESTART_MAX_BACKOFF", 60))
+METRICS_REPORT_INTERVAL = int(os.environ.get("METRICS_REPORT_INTERVAL", 60))
+# Agents and their media libraries load on first use; set this to load them in
+# the background right after startup instead.
+WARM_UP_AGENTS = os.environ.get("WARM_UP_AGENTS", "false").lower() == "true"
 
 file_type_to_mime_type = {
     "123": "application/vnd.lotus-1-2-3",
@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timedelta
+from app import db
+from app.config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_INTERVAL,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_BATCH_PAUSE,
+    CONVERSATION_ID_CACHE_TTL,
+    logger,
+)
+from app.database.dao import session_scope
+from app.database.identity_cache import identity_cache
+from app.database.instrumentation import timed_query
+from app.database.models import (
+    Conversation,
+    Message,
+    File,
+    conversation_bot,
+    message_bot,
+    conversation_archive,
+    conversation_bot_archive,
+    message_archive,
+    message_bot_archive,
+    file_archive,
+)
+from app.utils.metrics import metrics
+
+
+def select_idle_conversations(cutoff, limit):
+    recent_message = (
+        db.select(Message.id)
+        .filter(
+            Message.conversation_id == Conversation.id, Message.created_at >= cutoff
+        )
+        .exists()
+    )
+    return (
+        db.select(Conversation.id, Conversation.channel_id, Conversation.thread_ts)
+        .filter(Conversation.created_at < cutoff, ~recent_message)
+        .order_by(Conversation.id)
+        .limit(limit)
+        # Lets concurrent workers archive different batches instead of waiting.
+        .with_for_update(skip_locked=True, of=Conversation)
+    )
+
+
+async def move_rows(session, table, archive, condition):
+    columns = [column.name for column in table.columns]
+    await session.execute(
+        archive.insert().from_select(
+            columns, db.select(*table.columns).filter(condition)
+        )
+    )
+    await session.execute(table.delete().where(condition))
+
+
+@timed_query
+async def archive_idle_conversations(cutoff, limit, session=None):
+    """
+    Moves conversations with no messages since `cutoff` into the archive tables,
+    together with their messages, files and bot links.
+
+    Args:
+    cutoff (datetime): Conversations active at or after this time are kept.
+    limit (int): The most conversations to move in this transaction.
+
+    Returns:
+    int: The number of conversations archived.
+    """
+    async with session_scope(session) as session:
+        conversations = (
+            await session.execute(select_idle_conversations(cutoff, limit))
+        ).all()
+        if not conversations:
+            return 0
+        conversation_ids = [conversation.id for conversation in conversations]
+        message_ids = db.select(Message.id).filter(
+            Message.conversation_id.in_(conversation_ids)
+        )
+        # Children first, while the message ids can still be selected.
+        await move_rows(
+            session, File.__table__, file_archive, File.message_id.in_(message_ids)
+        )
+        await move_rows(
+            session,
+            message_bot,
+            message_bot_archive,
+            message_bot.c.message_id.in_(message_ids),
+        )
+        await move_rows(
+            session,
+            Message.__table__,
+            message_archive,
+            Message.conversation_id.in_(conversation_ids),
+        )
+        await move_rows(
+            session,
+            conversation_bot,
+            conversation_bot_archive,
+            conversation_bot.c.conversation_id.in_(conversation_ids),
+        )
+        await move_rows(
+            session,
+            Conversation.__table__,
+            conversation_archive,
+            Conversation.id.in_(conversation_ids),
+        )
+
+    for conversation in conversations:
+        identity_cache.evict_conversation(
+            conversation.channel_id, conversation.thread_ts
+        )
+    return len(conversations)
+
+
+def archive_cutoff(now=None):
+    # Never archive anything a worker may still have cached the id of.
+    age = max(
+        timedelta(days=ARCHIVE_AFTER_DAYS),
+        timedelta(seconds=CONVERSATION_ID_CACHE_TTL),
+    )
+    return (now or datetime.utcnow()) - age
+
+
+async def archive_old_conversations(now=None):
+    """
+    Archives idle conversations in batches until none are left.
+
+    Returns:
+    int: The number of conversations archived.
+    """
+    cutoff = archive_cutoff(now)
+    total = 0
+    while True:
+        archived = await archive_idle_conversations(cutoff, ARCHIVE_BATCH_SIZE)
+        metrics.counter("archived_conversations_total").inc(archived)
+        total += archived
+        if archived < ARCHIVE_BATCH_SIZE:
+            break
+        # Leave room for reply writes between batches.
+        await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+    if total:
+        logger.info(f"Archived {total} conversations idle since {cutoff}")
+    return total
+
+
+async def run_archival():
+    while True:
+        try:
+            await archive_old_conversations()
+        except Exception as e:
+            logger.error(f"Archival failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
@@ -1,65 +1,422 @@
-from app import async_session, db
-from app.database.models import Conversation, Message, File, Bot
+import app
+from app import db
+from datetime import datetime
+from app.database.identity_cache import identity_cache
+from app.database.instrumentation import timed_query
+from app.database.models import (
+    Conversation,
+    Message,
+    File,
+    Bot,
+    UsageRollup,
+    BOT_SENDER,
+    USER_SENDER,
+    conversation_bot,
+    message_bot,
+)
+from app.database.types import MICROS_PER_SECOND, normalize_ts, ts_to_micros
+from contextlib import asynccontextmanager
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.orm import selectinload
 import logging
-from sqlalchemy.sql import text as sql_text
-from sqlalchemy.orm import object_session
-
-logging.basicConfig()
-logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
-
-
-async def create_bot(name):
-    async with async_session() as session:
-        async with session.begin():
-            # Check if the bot already exists using async session
-            existing_bot = await session.execute(db.select(Bot).filter_by(name=name))
-            existing_bot = existing_bot.scalars().first()
-            if existing_bot is None:
-                # Bot does not exist, create a new one
-                new_bot = Bot(name=name)
-                session.add(new_bot)
-                await session.commit()
-                return new_bot
-            # Return existing bot if already in the database
-            return existing_bot
-
-
-async def create_conversation(bot_name, channel_id, thread_ts):
-    async with async_session() as session:
-        async with session.begin():
-            existing_conversation = await get_conversation(channel_id, thread_ts)
-            bot = await create_bot(bot_name)
-            if not bot:
-                raise ValueError(f"No bot found with name {bot_name}")
-
-            if existing_conversation:
-                # Ensure the bot is associated with the conversation
-                if bot not in existing_conversation.bots:
-                    existing_conversation.bots.append(bot)
-                    await session.commit()
-                    # await session.refresh(existing_conversation)
-                return existing_conversation
-
-            conversation = Conversation(channel_id=channel_id, thread_ts=thread_ts)
-            conversation.bots.append(bot)
-            session.add(conversation)
-            await session.commit()
-            # await session.refresh(conversation)
-            return conversation
-
-
-async def get_conversation(channel_id, thread_ts):
-    async with async_session() as session:
-        async with session.begin():
-            result = await session.scalar(
-                db.select(Conversation)
-                .options(selectinload(Conversation.bots))
-                .filter_by(channel_id=channel_id, thread_ts=thread_ts)
+
+
+@asynccontextmanager
+async def session_scope(session=None):
+    """
+    Yields the caller's session, or a new one wrapped in a transaction.
+
+    DAO functions take an optional `session` so that a caller can run several of
+    them as one unit of work: one pool checkout and one commit. Without it, each
+    call gets its own session and commits when it returns.
+    """
+    if session is not None:
+        yield session
+        return
+    async with app.async_session() as new_session:
+        async with new_session.begin():
+            yield new_session
+
+
+USAGE_COLUMNS = (
+    "message_count",
+    "character_count",
+    "file_count",
+    "pixel_count",
+    "audio_seconds",
+    "pdf_page_count",
+)
+
+# File properties the agents record, by the usage column they add to.
+FILE_USAGE_PROPERTIES = {
+    "pixel_count": "pixel_count",
+    "total_pixel_count": "pixel_count",
+    "audio_duration_seconds": "audio_seconds",
+    "page_count": "pdf_page_count",
+}
+
+
+def usage_day(message_ts, created_at=None):
+    if message_ts:
+        micros = ts_to_micros(message_ts)
+        return datetime.utcfromtimestamp(micros / MICROS_PER_SECOND).date()
+    return (created_at or datetime.utcnow()).date()
+
+
+def usage_key(message_ts, created_at, sender_id, bot_id):
+    if bot_id is None:
+        return None
+    return usage_day(message_ts, created_at), bot_id, sender_id
+
+
+def file_usage(properties):
+    usage = {}
+    for name, column in FILE_USAGE_PROPERTIES.items():
+        value = (properties or {}).get(name)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            usage[column] = usage.get(column, 0) + value
+    return usage
+
+
+def add_to_usage(usage, key, amounts):
+    """Adds `amounts` to the totals for `key` in a {key: {column: amount}} dict."""
+    if key is None:
+        return
+    totals = usage.setdefault(key, {})
+    for column, amount in amounts.items():
+        totals[column] = totals.get(column, 0) + amount
+
+
+def usage_rows(usage):
+    """
+    Turns {(day, bot_id, user_id): {column: amount}} into usage_rollup rows. A
+    None key, for a message not linked to any bot, is skipped.
+    """
+    rows = []
+    for key, amounts in usage.items():
+        if key is None or not any(amounts.values()):
+            continue
+        day, bot_id, user_id = key
+        rows.append(
+            {
+                "day": day,
+                "bot_id": bot_id,
+                "user_id": user_id,
+                **{column: amounts.get(column, 0) for column in USAGE_COLUMNS},
+            }
+        )
+    return rows
+
+
+async def record_usage(session, usage):
+    """Adds usage amounts, keyed as in `usage_rows`, to the rollups in one INSERT."""
+    rows = usage_rows(usage)
+    if rows:
+        await session.execute(insert_adding_usage(session, rows))
+
+
+async def get_usage_key(session, message_id):
+    row = (
+        await session.execute(select_usage_key().filter(Message.id == message_id))
+    ).first()
+    return usage_key(*row) if row else None
+
+
+def select_conversation(channel_id, thread_ts):
+    return (
+        db.select(Conversation)
+        .options(selectinload(Conversation.bots))
+        .filter_by(channel_id=channel_id, thread_ts=thread_ts)
+    )
+
+
+def select_message_by_ts(message_ts):
+    return db.select(Message).filter(Message.message_ts == message_ts)
+
+
+def select_messages_by_thread_ts(thread_ts):
+    return (
+        db.select(Message)
+        .join(Conversation)
+        .filter(Conversation.thread_ts == thread_ts)
+    )
+
+
+def select_thread_messages(channel_id, thread_ts):
+    return (
+        db.select(Message)
+        .join(Conversation)
+        .options(selectinload(Message.files))
+        .filter(
+            Conversation.channel_id == channel_id,
+            Conversation.thread_ts == thread_ts,
+            Message.message_ts.isnot(None),
+        )
+        .order_by(Message.message_ts, Message.id)
+    )
+
+
+def select_stored_messages(conversation_id, bot_id, timestamps):
+    return (
+        db.select(Message.message_ts, Message.id, message_bot.c.bot_id)
+        .outerjoin(
+            message_bot,
+            db.and_(
+                message_bot.c.message_id == Message.id,
+                message_bot.c.bot_id == bot_id,
+            ),
+        )
+        .filter(
+            Message.conversation_id == conversation_id,
+            Message.message_ts.in_(timestamps),
+        )
+    )
+
+
+def select_unfinished_streams(bot_id, started_before):
+    return (
+        db.select(
+            Conversation.channel_id,
+            Conversation.thread_ts,
+            Message.message_ts,
+            Message.text,
+        )
+        .join(Conversation)
+        .join(message_bot, message_bot.c.message_id == Message.id)
+        .filter(
+            Message.is_streaming == db.true(),
+            message_bot.c.bot_id == bot_id,
+            Message.created_at < started_before,
+        )
+    )
+
+
+def select_file(slack_file_id):
+    return db.select(File).filter(File.slack_file_id == slack_file_id)
+
+
+def select_files_by_message_ts(message_ts):
+    return db.select(File).join(Message).filter(Message.message_ts == message_ts)
+
+
+def insert_ignoring_duplicates(session, table):
+    """
+    Returns an INSERT for `table` that leaves rows which already exist untouched.
+
+    On MySQL the duplicate key "update" assigns the primary key to itself, which
+    unlike INSERT IGNORE still raises on every other error.
+    """
+    dialect_name = session.bind.dialect.name
+    if dialect_name == "mysql":
+        statement = mysql.insert(table)
+        key_column = table.primary_key.columns.values()[0]
+        return statement.on_duplicate_key_update({key_column.name: key_column})
+    if dialect_name == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return db.insert(table)
+
+
+def select_usage_key(*columns):
+    first_bot_id = (
+        db.select(db.func.min(message_bot.c.bot_id))
+        .where(message_bot.c.message_id == Message.id)
+        .scalar_subquery()
+    )
+    return db.select(
+        Message.message_ts,
+        Message.created_at,
+        Message.sender_id,
+        first_bot_id,
+        *columns,
+    )
+
+
+def insert_adding_usage(session, rows):
+    """
+    Returns an INSERT of usage rows that adds them to the existing rows with
+    the same (day, bot_id, user_id) instead of failing.
+    """
+    table = UsageRollup.__table__
+    dialect_name = session.bind.dialect.name
+    if dialect_name == "mysql":
+        statement = mysql.insert(table).values(rows)
+        return statement.on_duplicate_key_update(
+            {
+                column: table.c[column] + statement.inserted[column]
+                for column in USAGE_COLUMNS
+            }
+        )
+    if dialect_name == "sqlite":
+        statement = sqlite.insert(table).values(rows)
+        return statement.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key],
+            set_={
+                column: table.c[column] + statement.excluded[column]
+                for column in USAGE_COLUMNS
+            },
+        )
+    return db.insert(table).values(rows)
+
+
+async def select_or_insert_id(session, table, values):
+    """
+    Returns the id of the row of `table` with `values`, inserting it if missing.
+
+    Returns:
+    tuple: (id, found), where found is False if this transaction inserted the
+        row or waited on a concurrent insert of it.
+    """
+    query = db.select(table.c.id).filter_by(**values)
+    row_id = await session.scalar(query)
+    if row_id is not None:
+        return row_id, True
+    await session.execute(insert_ignoring_duplicates(session, table).values(**values))
+    # A locking read sees a row another transaction committed after ours began.
+    return await session.scalar(query.with_for_update(read=True)), False
+
+
+async def get_bot_id(session, name):
+    bot_id = identity_cache.get_bot_id(name)
+    if bot_id is None:
+        bot_id, found = await select_or_insert_id(
+            session, Bot.__table__, {"name": name}
+        )
+        identity_cache.remember_bot(name, bot_id, session=None if found else session)
+    return bot_id
+
+
+async def get_conversation_id(session, bot_id, channel_id, thread_ts):
+    """
+    Returns the id of the thread's conversation, creating it and linking it to the
+    bot as needed. With a warm cache this issues no queries at all.
+    """
+    thread_ts = normalize_ts(thread_ts)
+    conversation_id = identity_cache.get_conversation_id(channel_id, thread_ts)
+    if conversation_id is None:
+        conversation_id, found = await select_or_insert_id(
+            session,
+            Conversation.__table__,
+            {"channel_id": channel_id, "thread_ts": thread_ts},
+        )
+        identity_cache.remember_conversation(
+            channel_id, thread_ts, conversation_id, session=None if found else session
+        )
+    if not identity_cache.is_linked(conversation_id, bot_id):
+        await session.execute(
+            insert_ignoring_duplicates(session, conversation_bot).values(
+                conversation_id=conversation_id, bot_id=bot_id
+            )
+        )
+        identity_cache.remember_link(conversation_id, bot_id, session=session)
+    return conversation_id
+
+
+@timed_query
+async def preload_bot_ids(bot_names):
+    """Creates any missing bot rows and caches the ids of all of them."""
+    async with session_scope() as session:
+        query = db.select(Bot.name, Bot.id).filter(Bot.name.in_(bot_names))
+        bot_ids = dict((await session.execute(query)).all())
+        missing = [{"name": name} for name in bot_names if name not in bot_ids]
+        if missing:
+            await session.execute(
+                insert_ignoring_duplicates(session, Bot.__table__).values(missing)
             )
-            return result
+            bot_ids = dict((await session.execute(query)).all())
+    for name, bot_id in bot_ids.items():
+        identity_cache.remember_bot(name, bot_id)
+    return bot_ids
+
+
+@timed_query
+async def record_bot_user_ids(bot_user_ids, session=None):
+    """Stores the Slack user id of each bot, given as {bot_name: user_id}."""
+    async with session_scope(session) as session:
+        for name, slack_user_id in bot_user_ids.items():
+            await session.execute(
+                db.update(Bot)
+                .filter(Bot.name == name)
+                .values(slack_user_id=slack_user_id)
+            )
+
 
+@timed_query
+async def fill_missing_sender_types(bot_names, batch_size=1000):
+    """
+    Sets sender_type on messages stored without one, a batch per transaction.
 
+    Messages sent by one of the bots get BOT_SENDER. The rest get USER_SENDER,
+    but only once every bot in `bot_names` has its Slack user id recorded;
+    until then they are left for a later run.
+
+    Returns:
+    int: The number of messages updated.
+    """
+    async with session_scope() as session:
+        result = await session.execute(
+            db.select(Bot.name, Bot.slack_user_id).filter(
+                Bot.name.in_(bot_names), Bot.slack_user_id.isnot(None)
+            )
+        )
+        bot_user_ids = dict(result.all())
+    all_bots_known = set(bot_names) <= set(bot_user_ids)
+    bot_sender_ids = set(bot_user_ids.values())
+    if not bot_sender_ids:
+        return 0
+
+    updated = 0
+    while True:
+        async with session_scope() as session:
+            query = db.select(Message.id, Message.sender_id).filter(
+                Message.sender_type.is_(None)
+            )
+            if not all_bots_known:
+                query = query.filter(Message.sender_id.in_(bot_sender_ids))
+            rows = (
+                await session.execute(query.order_by(Message.id).limit(batch_size))
+            ).all()
+            ids_by_type = {BOT_SENDER: [], USER_SENDER: []}
+            for message_id, sender_id in rows:
+                sender_type = BOT_SENDER if sender_id in bot_sender_ids else USER_SENDER
+                ids_by_type[sender_type].append(message_id)
+            for sender_type, message_ids in ids_by_type.items():
+                if message_ids:
+                    await session.execute(
+                        db.update(Message)
+                        .filter(Message.id.in_(message_ids))
+                        .values(sender_type=sender_type)
+                        .execution_options(synchronize_session=False)
+                    )
+        updated += len(rows)
+        if len(rows) < batch_size:
+            return updated
+
+
+@timed_query
+async def create_bot(name, session=None):
+    async with session_scope(session) as session:
+        return await session.get(Bot, await get_bot_id(session, name))
+
+
+@timed_query
+async def create_conversation(bot_name, channel_id, thread_ts, session=None):
+    async with session_scope(session) as session:
+        bot_id = await get_bot_id(session, bot_name)
+        conversation_id = await get_conversation_id(
+            session, bot_id, channel_id, thread_ts
+        )
+        return await session.get(
+            Conversation, conversation_id, options=[selectinload(Conversation.bots)]
+        )
+
+
+@timed_query
+async def get_conversation(channel_id, thread_ts, session=None):
+    async with session_scope(session) as session:
+        return await session.scalar(select_conversation(channel_id, thread_ts))
+
+
+@timed_query
 async def create_message(
     channel_id,
     thread_ts,
@@ -69,126 +426,318 @@ async def create_message(
     responding_to_ts,
     message_type,
     text,
+    is_streaming=False,
+    sender_type=None,
+    files=None,
+    session=None,
 ):
-    async with async_session() as session:
-        async with session.begin():
-            existing_message = (
-                await get_message_by_ts(message_ts) if message_ts else None
-            )
-            bot = await create_bot(bot_name)
-            if not bot:
-                raise ValueError(f"No bot found with name {bot_name}")
-
-            if existing_message:
-                # Ensure the bot is associated with the message
-                if bot not in existing_message.bots:
-                    existing_message.bots.append(bot)
-                    await session.commit()
-                    # await session.refresh(existing_message)
-                return existing_message
-
-            conversation = await create_conversation(bot_name, channel_id, thread_ts)
-
+    async with session_scope(session) as session:
+        bot_id = await get_bot_id(session, bot_name)
+        message = (
+            await session.scalar(select_message_by_ts(message_ts))
+            if message_ts
+            else None
+        )
+        if message is None:
             message = Message(
-                conversation_id=conversation.id,
+                conversation_id=await get_conversation_id(
+                    session, bot_id, channel_id, thread_ts
+                ),
                 sender_id=sender_id,
+                sender_type=sender_type,
                 message_ts=message_ts,
                 responding_to_ts=responding_to_ts,
                 message_type=message_type,
                 text=text,
+                is_streaming=is_streaming,
             )
-            message.bots.append(bot)
             session.add(message)
-            await session.commit()
-            # await session.refresh(message)
-            return message
-
-
-# async def update_message_text(message_ts, new_text):
-#     async with async_session() as session:
-#         async with session.begin():
-#             message = await get_message_by_ts(message_ts)
-#             if message:
-#                 logging.info(
-#                     f"Updating message text for message_ts={message_ts} to '{new_text}'"
-#                 )
-#                 logging.info(f"Old message text: {message.text}")
-#                 # Execute a manual SQL UPDATE query using text() for SQL expression
-#                 await session.execute(
-#                     sql_text(
-#                         "UPDATE message SET text = :text WHERE message_ts = :message_ts"
-#                     ),
-#                     {"text": new_text, "message_ts": message_ts},
-#                 )
-#                 logging.info(f"New message text: {new_text}")
-#                 await session.commit()
-#                 # Refresh the message instance to reflect updated data
-#                 # await session.refresh(message)
-#                 return message
-#             else:
-#                 logging.info(f"No message found with message_ts={message_ts}")
-#             return None
-
-
-async def update_message_text(message_ts, new_text):
-    async with async_session() as session:
-        async with session.begin():
-            message = await get_message_by_ts(message_ts)
-            if message:
-                if object_session(message) is not session:
-                    session.add(message)  # Re-attach the object to the session
-
-                # Update the message text
-                message.text = new_text
-
-                # Commit the transaction
-                await session.commit()
-                logging.info(
-                    f"Updated message text committed to the database: {new_text}"
+            await session.flush()
+            key = usage_key(message_ts, message.created_at, sender_id, bot_id)
+            usage = {key: {"message_count": 1, "character_count": len(text or "")}}
+            file_rows = [
+                {**file, "message_id": message.id}
+                for file in files or []
+                if storable_file(file)
+            ]
+            if file_rows:
+                await session.execute(
+                    insert_ignoring_duplicates(session, File.__table__).values(
+                        file_rows
+                    )
+                )
+            for file in file_rows:
+                add_to_usage(
+                    usage, key, {"file_count": 1, **file_usage(file.get("properties"))}
+                )
+        else:
+            usage = {}
+        # Ensure the bot is associated with the message
+        await session.execute(
+            insert_ignoring_duplicates(session, message_bot).values(
+                message_id=message.id, bot_id=bot_id
+            )
+        )
+        await record_usage(session, usage)
+        return message
+
+
+async def get_stored_messages(session, conversation_id, bot_id, timestamps):
+    """
+    Returns {message_ts: (message_id, linked)} for the given timestamps of a
+    conversation, where `linked` says whether the message is already linked to
+    the bot.
+    """
+    result = await session.execute(
+        select_stored_messages(conversation_id, bot_id, timestamps)
+    )
+    return {
+        message_ts: (message_id, linked_bot_id is not None)
+        for message_ts, message_id, linked_bot_id in result.all()
+    }
+
+
+def storable_file(file):
+    """
+    Whether a file row fits the File table. Tombstones of deleted Slack files
+    have no type, and one bad row would fail the whole multi-row INSERT.
+    """
+    for column in ("file_type", "mime_category"):
+        value = file.get(column)
+        if not value or len(value) > File.__table__.c[column].type.length:
+            logging.warning(
+                f"Not storing file {file.get('slack_file_id')}: {column}={value!r}"
+            )
+            return False
+    return True
+
+
+@timed_query
+async def save_thread_messages(bot_name, channel_id, thread_ts, messages, session=None):
+    """
+    Stores the messages of a thread that are not in the database yet.
+
+    The thread is diffed against the stored messages in one query, then new
+    messages, their files and missing bot links are written with one multi-row
+    INSERT each.
+
+    Args:
+    messages (list): Dicts with sender_id, sender_type, message_ts, text and
+        files, where files is a list of dicts with the File columns to store.
+
+    Returns:
+    int: The number of messages inserted.
+    """
+    async with session_scope(session) as session:
+        bot_id = await get_bot_id(session, bot_name)
+        conversation_id = await get_conversation_id(
+            session, bot_id, channel_id, thread_ts
+        )
+        messages_by_ts = {}
+        for message in messages:
+            if message["message_ts"]:
+                messages_by_ts.setdefault(normalize_ts(message["message_ts"]), message)
+        if not messages_by_ts:
+            return 0
+
+        stored = await get_stored_messages(
+            session, conversation_id, bot_id, list(messages_by_ts)
+        )
+        new_timestamps = [ts for ts in messages_by_ts if ts not in stored]
+        if new_timestamps:
+            await session.execute(
+                insert_ignoring_duplicates(session, Message.__table__).values(
+                    [
+                        {
+                            "conversation_id": conversation_id,
+                            "sender_id": messages_by_ts[ts]["sender_id"],
+                            "sender_type": messages_by_ts[ts].get("sender_type"),
+                            "message_ts": ts,
+                            "text": messages_by_ts[ts]["text"],
+                        }
+                        for ts in new_timestamps
+                    ]
+                )
+            )
+            stored.update(
+                await get_stored_messages(
+                    session, conversation_id, bot_id, new_timestamps
                 )
+            )
 
-                return message
-            else:
-                logging.info(f"No message found with message_ts={message_ts}")
-            return None
-
-
-async def append_message_text(message_ts, additional_text):
-    async with async_session() as session:
-        async with session.begin():
-            message = await get_message_by_ts(message_ts)
-            if message:
-                message.text += additional_text
-                await session.commit()
-                # await session.refresh(message)
-                return message
-            return None
-
-
-async def get_messages_by_thread_ts(thread_ts):
-    async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(
-                db.select(Message)
-                .join(Conversation)
-                .filter(Conversation.thread_ts == thread_ts)
+        link_rows = [
+            {"message_id": message_id, "bot_id": bot_id}
+            for message_id, linked in stored.values()
+            if not linked
+        ]
+        if link_rows:
+            await session.execute(
+                insert_ignoring_duplicates(session, message_bot).values(link_rows)
             )
-            return result.scalars().all()
 
+        files_by_ts = {
+            ts: [file for file in messages_by_ts[ts]["files"] if storable_file(file)]
+            for ts in new_timestamps
+        }
+        file_rows = [
+            {**file, "message_id": stored[ts][0]}
+            for ts in new_timestamps
+            if ts in stored
+            for file in files_by_ts[ts]
+        ]
+        if file_rows:
+            await session.execute(
+                insert_ignoring_duplicates(session, File.__table__).values(file_rows)
+            )
 
-async def get_message_by_ts(message_ts):
-    async with async_session() as session:
-        async with session.begin():
-            result = await session.execute(
-                db.select(Message)
-                .options(selectinload(Message.bots))
+        usage = {}
+        for ts in new_timestamps:
+            message = messages_by_ts[ts]
+            key = usage_key(ts, None, message["sender_id"], bot_id)
+            add_to_usage(
+                usage,
+                key,
+                {"message_count": 1, "character_count": len(message["text"] or "")},
+            )
+            for file in files_by_ts[ts]:
+                add_to_usage(
+                    usage, key, {"file_count": 1, **file_usage(file.get("properties"))}
+                )
+        await record_usage(session, usage)
+        return len(new_timestamps)
+
+
+@timed_query
+async def update_message_text(message_ts, new_text, is_streaming=None, session=None):
+    """
+    Overwrites a message's text with one UPDATE.
+
+    Args:
+    is_streaming (bool): The new streaming flag, or None to leave it as is.
+
+    Returns:
+    bool: Whether a message with `message_ts` was found.
+    """
+    values = {"text": new_text, "text_updated_at": datetime.utcnow()}
+    if is_streaming is not None:
+        values["is_streaming"] = is_streaming
+    async with session_scope(session) as session:
+        # Locks the row so that concurrent edits add their length changes in turn.
+        row = (
+            await session.execute(
+                select_usage_key(Message.id, Message.text)
                 .filter(Message.message_ts == message_ts)
+                .with_for_update(of=Message)
+            )
+        ).first()
+        if row is None:
+            logging.info(f"No message found with message_ts={message_ts}")
+            return False
+        await session.execute(
+            db.update(Message)
+            .filter(Message.id == row.id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        character_change = len(new_text or "") - len(row.text or "")
+        await record_usage(
+            session,
+            {usage_key(*row[:4]): {"character_count": character_change}},
+        )
+        return True
+
+
+@timed_query
+async def delete_message(message_ts, session=None):
+    """
+    Deletes a message together with its files and bot links. Usage rollups keep
+    counting it.
+
+    Returns:
+    bool: Whether a message with `message_ts` was found.
+    """
+    async with session_scope(session) as session:
+        message_id = await session.scalar(
+            db.select(Message.id).filter(Message.message_ts == message_ts)
+        )
+        if message_id is None:
+            logging.info(f"No message found with message_ts={message_ts}")
+            return False
+        await session.execute(
+            db.delete(File)
+            .filter(File.message_id == message_id)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            message_bot.delete().where(message_bot.c.message_id == message_id)
+        )
+        await session.execute(
+            db.delete(Message)
+            .filter(Message.id == message_id)
+            .execution_options(synchronize_session=False)
+        )
+        return True
+
+
+@timed_query
+async def get_unfinished_streams(bot_name, started_before, session=None):
+    """
+    Returns (channel_id, thread_ts, message_ts, text) rows for the bot's replies
+    that were still streaming when a process created before `started_before`
+    stopped.
+    """
+    async with session_scope(session) as session:
+        bot_id = await get_bot_id(session, bot_name)
+        result = await session.execute(
+            select_unfinished_streams(bot_id, started_before)
+        )
+        return result.all()
+
+
+@timed_query
+async def append_message_text(message_ts, additional_text, session=None):
+    async with session_scope(session) as session:
+        message = await session.scalar(select_message_by_ts(message_ts))
+        if message:
+            message.text += additional_text
+            await session.flush()
+            await record_usage(
+                session,
+                {
+                    await get_usage_key(session, message.id): {
+                        "character_count": len(additional_text)
+                    }
+                },
             )
-            message = result.scalars().first()
-            logging.info(f"Retrieved message by timestamp {message_ts}: {message}")
             return message
+        return None
+
+
+@timed_query
+async def get_messages_by_thread_ts(thread_ts, session=None):
+    async with session_scope(session) as session:
+        result = await session.execute(select_messages_by_thread_ts(thread_ts))
+        return result.scalars().all()
+
+
+@timed_query
+async def get_thread_messages(channel_id, thread_ts, session=None):
+    async with session_scope(session) as session:
+        result = await session.execute(select_thread_messages(channel_id, thread_ts))
+        return result.scalars().all()
 
 
+@timed_query
+async def get_message_by_ts(message_ts, session=None):
+    async with session_scope(session) as session:
+        message = await session.scalar(
+            select_message_by_ts(message_ts).options(selectinload(Message.bots))
+        )
+        logging.info(f"Retrieved message by timestamp {message_ts}: {message}")
+        return message
+
+
+@timed_query
 async def create_file(
     message_ts,
     file_type,
@@ -197,73 +746,120 @@ async def create_file(
     slack_file_id=None,
     mime_category=None,
     message_id=None,
+    session=None,
 ):
-    async with async_session() as session:
-        async with session.begin():
-            existing_file = await session.execute(
-                db.select(File).filter(File.slack_file_id == slack_file_id)
-            )
-            existing_file = existing_file.scalars().first()
-
+    # Files without an id share NULL, which the unique key on slack_file_id allows.
+    slack_file_id = slack_file_id or None
+    async with session_scope(session) as session:
+        if slack_file_id:
+            existing_file = await session.scalar(select_file(slack_file_id))
             if existing_file:
                 return existing_file
 
-            message = await get_message_by_ts(message_ts) if message_ts else None
-
-            # if not message:
-            #     raise ValueError("No message found with the provided timestamp.")
-
-            file = File(
-                message_id=message.id if message else message_id,
-                file_type=file_type,
-                mime_category=mime_category,
-                size=size,
-                slack_file_id=slack_file_id,
-                properties=properties,
+        if message_id is None and message_ts:
+            message = await session.scalar(select_message_by_ts(message_ts))
+            message_id = message.id if message else None
+
+        file = File(
+            message_id=message_id,
+            file_type=file_type,
+            mime_category=mime_category,
+            size=size,
+            slack_file_id=slack_file_id,
+            properties=properties,
+        )
+        session.add(file)
+        await session.flush()
+        if message_id is not None:
+            await record_usage(
+                session,
+                {
+                    await get_usage_key(session, message_id): {
+                        "file_count": 1,
+                        **file_usage(properties),
+                    }
+                },
             )
-            session.add(file)
-            await session.commit()
-            # await session.refresh(file)
-            return file
-
+        return file
+
+
+@timed_query
+async def update_file(slack_file_id, properties=None, session=None, **kwargs):
+    async with session_scope(session) as session:
+        file = await session.scalar(select_file(slack_file_id))
+        if not file:
+            raise ValueError("No file found with the provided Slack file ID.")
+
+        # Update standard fields if provided in kwargs
+        for field, value in kwargs.items():
+            if hasattr(file, field) and value is not None:
+                setattr(file, field, value)
+
+        # Update JSON properties
+        if properties is not None:
+            old_usage = file_usage(file.properties)
+            # Assign a new dict: in-place changes to a JSON column aren't tracked.
+            file.properties = {**(file.properties or {}), **properties}
+            new_usage = file_usage(file.properties)
+            usage_change = {
+                column: new_usage.get(column, 0) - old_usage.get(column, 0)
+                for column in set(old_usage) | set(new_usage)
+            }
+            if any(usage_change.values()):
+                await record_usage(
+                    session,
+                    {await get_usage_key(session, file.message_id): usage_change},
+                )
 
-async def update_file(slack_file_id, properties=None, **kwargs):
-    async with async_session() as session:
-        async with session.begin():
-            file = await session.execute(
-                db.select(File).filter(File.slack_file_id == slack_file_id)
-            )
-            file = file.scalars().first()
-            if not file:
-                raise ValueError("No file found with the provided Slack file ID.")
-
-            if object_session(file) is not session:
-                session.add(file)  # Re-attach the object to the session
-
-            # Update standard fields if provided in kwargs
-            for field, value in kwargs.items():
-                if hasattr(file, field) and value is not None:
-                    setattr(file, field, value)
-
-            # Update JSON properties
-            if properties is not None:
-                if file.properties is not None:
-                    file.properties.update(properties)
-                else:
-                    file.properties = properties
-
-            await session.commit()
-            # await session.refresh(file)
-            return file
-
-
-async def get_files_by_message_ts(message_ts):
-    async with async_session() as session:
-        async with session.begin():
-            message = await get_message_by_ts(message_ts)
-            if not message:
-                return []
-            result = await session.execute(
-                db.select(File).filter_by(message_id=message.id)
-            )
-            return result.scalars().all()
+        await session.flush()
+        return file
+
+
+@timed_query
+async def get_file_artifact(slack_file_id, key, session=None):
+    """
+    Returns a derived artifact stored in a file's properties, or None.
+
+    Args:
+    slack_file_id (str): The Slack file the artifact was derived from.
+    key (str): The artifact key, which covers the transform and its parameters.
+    """
+    async with session_scope(session) as session:
+        properties = await session.scalar(
+            db.select(File.properties).filter(File.slack_file_id == slack_file_id)
+        )
+        artifact = ((properties or {}).get("artifacts") or {}).get(key)
+        return artifact["value"] if artifact else None
+
+
+@timed_query
+async def save_file_artifact(slack_file_id, key, transform, value, session=None):
+    """
+    Stores a small derived artifact in a file's properties, replacing any other
+    artifact of the same transform so each file keeps one per transform.
+
+    Returns:
+    bool: False if there is no row for the file yet.
+    """
+    async with session_scope(session) as session:
+        file = await session.scalar(select_file(slack_file_id).with_for_update())
+        if not file:
+            return False
+        properties = file.properties or {}
+        artifacts = {
+            other_key: artifact
+            for other_key, artifact in (properties.get("artifacts") or {}).items()
+            if artifact.get("transform") != transform
+        }
+        artifacts[key] = {"transform": transform, "value": value}
+        # Assign a new dict: in-place changes to a JSON column aren't tracked.
+        file.properties = {**properties, "artifacts": artifacts}
+        await session.flush()
+        return True
+
+
+@timed_query
+async def get_files_by_message_ts(message_ts, session=None):
+    async with session_scope(session) as session:
+        result = await session.execute(select_files_by_message_ts(message_ts))
+        return result.scalars().all()
@@ -0,0 +1,92 @@
+from app.config import CONVERSATION_ID_CACHE_SIZE, CONVERSATION_ID_CACHE_TTL
+from app.utils.cache import LRUCache
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_PENDING_KEY = "identity_cache_pending"
+
+
+class IdentityCache:
+    """
+    Process-local map from bot names and (channel_id, thread_ts) to row ids.
+
+    Bots are few and never change, so their ids are held in a dict preloaded at
+    startup. Conversation ids and conversation/bot links are held in LRUs. Ids
+    found by a SELECT are cached right away; ids of rows a transaction inserted
+    are only published when it commits, so a rollback can't leave ids of rows
+    that don't exist behind. Conversation entries expire after
+    `conversation_ttl` seconds, before archival can move their rows away.
+    """
+
+    def __init__(self, conversation_cache_size, conversation_ttl=None):
+        self.bot_ids = {}
+        self.conversation_ids = LRUCache(
+            maxsize=conversation_cache_size, ttl=conversation_ttl
+        )
+        self.conversation_links = LRUCache(
+            maxsize=conversation_cache_size, ttl=conversation_ttl
+        )
+
+    def get_bot_id(self, name):
+        return self.bot_ids.get(name)
+
+    def get_conversation_id(self, channel_id, thread_ts):
+        return self.conversation_ids.get((channel_id, thread_ts))
+
+    def is_linked(self, conversation_id, bot_id):
+        return (conversation_id, bot_id) in self.conversation_links
+
+    def remember_bot(self, name, bot_id, session=None):
+        self._remember(session, self.bot_ids, name, bot_id)
+
+    def remember_conversation(
+        self, channel_id, thread_ts, conversation_id, session=None
+    ):
+        self._remember(
+            session, self.conversation_ids, (channel_id, thread_ts), conversation_id
+        )
+
+    def remember_link(self, conversation_id, bot_id, session=None):
+        self._remember(
+            session, self.conversation_links, (conversation_id, bot_id), True
+        )
+
+    def evict_conversation(self, channel_id, thread_ts):
+        self.conversation_ids.pop((channel_id, thread_ts))
+
+    def clear(self):
+        self.bot_ids.clear()
+        self.conversation_ids.clear()
+        self.conversation_links.clear()
+
+    def _remember(self, session, store, key, value):
+        """
+        Caches `value` now, or when `session` commits if it is given.
+        """
+        if session is None:
+            _store(store, key, value)
+        else:
+            session.sync_session.info.setdefault(_PENDING_KEY, []).append(
+                (store, key, value)
+            )
+
+
+def _store(store, key, value):
+    if isinstance(store, dict):
+        store[key] = value
+    else:
+        store.set(key, value)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    for store, key, value in session.info.pop(_PENDING_KEY, []):
+        _store(store, key, value)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+identity_cache = IdentityCache(CONVERSATION_ID_CACHE_SIZE, CONVERSATION_ID_CACHE_TTL)
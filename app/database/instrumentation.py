@@ -0,0 +1,85 @@
+import functools
+import random
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config import SLOW_QUERY_SECONDS, SLOW_QUERY_LOG_SAMPLE_RATE, logger
+from app.utils.metrics import metrics
+
+SLOW_QUERY_LOG_MAX_CHARS = 1000
+
+current_query_function = ContextVar("current_query_function", default=None)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    The async engine's default pool, timing how long each checkout waits.
+
+    The wait covers queueing for a free connection and opening a new one, but
+    not the pre-ping that follows.
+    """
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.histogram("db_pool_checkout_wait_seconds").observe(
+                time.monotonic() - start
+            )
+
+
+def instrument_engine(engine):
+    """
+    Tracks checked-out connections and slow statements for an engine.
+
+    Args:
+    engine (Engine): A sync engine, e.g. `async_engine.sync_engine`.
+    """
+    event.listen(engine.pool, "checkout", lambda *args: active_connections().inc())
+    event.listen(engine.pool, "checkin", lambda *args: active_connections().dec())
+    event.listen(engine, "before_cursor_execute", start_statement_timer)
+    event.listen(engine, "after_cursor_execute", log_slow_statement)
+
+
+def active_connections():
+    return metrics.gauge("db_pool_active_connections")
+
+
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["statement_start"] = time.monotonic()
+
+
+def log_slow_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.monotonic() - conn.info.pop("statement_start", time.monotonic())
+    if elapsed < SLOW_QUERY_SECONDS:
+        return
+    function_name = current_query_function.get() or "unknown"
+    metrics.counter("db_slow_queries_total", function=function_name).inc()
+    if random.random() < SLOW_QUERY_LOG_SAMPLE_RATE:
+        logger.warning(
+            f"Slow query in {function_name} ({elapsed:.3f}s): {statement[:SLOW_QUERY_LOG_MAX_CHARS]}"
+        )
+
+
+def timed_query(function):
+    """
+    Records a DAO coroutine's latency in `db_query_seconds{function=...}`.
+
+    Statements it runs are attributed to it in the slow-query log.
+    """
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        token = current_query_function.set(function.__name__)
+        start = time.monotonic()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            metrics.histogram("db_query_seconds", function=function.__name__).observe(
+                time.monotonic() - start
+            )
+            current_query_function.reset(token)
+
+    return wrapper
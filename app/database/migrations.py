@@ -0,0 +1,297 @@
+from app import db
+from app.config import logger
+from datetime import datetime
+from sqlalchemy import inspect
+from sqlalchemy.types import Numeric
+
+schema_version = db.Table(
+    "schema_version",
+    db.Column("version", db.Integer, primary_key=True),
+    db.Column("applied_at", db.DateTime, default=datetime.utcnow),
+)
+
+# Seconds-based ts values are around 1.7e9; microsecond ones are around 1.7e15.
+# Only scaling values below this bound keeps a re-run from scaling twice.
+MICROSECOND_THRESHOLD = 10**11
+
+DUPLICATE_MESSAGES_SQL = """
+CREATE TEMPORARY TABLE message_duplicate AS
+SELECT message.id AS id, kept.keep_id AS keep_id
+FROM message
+JOIN (
+    SELECT conversation_id, message_ts, MIN(id) AS keep_id
+    FROM message
+    WHERE message_ts IS NOT NULL
+    GROUP BY conversation_id, message_ts
+    HAVING COUNT(*) > 1
+) AS kept
+    ON message.conversation_id = kept.conversation_id
+    AND message.message_ts = kept.message_ts
+WHERE message.id <> kept.keep_id
+"""
+
+
+def scale_ts_columns(connection, table, columns):
+    """Converts DECIMAL seconds columns to BIGINT microseconds in place."""
+    widen = ", ".join(
+        f"MODIFY {column} DECIMAL(22, 6) {nullability}"
+        for column, nullability in columns
+    )
+    connection.exec_driver_sql(f"ALTER TABLE {table} {widen}")
+    for column, _ in columns:
+        connection.exec_driver_sql(
+            f"UPDATE {table} SET {column} = {column} * 1000000 "
+            f"WHERE {column} < {MICROSECOND_THRESHOLD}"
+        )
+    narrow = ", ".join(
+        f"MODIFY {column} BIGINT {nullability}" for column, nullability in columns
+    )
+    connection.exec_driver_sql(f"ALTER TABLE {table} {narrow}")
+
+
+def dedupe_messages(connection):
+    """
+    Folds messages stored twice for the same (conversation_id, message_ts) into
+    the oldest row, moving their files and bot links over first.
+    """
+    connection.exec_driver_sql("DROP TEMPORARY TABLE IF EXISTS message_duplicate")
+    connection.exec_driver_sql(DUPLICATE_MESSAGES_SQL)
+    connection.exec_driver_sql(
+        "UPDATE file JOIN message_duplicate ON file.message_id = message_duplicate.id "
+        "SET file.message_id = message_duplicate.keep_id"
+    )
+    connection.exec_driver_sql(
+        "INSERT IGNORE INTO message_bot (message_id, bot_id) "
+        "SELECT message_duplicate.keep_id, message_bot.bot_id FROM message_bot "
+        "JOIN message_duplicate ON message_bot.message_id = message_duplicate.id"
+    )
+    connection.exec_driver_sql(
+        "DELETE message_bot FROM message_bot "
+        "JOIN message_duplicate ON message_bot.message_id = message_duplicate.id"
+    )
+    connection.exec_driver_sql(
+        "DELETE message FROM message "
+        "JOIN message_duplicate ON message.id = message_duplicate.id"
+    )
+    connection.exec_driver_sql("DROP TEMPORARY TABLE message_duplicate")
+
+
+def dedupe_files(connection):
+    connection.exec_driver_sql(
+        "UPDATE file SET slack_file_id = NULL WHERE slack_file_id = ''"
+    )
+    connection.exec_driver_sql(
+        "DELETE dup FROM file AS dup JOIN file AS kept "
+        "ON dup.slack_file_id = kept.slack_file_id AND dup.id > kept.id"
+    )
+
+
+def add_index(connection, table, name, columns, unique=False):
+    inspector = inspect(connection)
+    existing = {index["name"] for index in inspector.get_indexes(table)}
+    existing |= {
+        constraint["name"] for constraint in inspector.get_unique_constraints(table)
+    }
+    if name not in existing:
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        connection.exec_driver_sql(
+            f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"
+        )
+
+
+def migrate_integer_timestamps(connection):
+    if connection.dialect.name != "mysql":
+        raise NotImplementedError(
+            f"Migration 1 is only written for MySQL, not {connection.dialect.name}"
+        )
+    scale_ts_columns(connection, "conversation", [("thread_ts", "NOT NULL")])
+    scale_ts_columns(
+        connection, "message", [("message_ts", "NULL"), ("responding_to_ts", "NULL")]
+    )
+    dedupe_messages(connection)
+    dedupe_files(connection)
+    add_index(connection, "conversation", "ix_conversation_thread_ts", ["thread_ts"])
+    add_index(connection, "message", "ix_message_message_ts", ["message_ts"])
+    add_index(
+        connection,
+        "message",
+        "unique_conversation_message",
+        ["conversation_id", "message_ts"],
+        unique=True,
+    )
+    add_index(
+        connection, "file", "unique_slack_file_id", ["slack_file_id"], unique=True
+    )
+
+
+def add_streaming_flag(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("message")}
+    if "is_streaming" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE message ADD COLUMN is_streaming BOOL NOT NULL DEFAULT FALSE"
+        )
+    add_index(connection, "message", "ix_message_is_streaming", ["is_streaming"])
+
+
+def add_archival_index(connection):
+    # Archival looks for conversations without recent messages.
+    add_index(
+        connection,
+        "message",
+        "ix_message_conversation_created",
+        ["conversation_id", "created_at"],
+    )
+
+
+def backfill_usage_rollups(connection):
+    from app.database.dao import (
+        add_to_usage,
+        file_usage,
+        select_usage_key,
+        usage_key,
+        usage_rows,
+    )
+    from app.database.models import File, Message, UsageRollup
+
+    usage = {}
+    messages = connection.execution_options(stream_results=True).execute(
+        select_usage_key(Message.text)
+    )
+    for *key, text in messages:
+        add_to_usage(
+            usage,
+            usage_key(*key),
+            {"message_count": 1, "character_count": len(text or "")},
+        )
+    files = connection.execution_options(stream_results=True).execute(
+        select_usage_key(File.properties).join(File, File.message_id == Message.id)
+    )
+    for *key, properties in files:
+        add_to_usage(
+            usage, usage_key(*key), {"file_count": 1, **file_usage(properties)}
+        )
+
+    connection.execute(db.delete(UsageRollup))
+    rows = usage_rows(usage)
+    for start in range(0, len(rows), 1000):
+        connection.execute(db.insert(UsageRollup), rows[start : start + 1000])
+
+
+def add_sender_columns(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("bot")}
+    if "slack_user_id" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE bot ADD COLUMN slack_user_id VARCHAR(100) NULL"
+        )
+    add_index(connection, "bot", "ix_bot_slack_user_id", ["slack_user_id"])
+    # Existing rows get their sender_type at startup, once the bot ids are known.
+    add_index(connection, "message", "ix_message_sender_type", ["sender_type"])
+
+
+def rebuild_sqlite_table(connection, table):
+    """
+    Recreates `table` from its model and copies its rows over, for changes
+    SQLite's ALTER TABLE cannot make, such as a new primary key.
+    """
+    old_name = f"{table.name}_old"
+    connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {old_name}")
+    # Index names are global in SQLite, and the new table reuses them.
+    for index in inspect(connection).get_indexes(old_name):
+        connection.exec_driver_sql(f"DROP INDEX {index['name']}")
+    table.create(connection)
+    old_columns = {
+        column["name"] for column in inspect(connection).get_columns(old_name)
+    }
+    columns = ", ".join(
+        column.name for column in table.columns if column.name in old_columns
+    )
+    connection.exec_driver_sql(
+        f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old_name}"
+    )
+    connection.exec_driver_sql(f"DROP TABLE {old_name}")
+
+
+def add_archive_keys(connection):
+    from app.database.models import archive_tables
+
+    for table in archive_tables:
+        columns = {
+            column["name"] for column in inspect(connection).get_columns(table.name)
+        }
+        if "archive_id" in columns:
+            continue
+        # The original key stays as a plain indexed column, so ids the hot
+        # table reuses can be archived again.
+        if connection.dialect.name == "sqlite":
+            rebuild_sqlite_table(connection, table)
+            continue
+        if connection.dialect.name != "mysql":
+            raise NotImplementedError(
+                f"Migration 6 is only written for MySQL and SQLite, not {connection.dialect.name}"
+            )
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table.name} DROP PRIMARY KEY, "
+            "ADD COLUMN archive_id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY FIRST"
+        )
+        for index in table.indexes:
+            add_index(
+                connection,
+                table.name,
+                index.name,
+                [column.name for column in index.columns],
+            )
+
+
+# (version, description, function taking a sync connection), in order.
+MIGRATIONS = [
+    (
+        1,
+        "Store ts columns as integer microseconds and index lookup columns",
+        migrate_integer_timestamps,
+    ),
+    (2, "Flag messages that are still streaming", add_streaming_flag),
+    (3, "Index messages by conversation and age for archival", add_archival_index),
+    (
+        4,
+        "Fill usage rollups from the stored messages and files",
+        backfill_usage_rollups,
+    ),
+    (5, "Index sender types and record bot user ids", add_sender_columns),
+    (6, "Give archive tables their own keys", add_archive_keys),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def detect_schema_version(connection):
+    """
+    Returns the version of a schema that has no schema_version rows yet: 0 for a
+    database created before versioning, or the latest for one create_all just
+    built.
+    """
+    columns = {
+        column["name"]: column for column in inspect(connection).get_columns("message")
+    }
+    if isinstance(columns["message_ts"]["type"], Numeric):
+        return 0
+    return LATEST_VERSION
+
+
+def run_migrations(connection):
+    """
+    Brings the schema up to LATEST_VERSION. Runs with a sync connection, e.g.
+    through `AsyncConnection.run_sync`, after `create_all`.
+    """
+    schema_version.create(connection, checkfirst=True)
+    current = connection.scalar(db.select(db.func.max(schema_version.c.version)))
+    if current is None:
+        current = detect_schema_version(connection)
+        if current == LATEST_VERSION:
+            connection.execute(schema_version.insert().values(version=current))
+            return
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        migrate(connection)
+        connection.execute(schema_version.insert().values(version=version))
@@ -1,11 +1,18 @@
 from app import db
+from app.database.types import SlackTimestamp
 from datetime import datetime
 from sqlalchemy.ext.hybrid import hybrid_property
 
+# Message.sender_type values.
+USER_SENDER = "user"
+BOT_SENDER = "bot"
+
 
 class Bot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
+    # Recorded at startup, so SQL can tell which bot sent a message.
+    slack_user_id = db.Column(db.String(100), nullable=True, index=True)
 
 
 conversation_bot = db.Table(
@@ -29,7 +36,7 @@ message_bot = db.Table(
 class Conversation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     channel_id = db.Column(db.String(100), nullable=False)
-    thread_ts = db.Column(db.DECIMAL(16, 6), nullable=False)
+    thread_ts = db.Column(SlackTimestamp, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     messages = db.relationship("Message", backref="conversation", lazy=True)
     bots = db.relationship(
@@ -49,13 +56,18 @@ class Message(db.Model):
         db.Integer, db.ForeignKey("conversation.id"), nullable=False
     )
     sender_id = db.Column(db.String(100), nullable=False)
-    sender_type = db.Column(db.String(10), nullable=True)
-    message_ts = db.Column(db.DECIMAL(16, 6), nullable=True)
-    responding_to_ts = db.Column(db.DECIMAL(16, 6))
+    sender_type = db.Column(db.String(10), nullable=True, index=True)
+    message_ts = db.Column(SlackTimestamp, nullable=True, index=True)
+    responding_to_ts = db.Column(SlackTimestamp)
     message_type = db.Column(db.String(20), nullable=True)
     text = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     text_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # True while a streamed reply is still being written; its stored text may
+    # then lag behind Slack until the stream finishes.
+    is_streaming = db.Column(
+        db.Boolean, nullable=False, default=False, server_default=db.false(), index=True
+    )
     files = db.relationship("File", backref="message", lazy=True)
     bots = db.relationship(
         "Bot", secondary=message_bot, backref=db.backref("messages", lazy=True)
@@ -75,19 +87,82 @@ class Message(db.Model):
             self.text_updated_at = datetime.utcnow()
         return text
 
-    @hybrid_property
-    def dynamic_sender_type(self):
-        from app import bolt_apps  # Importing here to avoid circular imports
-
-        bot_user_ids = {bot.get("bot_user_id") for bot in bolt_apps.values()}
-        return "bot" if self.sender_id in bot_user_ids else "user"
+    __table_args__ = (
+        db.UniqueConstraint(
+            "conversation_id", "message_ts", name="unique_conversation_message"
+        ),
+        db.Index("ix_message_conversation_created", "conversation_id", "created_at"),
+    )
 
 
 class File(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    message_id = db.Column(db.Integer, db.ForeignKey("message.id"), nullable=False)
+    message_id = db.Column(
+        db.Integer, db.ForeignKey("message.id"), nullable=False, index=True
+    )
     slack_file_id = db.Column(db.String(255), nullable=True)  # Slack file identifier
     mime_category = db.Column(db.String(20), nullable=False)
     file_type = db.Column(db.String(20), nullable=False)
     size = db.Column(db.Integer, nullable=True)
     properties = db.Column(db.JSON)  # Store type-specific properties here
+
+    __table_args__ = (
+        db.UniqueConstraint("slack_file_id", name="unique_slack_file_id"),
+    )
+
+
+class UsageRollup(db.Model):
+    """
+    Usage totals per day, bot and Slack user, kept up to date by the DAO as
+    messages and files are written. Each message counts towards the bot it was
+    first stored for, and towards the day of its Slack timestamp.
+    """
+
+    __tablename__ = "usage_rollup"
+
+    day = db.Column(db.Date, primary_key=True)
+    bot_id = db.Column(db.Integer, db.ForeignKey("bot.id"), primary_key=True)
+    user_id = db.Column(db.String(100), primary_key=True)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    character_count = db.Column(db.BigInteger, nullable=False, default=0)
+    file_count = db.Column(db.Integer, nullable=False, default=0)
+    pixel_count = db.Column(db.BigInteger, nullable=False, default=0)
+    audio_seconds = db.Column(db.Float, nullable=False, default=0)
+    pdf_page_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+def archive_table(table):
+    """
+    Returns a table with `table`'s columns, for rows archival moves out of it.
+
+    Archive tables get their own `archive_id` key and only index the original
+    key and foreign key columns, without constraints: archived rows don't hold
+    references into the hot tables, and an id the hot table hands out again
+    after its row was archived can be archived a second time.
+    """
+    return db.Table(
+        f"{table.name}_archive",
+        db.Column("archive_id", db.Integer, primary_key=True),
+        *(
+            db.Column(
+                column.name,
+                column.type,
+                index=column.primary_key or bool(column.foreign_keys),
+            )
+            for column in table.columns
+        ),
+    )
+
+
+conversation_archive = archive_table(Conversation.__table__)
+conversation_bot_archive = archive_table(conversation_bot)
+message_archive = archive_table(Message.__table__)
+message_bot_archive = archive_table(message_bot)
+file_archive = archive_table(File.__table__)
+archive_tables = [
+    conversation_archive,
+    conversation_bot_archive,
+    message_archive,
+    message_bot_archive,
+    file_archive,
+]
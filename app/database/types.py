@@ -0,0 +1,38 @@
+from decimal import Decimal
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+MICROS_PER_SECOND = 1_000_000
+
+
+def ts_to_micros(ts):
+    """Converts a Slack ts such as "1700000000.000100" to integer microseconds."""
+    return int((Decimal(str(ts)) * MICROS_PER_SECOND).to_integral_value())
+
+
+def micros_to_ts(micros):
+    """Converts integer microseconds back to a Slack ts string."""
+    seconds, fraction = divmod(micros, MICROS_PER_SECOND)
+    return f"{seconds}.{fraction:06d}"
+
+
+def normalize_ts(ts):
+    """Returns the canonical six-decimal form of a Slack ts."""
+    return micros_to_ts(ts_to_micros(ts))
+
+
+class SlackTimestamp(TypeDecorator):
+    """
+    A Slack ts stored as a BIGINT of microseconds.
+
+    Bound values may be ts strings or Decimals and come back as canonical ts
+    strings, so queries compare integers without casts on either side.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else ts_to_micros(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else micros_to_ts(value)
@@ -0,0 +1,83 @@
+from app import db
+from app.database.dao import USAGE_COLUMNS, session_scope
+from app.database.instrumentation import timed_query
+from app.database.models import Bot, UsageRollup
+
+
+def select_usage(start, end, bot_name=None, user_id=None):
+    query = (
+        db.select()
+        .select_from(UsageRollup)
+        .filter(UsageRollup.day >= start, UsageRollup.day <= end)
+    )
+    if bot_name is not None:
+        query = query.join(Bot).filter(Bot.name == bot_name)
+    if user_id is not None:
+        query = query.filter(UsageRollup.user_id == user_id)
+    return query
+
+
+def usage_totals():
+    return [
+        db.func.coalesce(db.func.sum(UsageRollup.__table__.c[column]), 0).label(column)
+        for column in USAGE_COLUMNS
+    ]
+
+
+@timed_query
+async def get_usage_totals(start, end, bot_name=None, user_id=None, session=None):
+    """
+    Sums usage between two days, optionally for one bot and/or one user.
+
+    Args:
+    start (date): The first day included.
+    end (date): The last day included.
+
+    Returns:
+    dict: Totals by usage column, e.g. {"message_count": 120, ...}.
+    """
+    async with session_scope(session) as session:
+        result = await session.execute(
+            select_usage(start, end, bot_name, user_id).add_columns(*usage_totals())
+        )
+        return dict(result.one()._mapping)
+
+
+@timed_query
+async def get_daily_usage(start, end, bot_name=None, user_id=None, session=None):
+    """
+    Returns one dict of usage totals per day with any usage, oldest first, each
+    with its "day".
+    """
+    async with session_scope(session) as session:
+        result = await session.execute(
+            select_usage(start, end, bot_name, user_id)
+            .add_columns(UsageRollup.day, *usage_totals())
+            .group_by(UsageRollup.day)
+            .order_by(UsageRollup.day)
+        )
+        return [dict(row._mapping) for row in result]
+
+
+@timed_query
+async def get_top_users(
+    start, end, column="character_count", bot_name=None, limit=10, session=None
+):
+    """
+    Returns the users with the highest total of a usage column between two days.
+
+    Returns:
+    list: (user_id, total) tuples, highest total first.
+    """
+    if column not in USAGE_COLUMNS:
+        raise ValueError(f"Unknown usage column: {column}")
+    total = db.func.sum(UsageRollup.__table__.c[column])
+    async with session_scope(session) as session:
+        result = await session.execute(
+            select_usage(start, end, bot_name)
+            .add_columns(UsageRollup.user_id, total)
+            .group_by(UsageRollup.user_id)
+            .order_by(total.desc())
+            .limit(limit)
+        )
+        return [tuple(row) for row in result]
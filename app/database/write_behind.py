@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from app.config import (
+    WRITE_BEHIND_MAX_PENDING,
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_INTERVAL,
+    WRITE_BEHIND_MAX_ATTEMPTS,
+    WRITE_BEHIND_RETRY_BACKOFF,
+    logger,
+)
+from app.database.dao import session_scope
+from app.utils.metrics import metrics
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of DAO writes, committed in batches by a background task.
+
+    A write is an async callable taking a `session` keyword, such as
+    `functools.partial(create_message, ...)`. Writes run in submission order and
+    each batch is one transaction. A write submitted with a `key` replaces a
+    queued write with the same key and moves to the back, which suits
+    last-writer-wins updates such as a message's full text.
+
+    `submit` waits while `max_pending` writes are queued. A failed batch is
+    retried with backoff; if it still fails, its writes are retried one at a
+    time and the ones that fail again are dropped and logged. Until `start` is
+    called, `submit` writes inline in its own transaction.
+    """
+
+    def __init__(
+        self,
+        max_pending=WRITE_BEHIND_MAX_PENDING,
+        batch_size=WRITE_BEHIND_BATCH_SIZE,
+        flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+        max_attempts=WRITE_BEHIND_MAX_ATTEMPTS,
+        retry_backoff=WRITE_BEHIND_RETRY_BACKOFF,
+    ):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._pending = OrderedDict()
+        self._sequence = itertools.count()
+        self._has_work = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._worker = None
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if not self.running:
+            self._worker = asyncio.create_task(self._run())
+
+    async def submit(self, write, key=None):
+        if not self.running:
+            async with session_scope() as session:
+                await write(session=session)
+            return
+
+        if key is not None and key in self._pending:
+            del self._pending[key]
+            self._pending[key] = write
+            metrics.counter("write_behind_coalesced_total").inc()
+            return
+
+        while len(self._pending) >= self.max_pending:
+            self._has_space.clear()
+            with metrics.histogram("write_behind_submit_wait_seconds").time():
+                await self._has_space.wait()
+        if key is None:
+            key = ("write", next(self._sequence))
+        self._pending[key] = write
+        self._idle.clear()
+        self._has_work.set()
+        metrics.gauge("write_behind_depth").set(len(self._pending))
+
+    async def flush(self):
+        """Waits until every write submitted so far is committed or dropped."""
+        if self.running:
+            await self._idle.wait()
+
+    async def stop(self):
+        """Flushes the queue, then stops the background task."""
+        if not self.running:
+            return
+        await self.flush()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def _run(self):
+        while True:
+            await self._has_work.wait()
+            if self.flush_interval and len(self._pending) < self.batch_size:
+                # Give writes from other streams a moment to join the batch.
+                await asyncio.sleep(self.flush_interval)
+            batch = [
+                self._pending.popitem(last=False)[1]
+                for _ in range(min(self.batch_size, len(self._pending)))
+            ]
+            if not self._pending:
+                self._has_work.clear()
+            self._has_space.set()
+            metrics.gauge("write_behind_depth").set(len(self._pending))
+
+            await self._write_batch(batch)
+            if not self._pending:
+                self._idle.set()
+
+    async def _write_batch(self, batch):
+        metrics.histogram(
+            "write_behind_batch_size", buckets=BATCH_SIZE_BUCKETS
+        ).observe(len(batch))
+        if await self._commit(batch, self.max_attempts):
+            return
+        if len(batch) == 1:
+            self._drop(batch)
+            return
+        # Isolate the failing writes so they don't take the rest down with them.
+        for write in batch:
+            if not await self._commit([write], 1):
+                self._drop([write])
+
+    async def _commit(self, writes, attempts):
+        for attempt in range(attempts):
+            start = time.monotonic()
+            try:
+                async with session_scope() as session:
+                    for write in writes:
+                        await write(session=session)
+                metrics.histogram("write_behind_flush_seconds").observe(
+                    time.monotonic() - start
+                )
+                return True
+            except Exception as e:
+                logger.error(f"Write-behind batch of {len(writes)} failed: {e}")
+                if attempt + 1 < attempts:
+                    metrics.counter("write_behind_retries_total").inc()
+                    await asyncio.sleep(self.retry_backoff * 2**attempt)
+        return False
+
+    def _drop(self, writes):
+        metrics.counter("write_behind_dropped_total").inc(len(writes))
+        for write in writes:
+            logger.error(f"Dropped write after repeated failures: {write!r:.300}")
+
+
+write_queue = WriteBehindQueue()
@@ -116,3 +116,10 @@ class StabilityError(UserFacingError):
 
     def __init__(self, message=None):
         super().__init__(message)
+
+
+class ServiceBusyError(UserFacingError):
+    """Raised when the work queue is full and a request cannot be accepted."""
+
+    def __init__(self, message=None):
+        super().__init__(message)
@@ -5,6 +5,8 @@ import asyncio
 sys.path.insert(0, "/Users/divyanshgolyan/Documents/GitHub/interaced-slackbots")
 
 from app import create_app
+from app.config import BOT_PROCESS_GROUPS
+from app.supervisor import run_supervisor
 
 
 async def main():
@@ -15,4 +17,7 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_PROCESS_GROUPS:
+        run_supervisor(BOT_PROCESS_GROUPS)
+    else:
+        asyncio.run(main())
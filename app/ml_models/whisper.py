@@ -6,12 +6,22 @@ from app.LLM_clients.openai_client import client as openai_client
 import openai
 from app.ml_models.model_wrappers import ModelWrapper
 from app.config import WHISPER_MODEL, WHISPER_CHUNK_LIMIT, logger
+from app.utils.artifact_store import artifact_store
 import asyncio
+from functools import partial
 from app.exceptions import *
 
 
 class Whisper(ModelWrapper):
-    async def call_model(self, file_type, file_bytes):
+    async def call_model(self, file_type, file_bytes, slack_file_id=None):
+        return await artifact_store.get_value(
+            slack_file_id,
+            "transcript",
+            {"model": WHISPER_MODEL},
+            partial(self.transcribe, file_type, file_bytes),
+        )
+
+    async def transcribe(self, file_type, file_bytes):
         format = file_type
         try:
             file = io.BytesIO(file_bytes)
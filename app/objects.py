@@ -1,18 +1,49 @@
-import aiohttp
-import io
+import asyncio
+from functools import partial
 from app.config import *
 from app.utils.file_utils import get_mime_type_from_mapping
 import time
 from app.database.dao import (
-    create_conversation,
     create_message,
     create_file,
+    save_thread_messages,
     update_message_text,
+    session_scope,
+)
+from app.database.models import BOT_SENDER, USER_SENDER
+from app.database.write_behind import write_queue
+from app.slackbot.attachment_cache import attachment_cache
+from app.slackbot.downloads import slack_file_downloader
+
+# The file fields slack_file reads; they are persisted with each File row so a
+# thread can be rebuilt from the database without asking Slack again.
+SLACK_FILE_FIELDS = (
+    "id",
+    "created",
+    "timestamp",
+    "name",
+    "title",
+    "pretty_type",
+    "user",
+    "size",
+    "url_private",
+    "url_private_download",
+    "permalink",
+    "permalink_public",
+    "media_display_type",
+    "mode",
+    "filetype",
+    "mimetype",
 )
 
 
 class slack_file:
     def __init__(self, file_data):
+        self.file_data = {
+            field: file_data.get(field)
+            for field in SLACK_FILE_FIELDS
+            if file_data.get(field) is not None
+        }
         self.id = file_data.get("id")
         self.created = file_data.get("created")
         self.timestamp = file_data.get("timestamp")
@@ -48,6 +79,8 @@ class slack_message:
         self.bot_token = bot_token
         self.user_id = message_data.get("user")
         self.bot_user_id = bot_user_id
+        # Set on messages posted by any bot, including other apps.
+        self.bot_id = message_data.get("bot_id")
         self.ts = message_data.get("ts")
         self.text = message_data.get("text")
         self._files = [
@@ -69,25 +102,16 @@ class slack_message:
             raise ValueError(
                 f"File size exceeds the limit of {MAX_SLACK_FILE_SIZE} bytes"
             )
-        if file_url in self._file_contents:
-            return self._file_contents[file_url]
-
-        file_content = await self.download_file(file_url)
-        self._file_contents[file_url] = file_content
-        return file_content
+        if file.id and file.created:
+            return await attachment_cache.get(
+                file.id, file.created, partial(self.download_file, file_url)
+            )
+        if file_url not in self._file_contents:
+            self._file_contents[file_url] = await self.download_file(file_url)
+        return self._file_contents[file_url]
 
     async def download_file(self, url):
-        headers = {"Authorization": f"Bearer {self.bot_token}"}
-        async with aiohttp.ClientSession(
-            headers=headers, timeout=aiohttp.ClientTimeout(total=300)
-        ) as session:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                with io.BytesIO() as bytes_object:
-                    bytes_object.write(await response.read())
-                    bytes_object.seek(0)
-                    bytes = bytes_object.read()
-                    return bytes
+        return await slack_file_downloader.download(url, self.bot_token)
 
 
 class slack_conversation:
@@ -116,49 +140,49 @@ class SlackService:
             thread_data, bot_token, channel_id, thread_ts, bot_user_id
         )
         try:
-            db_conversation = await create_conversation(
-                bot_name=self.bot_name, channel_id=channel_id, thread_ts=thread_ts
+            # Written inline: the agents update these File rows right away.
+            await save_thread_messages(
+                bot_name=self.bot_name,
+                channel_id=channel_id,
+                thread_ts=thread_ts,
+                messages=[
+                    self.message_row(message) for message in conversation.messages
+                ],
             )
         except Exception as e:
-            logging.error(f"Failed to create or retrieve conversation in DB: {e}")
-
-        for message in conversation.messages:
-            try:
-                await self.save_message(message)
-            except Exception as e:
-                logging.error(f"Failed to save message {message.ts} to DB: {e}")
+            logging.error(f"Failed to save thread {thread_ts} to DB: {e}")
 
         return conversation
 
-    async def save_message(self, slack_message):
-        try:
-            db_message = await create_message(
-                channel_id=self.channel_id,
-                thread_ts=self.thread_ts,
-                sender_id=slack_message.user_id,
-                bot_name=self.bot_name,
-                message_ts=slack_message.ts,
-                message_type=None,
-                responding_to_ts=None,
-                text=slack_message.text,
-            )
-        except Exception as e:
-            logging.error(f"Failed to create message {slack_message.ts} in DB: {e}")
-
-        for file in slack_message.files:
-            mime_category = file.mimetype.split("/")[0] if file.mimetype else None
-            try:
-                await create_file(
-                    message_ts=slack_message.ts,
-                    file_type=file.filetype,
-                    size=file.size,
-                    mime_category=mime_category,
-                    slack_file_id=file.id,
-                )
-            except Exception as e:
-                logging.error(
-                    f"Failed to create file for message {slack_message.ts} in DB: {e}"
-                )
+    @staticmethod
+    def message_row(slack_message):
+        return {
+            "sender_id": slack_message.user_id,
+            "sender_type": (
+                BOT_SENDER
+                if slack_message.bot_id
+                or slack_message.user_id == slack_message.bot_user_id
+                else USER_SENDER
+            ),
+            "message_ts": slack_message.ts,
+            "text": slack_message.text,
+            "files": SlackService.file_rows(slack_message),
+        }
+
+    @staticmethod
+    def file_rows(slack_message):
+        return [
+            {
+                "file_type": file.filetype,
+                "size": file.size,
+                "mime_category": (
+                    file.mimetype.split("/")[0] if file.mimetype else None
+                ),
+                "slack_file_id": file.id,
+                "properties": {"slack": file.file_data},
+            }
+            for file in slack_message.files
+        ]
 
 
 class ProcessedFile:
@@ -264,6 +288,8 @@ class SlackTextMessage:
         self.bot_user_id = bot_user_id
         self.ts = None  # Timestamp of the message once sent
         self.last_update_time = None
+        self.last_checkpoint_time = None
+        self.saved_bytes = 0
 
     @classmethod
     async def create_and_send(
@@ -291,16 +317,49 @@ class SlackTextMessage:
         )
         self.ts = response.get("ts")
         self.last_update_time = time.time()
+        self.last_checkpoint_time = self.last_update_time
+        self.saved_bytes = len(self.text.encode())
         # Create a new message in the database
-        await create_message(
-            channel_id=self.channel,
-            thread_ts=self.thread_ts,
-            sender_id=self.bot_user_id,
-            bot_name=self.bot_name,
-            message_ts=self.ts,
-            message_type=None,
-            responding_to_ts=self.user_message_ts,
-            text=self.text,
+        await write_queue.submit(
+            partial(
+                create_message,
+                channel_id=self.channel,
+                thread_ts=self.thread_ts,
+                sender_id=self.bot_user_id,
+                bot_name=self.bot_name,
+                message_ts=self.ts,
+                message_type=None,
+                responding_to_ts=self.user_message_ts,
+                text=self.text,
+                is_streaming=bool(typing_indicator),
+                sender_type=BOT_SENDER,
+            )
+        )
+
+    async def save_text(self, finished):
+        """
+        Stores the text once the message is finished, and before that only as a
+        checkpoint when STREAM_CHECKPOINT_INTERVAL or STREAM_CHECKPOINT_BYTES says
+        one is due.
+        """
+        text_bytes = len(self.text.encode())
+        if not finished and not self.checkpoint_due(text_bytes):
+            return
+        self.saved_bytes = text_bytes
+        self.last_checkpoint_time = time.time()
+        await write_queue.submit(
+            partial(update_message_text, self.ts, self.text, is_streaming=not finished),
+            key=("message_text", self.ts),
+        )
+
+    def checkpoint_due(self, text_bytes):
+        if (
+            STREAM_CHECKPOINT_INTERVAL
+            and time.time() - self.last_checkpoint_time >= STREAM_CHECKPOINT_INTERVAL
+        ):
+            return True
+        return bool(STREAM_CHECKPOINT_BYTES) and (
+            text_bytes - self.saved_bytes >= STREAM_CHECKPOINT_BYTES
         )
 
     async def update_and_post(self, new_text, typing_indicator, end_of_stream):
@@ -310,7 +369,7 @@ class SlackTextMessage:
                 text=self.text + typing_indicator, channel=self.channel, ts=self.ts
             )
             # Update the message text in the database
-            await update_message_text(self.ts, self.text)
+            await self.save_text(finished=not typing_indicator)
         else:
             current_time = time.time()
             if current_time - self.last_update_time < SLACK_MESSAGE_UPDATE_INTERVAL:
@@ -320,7 +379,7 @@ class SlackTextMessage:
             )
             self.last_update_time = current_time
             # Update the message text in the database
-            await update_message_text(self.ts, self.text)
+            await self.save_text(finished=not typing_indicator)
 
 
 class SlackFileMessage:
@@ -390,30 +449,47 @@ class SlackFileMessage:
 
         # Extract file IDs from the response
         file_ids = [file_info.get("id", "") for file_info in response.get("files", [])]
+        self.ts = self.get_shared_message_ts(response)
 
-        # Create a new message in the database
-        db_message = await create_message(
-            channel_id=self.channel,
-            thread_ts=self.thread_ts,
-            sender_id=self.bot_user_id,
-            bot_name=self.bot_name,
-            message_ts=self.ts,
-            message_type=None,
-            responding_to_ts=self.user_message_ts,
-            text=self.initial_comment,
-        )
+        # Store the message and its files in one transaction
+        await write_queue.submit(partial(self.save, file_ids))
 
-        # Create file entries in the database for each file, using the extracted file IDs
-        for file, file_id in zip(self.files, file_ids):
-            await create_file(
+    async def save(self, file_ids, session=None):
+        async with session_scope(session) as session:
+            db_message = await create_message(
+                channel_id=self.channel,
+                thread_ts=self.thread_ts,
+                sender_id=self.bot_user_id,
+                bot_name=self.bot_name,
                 message_ts=self.ts,
-                file_type=file.file_type,
-                size=file.size,
-                slack_file_id=file_id,
-                mime_category=file.mime_category,
-                properties=file.properties,
-                message_id=db_message.id,
+                message_type=None,
+                responding_to_ts=self.user_message_ts,
+                text=self.initial_comment,
+                sender_type=BOT_SENDER,
+                session=session,
             )
+            for file, file_id in zip(self.files, file_ids):
+                await create_file(
+                    message_ts=self.ts,
+                    file_type=file.file_type,
+                    size=file.size,
+                    slack_file_id=file_id,
+                    mime_category=file.mime_category,
+                    properties=file.properties,
+                    message_id=db_message.id,
+                    session=session,
+                )
+
+    def get_shared_message_ts(self, response):
+        # Slack fills in where an upload was shared asynchronously, so the ts of
+        # the message carrying the files may not be known yet.
+        for file_info in response.get("files", []):
+            shares = file_info.get("shares", {})
+            for share_type in ("public", "private"):
+                for share in shares.get(share_type, {}).get(self.channel, []):
+                    if share.get("ts"):
+                        return share["ts"]
+        return None
 
 
 class SlackResponseHandler:
@@ -431,6 +507,22 @@ class SlackResponseHandler:
         self.typing_indicator = f"\n\n{TYPING_INDICATOR}"
 
     async def handle_responses(self, response_generator):
+        try:
+            await self._handle_responses(response_generator)
+        except asyncio.CancelledError:
+            # A newer message superseded this reply; drop the typing indicator so
+            # the partial answer doesn't look like it is still being written.
+            for message in reversed(self.messages):
+                if isinstance(message, SlackTextMessage):
+                    await message.update_and_post(
+                        new_text="", typing_indicator="", end_of_stream=True
+                    )
+                    break
+            raise
+        finally:
+            self.messages.clear()
+
+    async def _handle_responses(self, response_generator):
         async for agent_response in response_generator:
             if agent_response.end_of_stream:
                 typing_indicator_text = ""
@@ -505,5 +597,3 @@ class SlackResponseHandler:
                     )
 
             self.messages.append(message)
-
-        self.messages.clear()
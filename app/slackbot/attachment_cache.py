@@ -0,0 +1,95 @@
+import asyncio
+from app.config import (
+    ATTACHMENT_CACHE_MEMORY_BYTES,
+    ATTACHMENT_CACHE_DISK_BYTES,
+    ATTACHMENT_CACHE_DIR,
+    logger,
+)
+from app.utils.cache import DiskCache, LRUCache
+from app.utils.metrics import metrics
+
+
+class AttachmentCache:
+    """
+    Process-wide cache of downloaded Slack files, keyed by (file id, created).
+
+    A file shared in a thread is downloaded once and then served to every later
+    turn and every bot in the thread: first from a memory LRU bounded in bytes,
+    then from the disk tier. Concurrent requests for the same file wait on a
+    single download.
+
+    Args:
+    memory_bytes (int): The most bytes held in memory, or 0 for no memory tier.
+    directory (str): Where the disk tier keeps its files.
+    disk_bytes (int): The most bytes kept on disk, or 0 for no disk tier.
+    """
+
+    def __init__(self, memory_bytes, directory, disk_bytes):
+        self._memory = (
+            LRUCache(maxsize=memory_bytes, getsizeof=len) if memory_bytes > 0 else None
+        )
+        self._disk = DiskCache(directory, disk_bytes) if disk_bytes > 0 else None
+        self._downloads = {}
+
+    async def get(self, file_id, created, download):
+        """
+        Returns a file's content from the cache, calling `download` on a miss.
+
+        Args:
+        file_id (str): The Slack file id.
+        created (int): The file's `created` timestamp.
+        download (callable): Coroutine function returning the file's bytes.
+
+        Returns:
+        bytes: The file content.
+        """
+        key = (file_id, created)
+        content = self._memory.get(key) if self._memory is not None else None
+        if content is not None:
+            metrics.counter("attachment_cache_requests_total", result="memory").inc()
+            return content
+        if key in self._downloads:
+            return await asyncio.shield(self._downloads[key])
+        task = asyncio.ensure_future(self._load(key, download))
+        task.add_done_callback(lambda _: self._downloads.pop(key, None))
+        self._downloads[key] = task
+        # Shielded so one caller giving up does not cancel the others' download.
+        return await asyncio.shield(task)
+
+    async def _load(self, key, download):
+        content = None
+        if self._disk is not None:
+            try:
+                content = await asyncio.to_thread(self._disk.get, key)
+            except OSError as e:
+                logger.warning(f"Attachment cache read failed: {e}")
+        if content is not None:
+            metrics.counter("attachment_cache_requests_total", result="disk").inc()
+        else:
+            metrics.counter("attachment_cache_requests_total", result="miss").inc()
+            content = await download()
+            if self._disk is not None:
+                try:
+                    await asyncio.to_thread(self._disk.set, key, content)
+                except OSError as e:
+                    logger.warning(f"Attachment cache write failed: {e}")
+                metrics.gauge("attachment_cache_bytes", tier="disk").set(
+                    self._disk.currsize
+                )
+        if self._memory is not None:
+            self._memory.set(key, content)
+            metrics.gauge("attachment_cache_bytes", tier="memory").set(
+                self._memory.currsize
+            )
+        return content
+
+    def clear(self):
+        if self._memory is not None:
+            self._memory.clear()
+
+
+attachment_cache = AttachmentCache(
+    memory_bytes=ATTACHMENT_CACHE_MEMORY_BYTES,
+    directory=ATTACHMENT_CACHE_DIR,
+    disk_bytes=ATTACHMENT_CACHE_DISK_BYTES,
+)
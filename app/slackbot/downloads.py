@@ -0,0 +1,140 @@
+import asyncio
+import aiohttp
+import tempfile
+from app.config import (
+    MAX_SLACK_FILE_SIZE,
+    SLACK_DOWNLOAD_CONNECTIONS_PER_HOST,
+    SLACK_DOWNLOAD_DNS_CACHE_TTL,
+    SLACK_DOWNLOAD_KEEPALIVE_TIMEOUT,
+    SLACK_DOWNLOAD_TIMEOUT,
+    SLACK_DOWNLOAD_CONNECT_TIMEOUT,
+    SLACK_DOWNLOAD_READ_TIMEOUT,
+    SLACK_DOWNLOAD_CHUNK_SIZE,
+    SLACK_DOWNLOAD_SPOOL_THRESHOLD,
+)
+from app.utils.metrics import metrics
+
+
+async def on_request_start(session, context, params):
+    context.start = asyncio.get_running_loop().time()
+
+
+async def on_request_end(session, context, params):
+    metrics.histogram("slack_download_response_seconds").observe(
+        asyncio.get_running_loop().time() - context.start
+    )
+
+
+async def on_connection_create_end(session, context, params):
+    metrics.counter("slack_download_connections_total", reused="false").inc()
+
+
+async def on_connection_reuseconn(session, context, params):
+    metrics.counter("slack_download_connections_total", reused="true").inc()
+
+
+async def on_dns_cache_hit(session, context, params):
+    metrics.counter("slack_download_dns_lookups_total", cached="true").inc()
+
+
+async def on_dns_cache_miss(session, context, params):
+    metrics.counter("slack_download_dns_lookups_total", cached="false").inc()
+
+
+def download_trace_config():
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+    trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+    return trace_config
+
+
+def file_too_large(max_size):
+    metrics.counter("slack_download_rejected_total").inc()
+    return ValueError(f"File size exceeds the limit of {max_size} bytes")
+
+
+class SlackFileDownloader:
+    """
+    Downloads Slack files over one long-lived HTTP session per bot token.
+
+    Each session keeps connections to files.slack.com alive between downloads
+    and caches DNS lookups, so a file usually costs one request instead of a new
+    TCP and TLS handshake. Sessions are created on first use in the running
+    event loop and closed by `close`.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+
+    def session(self, bot_token):
+        loop = asyncio.get_running_loop()
+        session_loop, session = self._sessions.get(bot_token, (None, None))
+        if session is None or session.closed or session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=SLACK_DOWNLOAD_CONNECTIONS_PER_HOST,
+                ttl_dns_cache=SLACK_DOWNLOAD_DNS_CACHE_TTL,
+                keepalive_timeout=SLACK_DOWNLOAD_KEEPALIVE_TIMEOUT,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Authorization": f"Bearer {bot_token}"},
+                timeout=aiohttp.ClientTimeout(
+                    total=SLACK_DOWNLOAD_TIMEOUT,
+                    connect=SLACK_DOWNLOAD_CONNECT_TIMEOUT,
+                    sock_read=SLACK_DOWNLOAD_READ_TIMEOUT,
+                ),
+                trace_configs=[download_trace_config()],
+            )
+            self._sessions[bot_token] = (loop, session)
+        return session
+
+    async def download(self, url, bot_token, max_size=MAX_SLACK_FILE_SIZE):
+        """
+        Streams a file from Slack, giving up as soon as it grows past `max_size`.
+
+        The body is read in chunks into a spooled temporary file that moves to
+        disk past SLACK_DOWNLOAD_SPOOL_THRESHOLD, so a large file is only held in
+        memory once, as the returned bytes.
+
+        Args:
+        url (str): The file's url_private.
+        bot_token (str): The token of the bot the file was shared with.
+        max_size (int): The most bytes to accept.
+
+        Returns:
+        bytes: The file content.
+        """
+        session = self.session(bot_token)
+        with metrics.histogram("slack_download_seconds").time():
+            async with session.get(url) as response:
+                response.raise_for_status()
+                if (response.content_length or 0) > max_size:
+                    raise file_too_large(max_size)
+                with tempfile.SpooledTemporaryFile(
+                    max_size=SLACK_DOWNLOAD_SPOOL_THRESHOLD
+                ) as spool:
+                    size = 0
+                    async for chunk in response.content.iter_chunked(
+                        SLACK_DOWNLOAD_CHUNK_SIZE
+                    ):
+                        size += len(chunk)
+                        if size > max_size:
+                            raise file_too_large(max_size)
+                        spool.write(chunk)
+                    metrics.histogram("slack_download_bytes").observe(size)
+                    spool.seek(0)
+                    return spool.read()
+
+    async def close(self):
+        sessions = [session for _, session in self._sessions.values()]
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+
+
+slack_file_downloader = SlackFileDownloader()
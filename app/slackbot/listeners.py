@@ -1,7 +1,23 @@
 from app.slackbot.message_handler import handle_errors, process_message
+from app.slackbot.thread_cache import thread_snapshot_cache
+from app.database.dao import delete_message, update_message_text
+from app.database.write_behind import write_queue
+from functools import partial
 from app.config import *
+from app.utils.cache import LRUCache
 
-processed_events_cache = set()
+processed_events_cache = LRUCache(
+    maxsize=SLACK_EVENT_DEDUP_MAX_SIZE, ttl=SLACK_EVENT_DEDUP_TTL
+)
+
+
+def is_duplicate_event(event, bot_name):
+    if processed_events_cache.check_and_add((event.get("ts"), bot_name)):
+        logger.info(
+            f"Duplicate event detected, skipping... {processed_events_cache.stats()}"
+        )
+        return True
+    return False
 
 
 def register_listeners(app, bot_name, client, bot_user_id):
@@ -10,10 +26,8 @@ def register_listeners(app, bot_name, client, bot_user_id):
     @app.event("app_mention")
     async def handle_app_mention(event, say, ack):
         await ack()
-        if (event.get("ts"), bot_name) in processed_events_cache:
-            logger.info("Duplicate event detected, skipping...")
+        if is_duplicate_event(event, bot_name):
             return
-        processed_events_cache.add((event.get("ts"), bot_name))
         channel_id = event.get("channel") or event.get("channel_id")
         thread_ts = event.get("thread_ts") or event.get("ts")
         async with handle_errors(client, channel_id, thread_ts):
@@ -24,11 +38,36 @@ def register_listeners(app, bot_name, client, bot_user_id):
     @app.event("message")
     async def handle_direct_message(event, say, ack):
         await ack()
+        subtype = event.get("subtype")
+        if subtype == "message_changed":
+            thread_snapshot_cache.apply_message_changed(event)
+            changed_message = event.get("message", {})
+            # Bot edits are streamed replies, which are already persisted as they go.
+            if changed_message.get("bot_id") is None and not is_duplicate_event(
+                event, "message_changed"
+            ):
+                await write_queue.submit(
+                    partial(
+                        update_message_text,
+                        changed_message.get("ts"),
+                        changed_message.get("text"),
+                    ),
+                    key=("message_text", changed_message.get("ts")),
+                )
+            return
+        if subtype == "message_deleted":
+            thread_snapshot_cache.apply_message_deleted(event)
+            deleted_ts = event.get("deleted_ts")
+            if deleted_ts and not is_duplicate_event(event, "message_deleted"):
+                # Same key as the text updates, which the deletion supersedes.
+                await write_queue.submit(
+                    partial(delete_message, deleted_ts),
+                    key=("message_text", deleted_ts),
+                )
+            return
         if event.get("bot_id") is None:
-            if (event.get("ts"), bot_name) in processed_events_cache:
-                logger.info("Duplicate event detected, skipping...")
+            if is_duplicate_event(event, bot_name):
                 return
-            processed_events_cache.add((event.get("ts"), bot_name))
             channel_id = event.get("channel") or event.get("channel_id")
             thread_ts = event.get("thread_ts") or event.get("ts")
             async with handle_errors(client, channel_id, thread_ts):
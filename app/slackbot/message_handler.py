@@ -1,14 +1,99 @@
-from app.config import SLACK_BOTS, SLACK_THREAD_MESSAGE_LIMIT
-from app.objects import SlackResponseHandler, SlackService
+from app.config import (
+    SLACK_BOTS,
+    SLACK_THREAD_MESSAGE_LIMIT,
+    CANCEL_SUPERSEDED_GENERATIONS,
+    logger,
+)
+from app.objects import (
+    SlackResponseHandler,
+    SlackService,
+    slack_conversation,
+    slack_message,
+)
 from contextlib import asynccontextmanager
 from app.exceptions import *
 from app.agents.agent_manager import AgentManager
+from app.slackbot.work_queue import work_queue
+from app.slackbot.thread_cache import thread_snapshot_cache
+import asyncio
 
-from app.database.dao import create_message
+from app.database.dao import create_message, get_thread_messages
+from app.database.models import USER_SENDER
 
 agent_manager = AgentManager(SLACK_BOTS)
 
 
+class ThreadScheduler:
+    """
+    Serializes reply generation per (channel_id, thread_ts, bot_name).
+
+    While a generation is running for a thread, further messages in that thread
+    wait for it instead of starting their own pipeline. When it finishes, only the
+    newest waiting message is processed; the ones in between are coalesced into it,
+    since its fetch of the thread already includes them. With `cancel_superseded`,
+    a newer message also cancels the generation that is currently in flight.
+    """
+
+    def __init__(self, cancel_superseded=False):
+        self.cancel_superseded = cancel_superseded
+        self._locks = {}
+        self._waiters = {}
+        self._latest = {}
+        self._in_flight = {}
+        self.coalesced = 0
+        self.superseded = 0
+
+    async def run(self, key, job_factory):
+        """
+        Runs `job_factory()` for `key` once it is this message's turn.
+
+        Returns:
+        bool: True if the job ran to completion, False if it was coalesced into
+        or cancelled by a newer message for the same thread.
+        """
+        ticket = object()
+        self._latest[key] = ticket
+        if self.cancel_superseded and key in self._in_flight:
+            self._in_flight[key].cancel()
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                if self._latest.get(key) is not ticket:
+                    self.coalesced += 1
+                    logger.info(f"Coalesced message into a newer one for {key}")
+                    return False
+                del self._latest[key]
+
+                task = asyncio.ensure_future(job_factory())
+                self._in_flight[key] = task
+                try:
+                    await asyncio.wait({task})
+                except asyncio.CancelledError:
+                    task.cancel()
+                    raise
+                finally:
+                    self._in_flight.pop(key, None)
+
+                if task.cancelled():
+                    self.superseded += 1
+                    logger.info(f"Cancelled superseded generation for {key}")
+                    return False
+                task.result()
+                return True
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+
+THREAD_TOO_LARGE_MESSAGE = f"This thread has grown too large for me to process. To avoid potential performance issues, I am limited to working with threads containing {SLACK_THREAD_MESSAGE_LIMIT} messages or less. Please try again with a shorter thread or feel free to start a new conversation."
+
+thread_scheduler = ThreadScheduler(cancel_superseded=CANCEL_SUPERSEDED_GENERATIONS)
+
+
 async def process_message(
     event, bot_name, slack_client, channel_id, thread_ts, bot_user_id
 ):
@@ -22,38 +107,91 @@ async def process_message(
     user = event.get("user")
     text = event.get("text")
 
+    # Written inline, with its files, so the thread can be rebuilt from the
+    # database below.
     await create_message(
         channel_id=channel_id,
         thread_ts=thread_ts,
         sender_id=user,
+        sender_type=USER_SENDER,
         bot_name=bot_name,
         message_ts=user_message_ts,
         responding_to_ts=None,
         message_type=event_type,
         text=text,
+        files=SlackService.file_rows(slack_message(event, bot_token, bot_user_id)),
     )
 
-    thread_messages = await fetch_thread_messages(
-        slack_client, channel_id, thread_ts, bot_token, bot_user_id, bot_name
+    await thread_scheduler.run(
+        (channel_id, thread_ts, bot_name),
+        lambda: generate_response(
+            bot_name,
+            slack_client,
+            channel_id,
+            thread_ts,
+            user_message_ts,
+            user,
+            bot_token,
+            bot_user_id,
+        ),
     )
-    agent = agent_manager.get_agent(bot_name)
 
-    response_generator = agent.process_conversation(thread_messages)
-    response_handler = SlackResponseHandler(
-        client=slack_client,
-        channel_id=channel_id,
-        thread_ts=thread_ts,
-        user_message_ts=user_message_ts,
-        bot_name=bot_name,
-        bot_user_id=bot_user_id,
-    )
-    await response_handler.handle_responses(response_generator=response_generator)
+
+async def generate_response(
+    bot_name,
+    slack_client,
+    channel_id,
+    thread_ts,
+    user_message_ts,
+    user,
+    bot_token,
+    bot_user_id,
+):
+    async def notify_queued(position):
+        # Only the requester sees it, and it stays out of the thread history
+        # that the agent reads.
+        await slack_client.chat_postEphemeral(
+            text=f"I'm busy with other requests right now. You're number {position} in the queue, and I'll reply here as soon as I can.",
+            channel=channel_id,
+            user=user,
+            thread_ts=thread_ts,
+        )
+
+    async with work_queue.admit(bot_name, on_queued=notify_queued):
+        thread_messages = await fetch_thread_messages(
+            slack_client, channel_id, thread_ts, bot_token, bot_user_id, bot_name
+        )
+        agent = await agent_manager.get_agent_async(bot_name)
+
+        response_generator = agent.process_conversation(thread_messages)
+        response_handler = SlackResponseHandler(
+            client=slack_client,
+            channel_id=channel_id,
+            thread_ts=thread_ts,
+            user_message_ts=user_message_ts,
+            bot_name=bot_name,
+            bot_user_id=bot_user_id,
+        )
+        await response_handler.handle_responses(response_generator=response_generator)
 
 
 async def fetch_thread_messages(
     client, channel_id, thread_ts, bot_token, bot_user_id, bot_name
 ):
-    all_thread_data = []
+    snapshot = thread_snapshot_cache.get(channel_id, thread_ts)
+    if snapshot is None:
+        stored_thread_data = await load_thread_from_db(client, channel_id, thread_ts)
+        if stored_thread_data is not None:
+            if len(stored_thread_data) > SLACK_THREAD_MESSAGE_LIMIT:
+                raise UserFacingError(THREAD_TOO_LARGE_MESSAGE)
+            thread_snapshot_cache.store(channel_id, thread_ts, stored_thread_data)
+            return slack_conversation(
+                stored_thread_data, bot_token, channel_id, thread_ts, bot_user_id
+            )
+
+    # With a cached snapshot only the replies newer than it need to be paged in.
+    oldest = snapshot[-1].get("ts") if snapshot else None
+    new_thread_data = []
     try:
         cursor = None
         while True:
@@ -61,16 +199,19 @@ async def fetch_thread_messages(
                 channel=channel_id,
                 ts=thread_ts,
                 cursor=cursor,
+                oldest=oldest,
                 limit=200,  # Recommended limit for batch processing
             )
             if response["ok"]:
                 thread_data = response["messages"]
-                all_thread_data.extend(thread_data)
+                new_thread_data.extend(thread_data)
 
-                if len(all_thread_data) > SLACK_THREAD_MESSAGE_LIMIT:
-                    raise UserFacingError(
-                        f"This thread has grown too large for me to process. To avoid potential performance issues, I am limited to working with threads containing {SLACK_THREAD_MESSAGE_LIMIT} messages or less. Please try again with a shorter thread or feel free to start a new conversation."
-                    )
+                # The parent message is returned again alongside newer replies.
+                if (
+                    len(snapshot or []) + len(new_thread_data)
+                    > SLACK_THREAD_MESSAGE_LIMIT + 1
+                ):
+                    raise UserFacingError(THREAD_TOO_LARGE_MESSAGE)
 
                 # Check for the presence of a "next_cursor" to continue pagination
                 cursor = response.get("response_metadata", {}).get("next_cursor")
@@ -79,6 +220,11 @@ async def fetch_thread_messages(
             else:
                 raise Exception(f"Failed to fetch thread messages: {response['error']}")
 
+        all_thread_data = thread_snapshot_cache.merge(snapshot, new_thread_data)
+        if len(all_thread_data) > SLACK_THREAD_MESSAGE_LIMIT:
+            raise UserFacingError(THREAD_TOO_LARGE_MESSAGE)
+        thread_snapshot_cache.store(channel_id, thread_ts, all_thread_data)
+
         slack_service = SlackService(bot_name)
         conversation = await slack_service.create_conversation_from_thread(
             all_thread_data, bot_token, channel_id, thread_ts, bot_user_id
@@ -88,6 +234,59 @@ async def fetch_thread_messages(
         raise Exception(f"Error fetching thread messages: {str(e)}")
 
 
+async def load_thread_from_db(client, channel_id, thread_ts):
+    """
+    Rebuilds a thread's `conversations_replies` messages from the Message/File tables.
+
+    The stored thread is only used if it matches the parent message's
+    `reply_count` and `latest_reply`, which a single one-message
+    `conversations_replies` call returns. Returns None for cold or stale threads,
+    or when a stored file lacks the Slack metadata needed to download it.
+    """
+    try:
+        stored_messages = await get_thread_messages(channel_id, thread_ts)
+        if not stored_messages:
+            return None
+
+        thread_data = []
+        seen_ts = set()
+        for stored_message in stored_messages:
+            message_ts = stored_message.message_ts
+            if message_ts in seen_ts:
+                continue
+            seen_ts.add(message_ts)
+            files = []
+            for stored_file in stored_message.files:
+                slack_file_data = (stored_file.properties or {}).get("slack")
+                if not slack_file_data:
+                    return None
+                files.append(slack_file_data)
+            message_data = {
+                "ts": message_ts,
+                "thread_ts": thread_ts,
+                "user": stored_message.sender_id,
+                "text": stored_message.text or "",
+            }
+            if files:
+                message_data["files"] = files
+            thread_data.append(message_data)
+
+        response = await client.conversations_replies(
+            channel=channel_id, ts=thread_ts, limit=1
+        )
+        if not response["ok"] or not response["messages"]:
+            return None
+        parent = response["messages"][0]
+        expected_count = parent.get("reply_count", 0) + 1
+        latest_reply = parent.get("latest_reply") or parent.get("ts")
+        if len(thread_data) != expected_count or thread_data[-1]["ts"] != latest_reply:
+            return None
+        return thread_data
+    except Exception as e:
+        logger.error(f"Failed to load thread {thread_ts} from the database: {e}")
+        return None
+
+
 @asynccontextmanager
 async def handle_errors(client, channel_id, thread_ts):
     try:
@@ -0,0 +1,96 @@
+from app.config import (
+    TYPING_INDICATOR,
+    THREAD_SNAPSHOT_CACHE_SIZE,
+    THREAD_SNAPSHOT_TTL,
+)
+from app.utils.cache import LRUCache
+
+
+class ThreadSnapshotCache:
+    """
+    LRU of raw `conversations_replies` messages keyed by (channel_id, thread_ts).
+
+    A snapshot only holds the settled prefix of a thread: it stops before the
+    first message that still carries the typing indicator, so a reply that was
+    mid-stream when the thread was fetched is fetched again on the next turn.
+    Edits and deletions are applied from `message_changed`/`message_deleted`
+    events; the TTL bounds staleness for threads whose edit events this bot
+    does not receive.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self._snapshots = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, channel_id, thread_ts):
+        snapshot = self._snapshots.get((channel_id, thread_ts))
+        return list(snapshot) if snapshot else None
+
+    def store(self, channel_id, thread_ts, thread_data):
+        settled = []
+        for message_data in thread_data:
+            if TYPING_INDICATOR in (message_data.get("text") or ""):
+                break
+            settled.append(message_data)
+        if settled:
+            self._snapshots.set((channel_id, thread_ts), settled)
+        else:
+            self._snapshots.pop((channel_id, thread_ts))
+
+    def merge(self, snapshot, fetched):
+        """Overlays freshly fetched messages onto a snapshot, keeping ts order."""
+        if not snapshot:
+            return list(fetched)
+        fetched_by_ts = {
+            message_data.get("ts"): message_data for message_data in fetched
+        }
+        merged = [
+            fetched_by_ts.pop(message_data.get("ts"), message_data)
+            for message_data in snapshot
+        ]
+        merged.extend(
+            message_data
+            for message_data in fetched
+            if message_data.get("ts") in fetched_by_ts
+        )
+        return merged
+
+    def apply_message_changed(self, event):
+        message_data = event.get("message", {})
+        message_ts = message_data.get("ts")
+        key = (
+            event.get("channel"),
+            message_data.get("thread_ts") or message_ts,
+        )
+        snapshot = self._snapshots.get(key)
+        if not snapshot:
+            return
+        self._snapshots.set(
+            key,
+            [
+                message_data if cached.get("ts") == message_ts else cached
+                for cached in snapshot
+            ],
+        )
+
+    def apply_message_deleted(self, event):
+        previous_message = event.get("previous_message", {})
+        deleted_ts = event.get("deleted_ts") or previous_message.get("ts")
+        thread_ts = previous_message.get("thread_ts") or deleted_ts
+        key = (event.get("channel"), thread_ts)
+        if deleted_ts == thread_ts:
+            self._snapshots.pop(key)
+            return
+        snapshot = self._snapshots.get(key)
+        if not snapshot:
+            return
+        self._snapshots.set(
+            key, [cached for cached in snapshot if cached.get("ts") != deleted_ts]
+        )
+
+    def stats(self):
+        return self._snapshots.stats()
+
+
+thread_snapshot_cache = ThreadSnapshotCache(
+    maxsize=THREAD_SNAPSHOT_CACHE_SIZE, ttl=THREAD_SNAPSHOT_TTL
+)
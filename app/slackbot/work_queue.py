@@ -0,0 +1,115 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from app.config import (
+    SLACK_BOTS,
+    PROVIDER_CONCURRENCY_LIMITS,
+    DEFAULT_BOT_CONCURRENCY,
+    WORK_QUEUE_MAX_DEPTH,
+    logger,
+)
+from app.exceptions import ServiceBusyError
+from app.utils.metrics import metrics
+
+
+class WorkQueue:
+    """
+    Admission control in front of reply generation.
+
+    Each reply needs a slot for its bot and a slot for the bot's model provider.
+    When either is exhausted the reply waits in FIFO order; once `max_depth`
+    replies are waiting, new ones are rejected with a ServiceBusyError instead of
+    piling up more work than the container can serve.
+    """
+
+    def __init__(self, slack_bots, provider_limits, max_depth):
+        self.max_depth = max_depth
+        self.depth = 0
+        self._bot_providers = {}
+        self._bot_slots = {}
+        self._provider_slots = {}
+        self._queued = {}
+        for bot_name, bot_config in slack_bots.items():
+            provider = bot_config.get("provider", bot_name)
+            self._bot_providers[bot_name] = provider
+            self._bot_slots[bot_name] = asyncio.Semaphore(
+                bot_config.get("max_concurrency", DEFAULT_BOT_CONCURRENCY)
+            )
+            if provider not in self._provider_slots:
+                self._provider_slots[provider] = asyncio.Semaphore(
+                    provider_limits.get(provider, DEFAULT_BOT_CONCURRENCY)
+                )
+
+    @asynccontextmanager
+    async def admit(self, bot_name, on_queued=None):
+        """
+        Holds a bot slot and a provider slot for the duration of the block.
+
+        Args:
+        bot_name (str): The bot the reply is generated for.
+        on_queued (callable): Awaited with the reply's 1-based position in the
+        queue it waits in, its bot's or else its provider's, if it has to wait
+        for a slot.
+        """
+        provider = self._bot_providers[bot_name]
+        bot_slot = self._bot_slots[bot_name]
+        provider_slot = self._provider_slots[provider]
+        enqueued_at = time.monotonic()
+
+        # Bot slots are taken first, so a reply waits for its bot before its
+        # provider.
+        if bot_slot.locked():
+            queue_key = ("bot", bot_name)
+        elif provider_slot.locked():
+            queue_key = ("provider", provider)
+        else:
+            queue_key = None
+        queued = queue_key is not None
+        if queued:
+            if self.depth >= self.max_depth:
+                metrics.counter("work_queue_rejected_total", bot=bot_name).inc()
+                raise ServiceBusyError(
+                    "I'm handling too many requests right now. Please try again in a few minutes."
+                )
+            self._enqueue(queue_key)
+            if on_queued:
+                try:
+                    await on_queued(self._queued[queue_key])
+                except Exception as e:
+                    logger.error(f"Failed to send queue position to user: {e}")
+
+        try:
+            async with bot_slot, provider_slot:
+                if queued:
+                    self._dequeue(queue_key)
+                    queued = False
+                metrics.histogram("work_queue_wait_seconds", bot=bot_name).observe(
+                    time.monotonic() - enqueued_at
+                )
+                active = metrics.gauge("work_queue_active", provider=provider)
+                active.inc()
+                try:
+                    with metrics.histogram(
+                        "work_queue_service_seconds", bot=bot_name
+                    ).time():
+                        yield
+                finally:
+                    active.dec()
+        finally:
+            if queued:
+                self._dequeue(queue_key)
+
+    def _enqueue(self, queue_key):
+        self.depth += 1
+        self._queued[queue_key] = self._queued.get(queue_key, 0) + 1
+        metrics.gauge("work_queue_depth").set(self.depth)
+
+    def _dequeue(self, queue_key):
+        self.depth -= 1
+        self._queued[queue_key] -= 1
+        if not self._queued[queue_key]:
+            del self._queued[queue_key]
+        metrics.gauge("work_queue_depth").set(self.depth)
+
+
+work_queue = WorkQueue(SLACK_BOTS, PROVIDER_CONCURRENCY_LIMITS, WORK_QUEUE_MAX_DEPTH)
@@ -0,0 +1,197 @@
+import asyncio
+import multiprocessing
+import queue
+import signal
+import time
+from app.config import (
+    SLACK_BOTS,
+    WORKER_RESTART_MAX_BACKOFF,
+    METRICS_REPORT_INTERVAL,
+    logger,
+)
+from app.utils.metrics import metrics, merge_snapshots
+
+# A worker that stays up this long is considered healthy again, so its next crash
+# restarts it without the accumulated backoff.
+HEALTHY_UPTIME_SECONDS = 60
+
+
+def parse_bot_groups(spec, bot_names):
+    """
+    Turns a BOT_PROCESS_GROUPS value into a list of bot name groups.
+
+    Args:
+    spec (str): "per_bot", or ";"-separated groups of ","-separated bot names.
+    bot_names (list): The configured bots.
+
+    Returns:
+    list: One list of bot names per worker process.
+    """
+    if spec.strip() == "per_bot":
+        return [[bot_name] for bot_name in bot_names]
+
+    groups = []
+    assigned = set()
+    for group_spec in spec.split(";"):
+        group = [name.strip() for name in group_spec.split(",") if name.strip()]
+        if not group:
+            continue
+        for bot_name in group:
+            if bot_name not in bot_names:
+                raise ValueError(f"Unknown bot in BOT_PROCESS_GROUPS: {bot_name}")
+            if bot_name in assigned:
+                raise ValueError(f"Bot {bot_name} is assigned to more than one group")
+            assigned.add(bot_name)
+        groups.append(group)
+
+    # Bots left out of the spec still need a process; give them one each.
+    groups.extend([bot_name] for bot_name in bot_names if bot_name not in assigned)
+    return groups
+
+
+def run_worker(worker_name, bot_names, metrics_queue, archive=False):
+    asyncio.run(worker_main(worker_name, bot_names, metrics_queue, archive))
+
+
+async def worker_main(worker_name, bot_names, metrics_queue, archive=False):
+    from app import create_app
+
+    main_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+    reporter = asyncio.create_task(report_metrics(worker_name, metrics_queue))
+    try:
+        # The supervisor already prepared the database.
+        await create_app(bot_names, prepare=False, archive=archive, log_metrics=False)
+    except asyncio.CancelledError:
+        logger.info(f"Worker {worker_name} shutting down")
+    finally:
+        reporter.cancel()
+        metrics_queue.put((worker_name, metrics.snapshot()))
+
+
+async def report_metrics(worker_name, metrics_queue):
+    while True:
+        await asyncio.sleep(METRICS_REPORT_INTERVAL)
+        metrics_queue.put((worker_name, metrics.snapshot()))
+
+
+class WorkerHandle:
+    def __init__(self, name, bot_names, archive=False):
+        self.name = name
+        self.bot_names = bot_names
+        self.archive = archive
+        self.process = None
+        self.started_at = None
+        self.restart_at = None
+        self.backoff = 1
+        self.restarts = 0
+
+
+class Supervisor:
+    """
+    Runs each group of bots in its own worker process and keeps them running.
+
+    Every worker has its own event loop, database pool and caches. Crashed
+    workers are restarted with exponential backoff, and the metric snapshots
+    workers send back are merged into `aggregated_metrics`. Only the first
+    worker runs archival.
+    """
+
+    def __init__(self, bot_groups, context=None, process_target=run_worker):
+        self.context = context or multiprocessing.get_context("spawn")
+        self.process_target = process_target
+        self.metrics_queue = self.context.Queue()
+        self.workers = [
+            WorkerHandle("+".join(group), group, archive=index == 0)
+            for index, group in enumerate(bot_groups)
+        ]
+        self.worker_metrics = {}
+        self.aggregated_metrics = {}
+        self._stopping = False
+
+    def start(self):
+        for worker in self.workers:
+            self.spawn(worker)
+
+    def spawn(self, worker):
+        worker.process = self.context.Process(
+            target=self.process_target,
+            args=(worker.name, worker.bot_names, self.metrics_queue, worker.archive),
+            name=f"slackbot-{worker.name}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        logger.info(f"Started worker {worker.name} (pid {worker.process.pid})")
+
+    def check_workers(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    worker.restarts += 1
+                    self.spawn(worker)
+                continue
+            if worker.process.is_alive():
+                continue
+
+            if now - worker.started_at >= HEALTHY_UPTIME_SECONDS:
+                worker.backoff = 1
+            logger.error(
+                f"Worker {worker.name} exited with code {worker.process.exitcode}, restarting in {worker.backoff}s"
+            )
+            worker.restart_at = now + worker.backoff
+            worker.backoff = min(worker.backoff * 2, WORKER_RESTART_MAX_BACKOFF)
+
+    def collect_metrics(self):
+        while True:
+            try:
+                worker_name, snapshot = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.worker_metrics[worker_name] = snapshot
+        self.aggregated_metrics = merge_snapshots(self.worker_metrics.values())
+        for worker in self.workers:
+            self.aggregated_metrics[
+                f"worker_restarts_total{{worker={worker.name}}}"
+            ] = worker.restarts
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        self.start()
+        next_report = time.monotonic() + METRICS_REPORT_INTERVAL
+        try:
+            while not self._stopping:
+                self.check_workers()
+                if time.monotonic() >= next_report:
+                    self.collect_metrics()
+                    logger.info(f"Aggregated worker metrics: {self.aggregated_metrics}")
+                    next_report = time.monotonic() + METRICS_REPORT_INTERVAL
+                time.sleep(1)
+        finally:
+            self.stop()
+
+    def request_stop(self, signum=None, frame=None):
+        self._stopping = True
+
+    def stop(self, timeout=30):
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.kill()
+        logger.info("All workers stopped")
+
+
+def run_supervisor(bot_groups_spec):
+    from app import prepare_database
+
+    bot_groups = parse_bot_groups(bot_groups_spec, list(SLACK_BOTS))
+    # Once, before any worker starts, so workers never migrate or backfill
+    # the same database at the same time.
+    asyncio.run(prepare_database(list(SLACK_BOTS)))
+    Supervisor(bot_groups).run()
@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import struct
+from functools import partial
+from app.config import ARTIFACT_STORE_DIR, ARTIFACT_STORE_BYTES, logger
+from app.database.dao import get_file_artifact, save_file_artifact
+from app.utils.cache import DiskCache
+from app.utils.metrics import metrics
+
+# Bump a transform's version whenever its output changes, so artifacts made by
+# older code are recomputed instead of reused.
+TRANSFORM_VERSIONS = {
+    "pdf_content": 2,
+    "video_frames": 1,
+    "png": 1,
+    "transcript": 1,
+}
+
+HEADER_SIZE = struct.Struct(">I")
+
+
+def artifact_key(source, transform, params=None):
+    """
+    Returns the key of what `transform` at its current version makes from
+    `source` with `params`.
+    """
+    description = [source, transform, TRANSFORM_VERSIONS[transform], params or {}]
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def pack_blobs(metadata, blobs):
+    header = json.dumps(
+        {"metadata": metadata, "sizes": [len(blob) for blob in blobs]}
+    ).encode()
+    return b"".join([HEADER_SIZE.pack(len(header)), header, *blobs])
+
+
+def unpack_blobs(content):
+    (header_size,) = HEADER_SIZE.unpack_from(content)
+    offset = HEADER_SIZE.size + header_size
+    header = json.loads(content[HEADER_SIZE.size : offset])
+    blobs = []
+    for size in header["sizes"]:
+        blobs.append(content[offset : offset + size])
+        offset += size
+    return header["metadata"], blobs
+
+
+class ArtifactStore:
+    """
+    Keeps what the bots derive from attachments, so old files in a thread are
+    not rendered, converted or transcribed again on every turn.
+
+    Artifacts are keyed by (Slack file id, transform, version, parameters). Lists
+    of images go to a disk blob store bounded in bytes; small JSON values, such
+    as transcripts, go to the file's row in `File.properties`. Concurrent
+    requests for the same artifact wait on a single computation.
+
+    Args:
+    directory (str): Where the blob store keeps its files.
+    max_bytes (int): The most bytes kept in the blob store, or 0 to turn it off.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self._blobs = DiskCache(directory, max_bytes) if max_bytes > 0 else None
+        self._pending = {}
+
+    async def get_blobs(self, slack_file_id, transform, params, compute):
+        """
+        Returns a stored list of blobs, calling `compute` when there is none.
+
+        Args:
+        slack_file_id (str): The source file, or None to compute without storing.
+        transform (str): A key of TRANSFORM_VERSIONS.
+        params (dict): The parameters the output depends on.
+        compute (callable): Coroutine function returning (metadata, blobs), where
+            metadata is JSON-serializable and blobs is a list of bytes.
+
+        Returns:
+        tuple: (metadata, blobs).
+        """
+        if slack_file_id is None or self._blobs is None:
+            return await compute()
+        key = artifact_key(slack_file_id, transform, params)
+        return await self._once(key, partial(self._load_blobs, key, transform, compute))
+
+    async def stream_blobs(self, slack_file_id, transform, params, compute):
+        """
+        Yields a stored list of (metadata, blob) items, streaming them from
+        `compute` when there is none and storing them once it is done.
+
+        Args:
+        slack_file_id (str): The source file, or None to compute without storing.
+        transform (str): A key of TRANSFORM_VERSIONS.
+        params (dict): The parameters the output depends on.
+        compute (callable): Async generator function yielding (metadata, blob)
+            items, where metadata is JSON-serializable and blob is bytes.
+
+        Yields:
+        tuple: (metadata, blob) for each item, in order.
+        """
+        if slack_file_id is None or self._blobs is None:
+            async for item in compute():
+                yield item
+            return
+        key = artifact_key(slack_file_id, transform, params)
+        if key in self._pending:
+            # Another request is computing it; take its items once it is done.
+            for item in await asyncio.shield(self._pending[key]):
+                yield item
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        # Requests that find this future pending retrieve its exception.
+        done.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._pending[key] = done
+        try:
+            content = await self._read_blobs(key)
+            if content is not None:
+                record_request(transform, "hit")
+                items = list(zip(*unpack_blobs(content)))
+                done.set_result(items)
+            else:
+                record_request(transform, "miss")
+                items = []
+                async for item in compute():
+                    items.append(item)
+                    yield item
+                done.set_result(items)
+                metadata = [item_metadata for item_metadata, _ in items]
+                blobs = [blob for _, blob in items]
+                await self._write_blobs(key, pack_blobs(metadata, blobs))
+                return
+        except BaseException as e:
+            if not done.done():
+                done.set_exception(
+                    e
+                    if isinstance(e, Exception)
+                    else RuntimeError(f"Computing {transform} was abandoned")
+                )
+            raise
+        finally:
+            self._pending.pop(key, None)
+        for item in items:
+            yield item
+
+    async def get_value(self, slack_file_id, transform, params, compute):
+        """
+        Returns a value stored with the file's row, calling `compute` when there
+        is none. The value must be JSON-serializable.
+        """
+        if slack_file_id is None:
+            return await compute()
+        key = artifact_key(slack_file_id, transform, params)
+        return await self._once(
+            key, partial(self._load_value, key, slack_file_id, transform, compute)
+        )
+
+    async def _once(self, key, load):
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+        task = asyncio.ensure_future(load())
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+        self._pending[key] = task
+        return await asyncio.shield(task)
+
+    async def _load_blobs(self, key, transform, compute):
+        content = await self._read_blobs(key)
+        if content is not None:
+            record_request(transform, "hit")
+            return unpack_blobs(content)
+        record_request(transform, "miss")
+        metadata, blobs = await compute()
+        await self._write_blobs(key, pack_blobs(metadata, blobs))
+        return metadata, blobs
+
+    async def _read_blobs(self, key):
+        try:
+            return await asyncio.to_thread(self._blobs.get, key)
+        except OSError as e:
+            logger.warning(f"Artifact store read failed: {e}")
+            return None
+
+    async def _write_blobs(self, key, content):
+        try:
+            await asyncio.to_thread(self._blobs.set, key, content)
+        except OSError as e:
+            logger.warning(f"Artifact store write failed: {e}")
+        metrics.gauge("artifact_store_bytes").set(self._blobs.currsize)
+
+    async def _load_value(self, key, slack_file_id, transform, compute):
+        value = await get_file_artifact(slack_file_id, key)
+        if value is not None:
+            record_request(transform, "hit")
+            return value
+        record_request(transform, "miss")
+        value = await compute()
+        await save_file_artifact(slack_file_id, key, transform, value)
+        return value
+
+
+def record_request(transform, result):
+    metrics.counter(
+        "artifact_store_requests_total", transform=transform, result=result
+    ).inc()
+
+
+artifact_store = ArtifactStore(
+    directory=ARTIFACT_STORE_DIR, max_bytes=ARTIFACT_STORE_BYTES
+)
@@ -0,0 +1,215 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    An in-process LRU cache with an optional time-to-live per entry.
+
+    Lookups, inserts and evictions are O(1). Entries older than `ttl` seconds are
+    treated as absent and dropped when touched; once `maxsize` entries are held,
+    the least recently used entry is evicted to make room for a new one. With
+    `getsizeof`, `maxsize` bounds the summed size of the entries instead, and a
+    value larger than `maxsize` is not cached at all.
+
+    Args:
+    maxsize (int): The maximum number of entries (or total size) held at once.
+    ttl (float): Seconds an entry stays valid after it is written, or None to never expire.
+    timer (callable): Monotonic clock used for expiry, overridable in tests.
+    getsizeof (callable): Returns the size of a value, e.g. `len` for bytes.
+    """
+
+    def __init__(self, maxsize, ttl=None, timer=time.monotonic, getsizeof=None):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be a positive integer")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.getsizeof = getsizeof
+        self.currsize = 0
+        self._entries = OrderedDict()
+        # Keys by expiry time. Every entry lives for the same ttl, so this is
+        # the order they were written in.
+        self._expiry_order = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self._lookup(key, touch=False) is not _MISSING
+
+    def get(self, key, default=None):
+        value = self._lookup(key, touch=True)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if key in self._entries:
+            self._remove(key)
+        size = self.getsizeof(value) if self.getsizeof else 1
+        if size > self.maxsize:
+            return
+        self._purge_expired()
+        while self._entries and self.currsize + size > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        expires_at = self.timer() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires_at, value, size)
+        if expires_at is not None:
+            self._expiry_order[key] = expires_at
+        self.currsize += size
+
+    def pop(self, key, default=None):
+        if key not in self._entries:
+            return default
+        entry = self._remove(key)
+        if self._is_expired(entry):
+            return default
+        return entry[1]
+
+    def check_and_add(self, key):
+        """
+        Records `key` and reports whether it had already been seen within the TTL.
+
+        Returns:
+        bool: True if `key` was already present (a duplicate), False if it was just added.
+        """
+        if self._lookup(key, touch=False) is not _MISSING:
+            self.hits += 1
+            return True
+        self.misses += 1
+        self.set(key, None)
+        return False
+
+    def clear(self):
+        self._entries.clear()
+        self._expiry_order.clear()
+        self.currsize = 0
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "currsize": self.currsize,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _lookup(self, key, touch):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        if self._is_expired(entry):
+            self._remove(key)
+            self.expirations += 1
+            return _MISSING
+        if touch:
+            self._entries.move_to_end(key)
+        return entry[1]
+
+    def _is_expired(self, entry):
+        expires_at = entry[0]
+        return expires_at is not None and expires_at <= self.timer()
+
+    def _purge_expired(self):
+        # Reads move entries to the back of `_entries`, so expired ones are
+        # found through `_expiry_order` instead.
+        now = self.timer()
+        while self._expiry_order:
+            key, expires_at = next(iter(self._expiry_order.items()))
+            if expires_at > now:
+                break
+            self._remove(key)
+            self.expirations += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._expiry_order.pop(key, None)
+        self.currsize -= entry[2]
+        return entry
+
+
+class DiskCache:
+    """
+    A byte-string cache in a directory, one file per key named by a hash of it.
+
+    Files are written aside and renamed into place, read back through mmap, and
+    evicted oldest-used first once they add up to more than `max_bytes`. Several
+    processes may share the directory.
+
+    Args:
+    directory (str): Where the files are kept; created on first write.
+    max_bytes (int): The most bytes kept on disk.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.currsize = 0
+
+    def path(self, key):
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    content = b""
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                        content = view[:]
+        except FileNotFoundError:
+            return None
+        # The modification time doubles as the last use for eviction.
+        os.utime(path)
+        return content
+
+    def set(self, key, content):
+        if len(content) > self.max_bytes:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # Written aside and renamed so readers never see a partial file.
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.currsize = total
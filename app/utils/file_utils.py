@@ -1,28 +1,27 @@
-from pdf2image import convert_from_bytes
 import io
 import base64
 from app.config import *
-from pydub import AudioSegment
-from PIL import Image
 from app.exceptions import *
 from typing import *
 
 # import hashlib
-from app.LLM_clients.google_client import genai as google_client
-import cv2
-import io
+# pydub, PIL, cv2 and the Google client are imported inside the
+# functions that need them, so bots that never touch media don't pay for them.
 from typing import List, Tuple
 import tempfile
 import pathlib
 import aiofiles
 
-# import asyncio
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
 
 # import aiohttp
 # import uuid
 # import json
 import traceback
+import pypdf
+from app.utils.artifact_store import artifact_store
+from app.utils.pdf_renderer import pdf_renderer
+from app.utils.pdf_text_layer import page_text
 
 
 async def get_image_pixel_count(image_bytes):
@@ -35,70 +34,90 @@ async def get_image_pixel_count(image_bytes):
     Returns:
     int: The total number of pixels in the image.
     """
+    from PIL import Image
+
     with Image.open(io.BytesIO(image_bytes)) as img:
         width, height = img.size
         return width * height
 
 
-async def pdf_to_images(
-    pdf_bytes: bytes, slack_file_id: str, max_width: int = 1024, max_height: int = 1024
-) -> Tuple[str, List[bytes], int]:
-    try:
-        total_pixels = 0
-        with tempfile.TemporaryDirectory() as temp_dir:
-            with ProcessPoolExecutor() as process_executor:
-                future = process_executor.submit(
-                    convert_from_bytes, pdf_bytes, output_folder=temp_dir, fmt="jpeg"
-                )
-                images = future.result()
-
-            with ThreadPoolExecutor() as thread_executor:
-                resize_tasks = []
-                for image in images:
-                    task = thread_executor.submit(
-                        resize_image, image, max_width, max_height
-                    )
-                    resize_tasks.append(task)
-
-                images_bytes = []
-                for task in resize_tasks:
-                    image_bytes, pixel_count = task.result()
-                    images_bytes.append(image_bytes)
-                    total_pixels += pixel_count
-
-        del pdf_bytes
-        # image_count = len(images_bytes)
-
-        # await update_file(
-        #     slack_file_id, image_count=image_count, pixel_count=total_pixels
-        # )
-
-        return "jpeg", images_bytes, pixel_count
-    except Exception as e:
-        logger.error(f"Error converting PDF to images: {e}\n{traceback.format_exc()}")
-        raise PDFToImageConversionError(
-            "We encountered an issue while preparing your using your PDF. Please ensure your PDF is not corrupted and try again."
-        )
-
-
-def resize_image(image, max_width, max_height):
-    original_width, original_height = image.size
-    ratio = min(max_width / original_width, max_height / original_height)
-    new_width = int(original_width * ratio)
-    new_height = int(original_height * ratio)
-
-    image = image.resize((new_width, new_height))
+async def pdf_to_pages(
+    pdf_bytes: bytes,
+    slack_file_id: str = None,
+    max_width: int = 1024,
+    max_height: int = 1024,
+    pdf_reader=None,
+    text_layer: bool = None,
+) -> AsyncIterator[Tuple[int, Optional[str], Optional[bytes], int]]:
+    """
+    Reads each page of a PDF from its text layer where that is good enough, and
+    renders the rest (scanned pages and pages with figures) as JPEGs.
 
-    if image.size[0] * image.size[1] > Image.MAX_IMAGE_PIXELS:
-        logger.error("Image size exceeds the default PIL pixel limit.")
-        raise PDFToImageConversionError(
-            "Image size exceeds the default safe limit and could be a decompression bomb."
-        )
+    Args:
+    pdf_bytes (bytes): The PDF.
+    slack_file_id (str): The Slack file, so the pages are kept for later turns.
+    pdf_reader (pypdf.PdfReader): The PDF already parsed, to avoid parsing it again.
+    text_layer (bool): Whether to use the text layer; PDF_TEXT_LAYER by default.
+
+    Yields:
+    tuple: (page_number, text, image_bytes, pixel_count) for each page in order,
+    with either text or image_bytes set, as soon as the page is ready.
+    """
+    if text_layer is None:
+        text_layer = PDF_TEXT_LAYER
+
+    async def extract():
+        try:
+            reader = pdf_reader or pypdf.PdfReader(io.BytesIO(pdf_bytes))
+            if text_layer:
+                texts = await asyncio.to_thread(
+                    lambda: [page_text(page) for page in reader.pages]
+                )
+            else:
+                texts = [None] * len(reader.pages)
+            rendered_pages = [
+                page_number
+                for page_number, text in enumerate(texts, start=1)
+                if text is None
+            ]
+            renders = pdf_renderer.pages(
+                pdf_bytes, reader, max_width, max_height, rendered_pages
+            )
+            try:
+                for page_number, text in enumerate(texts, start=1):
+                    if text is not None:
+                        yield {"page": page_number, "text": text, "pixel_count": 0}, b""
+                        continue
+                    image_bytes, pixel_count = await renders.__anext__()
+                    yield {"page": page_number, "pixel_count": pixel_count}, image_bytes
+            finally:
+                # Stops the renders still running if the pages are not all read.
+                await renders.aclose()
+        except Exception as e:
+            logger.error(
+                f"Error converting PDF to images: {e}\n{traceback.format_exc()}"
+            )
+            raise PDFToImageConversionError(
+                "We encountered an issue while preparing your using your PDF. Please ensure your PDF is not corrupted and try again."
+            )
 
-    buffer = io.BytesIO()
-    image.save(buffer, format="JPEG")
-    pixel_count = new_width * new_height
-    return buffer.getvalue(), pixel_count
+    pages = artifact_store.stream_blobs(
+        slack_file_id,
+        "pdf_content",
+        {
+            "max_width": max_width,
+            "max_height": max_height,
+            "text_layer": text_layer,
+            "min_chars": PDF_TEXT_MIN_CHARS,
+            "figure_min_pixels": PDF_FIGURE_MIN_PIXELS,
+        },
+        extract,
+    )
+    async for page, image_bytes in pages:
+        if "text" in page:
+            yield page["page"], page["text"], None, 0
+        else:
+            yield page["page"], None, image_bytes, page["pixel_count"]
 
 
 async def image_bytes_to_base64(image_bytes: bytes) -> str:
@@ -125,6 +144,8 @@ async def base64_to_image_bytes(base64_string: str) -> bytes:
 
 
 async def convert_audio_to_mp3(file_type, file_bytes):
+    from pydub import AudioSegment
+
     if not isinstance(file_bytes, bytes):
         raise TypeError("file_bytes must be of type bytes")
     try:
@@ -143,7 +164,20 @@ async def convert_audio_to_mp3(file_type, file_bytes):
         raise e
 
 
-async def convert_image_to_png(file_type, file_bytes):
+async def convert_image_to_png(file_type, file_bytes, slack_file_id=None):
+    async def convert():
+        converted_file_type, png_bytes = await image_to_png(file_type, file_bytes)
+        return {"file_type": converted_file_type}, [png_bytes]
+
+    metadata, (png_bytes,) = await artifact_store.get_blobs(
+        slack_file_id, "png", None, convert
+    )
+    return metadata["file_type"], png_bytes
+
+
+async def image_to_png(file_type, file_bytes):
+    from PIL import Image
+
     try:
         # Ensure file_bytes is a file-like object
         if isinstance(file_bytes, bytes):
@@ -175,6 +209,8 @@ def get_mime_type_from_mapping(file_type, media_display_type):
 
 
 async def google_upload(file_bytes: bytes, file_type: str) -> str:
+    from app.LLM_clients.google_client import genai as google_client
+
     try:
         # Create a temporary file to save the bytes with the file_type as the suffix
         async with aiofiles.tempfile.NamedTemporaryFile(
@@ -312,7 +348,41 @@ async def extract_frames_from_video_bytes(
     file_type: str,
     frames_per_second: int = 1,
     image_format: str = ".jpg",
+    slack_file_id: str = None,
 ) -> Tuple[List[Tuple[bytes, str, str]], int]:
+    async def extract():
+        frames_data, total_pixel_count = await extract_video_frames(
+            video_bytes, file_type, frames_per_second, image_format
+        )
+        metadata = {
+            "frames": [[timestamp, format] for _, timestamp, format in frames_data],
+            "total_pixel_count": total_pixel_count,
+        }
+        return metadata, [image_bytes for image_bytes, _, _ in frames_data]
+
+    metadata, frames_bytes = await artifact_store.get_blobs(
+        slack_file_id,
+        "video_frames",
+        {
+            "frames_per_second": frames_per_second,
+            "image_format": image_format,
+            # Cached frames must not outlive a lower duration limit.
+            "max_duration": VIDEO_PROCESSING_DURATION_LIMIT,
+        },
+        extract,
+    )
+    frames_data = [
+        (image_bytes, timestamp, format)
+        for image_bytes, (timestamp, format) in zip(frames_bytes, metadata["frames"])
+    ]
+    return frames_data, metadata["total_pixel_count"]
+
+
+async def extract_video_frames(
+    video_bytes: bytes, file_type: str, frames_per_second: int, image_format: str
+) -> Tuple[List[Tuple[bytes, str, str]], int]:
+    import cv2
+
     try:
         # Create a temporary file to write video bytes
         with tempfile.NamedTemporaryFile(
@@ -393,6 +463,8 @@ async def get_audio_length(audio_bytes: bytes, file_type: str) -> float:
     Returns:
         float: The length of the audio in seconds, rounded to two decimal places.
     """
+    from pydub import AudioSegment
+
     try:
         # Create a file-like object from bytes
         audio_file = io.BytesIO(audio_bytes)
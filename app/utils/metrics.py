@@ -0,0 +1,160 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start)
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(
+            self.buckets + (float("inf"),), self.bucket_counts
+        ):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class MetricsRegistry:
+    """
+    Process-local registry of counters, gauges and histograms.
+
+    Metrics are identified by a name plus keyword labels, e.g.
+    `metrics.histogram("work_queue_wait_seconds", bot="chatgpt")`, and are created
+    on first use.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, **labels):
+        return self._get_or_create(Counter, name, labels)
+
+    def gauge(self, name, **labels):
+        return self._get_or_create(Gauge, name, labels)
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get_or_create(Histogram, name, labels, buckets=buckets)
+
+    def snapshot(self):
+        return {
+            format_metric_key(name, labels): metric.snapshot()
+            for (name, labels), metric in self._metrics.items()
+        }
+
+    def clear(self):
+        self._metrics.clear()
+
+    def _get_or_create(self, metric_class, name, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = metric_class(**kwargs)
+            self._metrics[key] = metric
+        elif not isinstance(metric, metric_class):
+            raise TypeError(f"Metric {name} is already registered as another type")
+        return metric
+
+
+def format_metric_key(name, labels):
+    if not labels:
+        return name
+    label_text = ",".join(f"{key}={value}" for key, value in labels)
+    return f"{name}{{{label_text}}}"
+
+
+def merge_snapshots(snapshots):
+    """
+    Sums metric snapshots from several processes into one.
+
+    Counters and gauges are added together; histograms have their counts, sums
+    and buckets added bucket by bucket.
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if key not in merged:
+                merged[key] = (
+                    {**value, "buckets": dict(value["buckets"])}
+                    if isinstance(value, dict)
+                    else value
+                )
+            elif isinstance(value, dict):
+                merged_value = merged[key]
+                merged_value["count"] += value["count"]
+                merged_value["sum"] += value["sum"]
+                for bound, bucket_count in value["buckets"].items():
+                    merged_value["buckets"][bound] = (
+                        merged_value["buckets"].get(bound, 0) + bucket_count
+                    )
+            else:
+                merged[key] += value
+    return merged
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,175 @@
+import asyncio
+import io
+import os
+import tempfile
+import pypdf
+from app.config import (
+    PDFTOPPM_PATH,
+    PDF_RENDER_BATCH_PAGES,
+    PDF_RENDER_CONCURRENCY,
+    PDF_RENDER_TIMEOUT,
+)
+from app.utils.metrics import metrics
+
+
+def page_size(page, max_width, max_height):
+    """
+    Returns the pixel size a page is rendered at: the largest that fits in
+    max_width x max_height and keeps the page's aspect ratio.
+    """
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    if page.rotation % 180 == 90:
+        width, height = height, width
+    ratio = min(max_width / width, max_height / height)
+    return max(int(width * ratio), 1), max(int(height * ratio), 1)
+
+
+def page_batches(page_numbers, sizes, batch_pages):
+    """
+    Groups pages into runs of consecutive pages with the same target size, of at
+    most `batch_pages` pages each, since one pdftoppm run renders a page range
+    at one size.
+
+    Returns:
+    list: A (first_page, last_page, (width, height)) tuple per batch.
+    """
+    batches = []
+    for page_number, size in zip(page_numbers, sizes):
+        if batches:
+            first, last, batch_size = batches[-1]
+            if (
+                page_number == last + 1
+                and size == batch_size
+                and page_number - first < batch_pages
+            ):
+                batches[-1] = (first, page_number, size)
+                continue
+        batches.append((page_number, page_number, size))
+    return batches
+
+
+def read_pages(output_dir, page_count):
+    # pdftoppm names its output <root>-<page>.jpg, zero-padding the page number.
+    names = sorted(
+        os.listdir(output_dir),
+        key=lambda name: int(os.path.splitext(name)[0].rsplit("-", 1)[1]),
+    )
+    if len(names) != page_count:
+        raise RuntimeError(f"pdftoppm wrote {len(names)} of {page_count} pages")
+    pages = []
+    for name in names:
+        with open(os.path.join(output_dir, name), "rb") as page_file:
+            pages.append(page_file.read())
+    return pages
+
+
+class PdfRenderer:
+    """
+    Renders PDF pages to JPEG with poppler's `pdftoppm`.
+
+    Pages are rendered straight at their target size, in batches of consecutive
+    pages that one subprocess renders after parsing the PDF once. At most
+    `concurrency` batches run at once across the process so a large PDF cannot
+    starve other requests. Nothing runs on the event loop but the waiting.
+    """
+
+    def __init__(self, concurrency, batch_pages=PDF_RENDER_BATCH_PAGES):
+        self.concurrency = concurrency
+        self.batch_pages = batch_pages
+        self._slots = (None, None)
+
+    def slots(self):
+        loop = asyncio.get_running_loop()
+        slots_loop, slots = self._slots
+        if slots_loop is not loop:
+            slots = asyncio.Semaphore(self.concurrency)
+            self._slots = (loop, slots)
+        return slots
+
+    async def render_batch(self, path, first_page, last_page, width, height):
+        """Returns the JPEGs of pages first_page to last_page, in order."""
+        page_count = last_page - first_page + 1
+        async with self.slots():
+            with metrics.histogram("pdf_render_batch_seconds").time():
+                with tempfile.TemporaryDirectory() as output_dir:
+                    process = await asyncio.create_subprocess_exec(
+                        PDFTOPPM_PATH,
+                        "-jpeg",
+                        "-f",
+                        str(first_page),
+                        "-l",
+                        str(last_page),
+                        "-scale-to-x",
+                        str(width),
+                        "-scale-to-y",
+                        str(height),
+                        path,
+                        os.path.join(output_dir, "page"),
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.PIPE,
+                    )
+                    try:
+                        _, error = await asyncio.wait_for(
+                            process.communicate(), PDF_RENDER_TIMEOUT * page_count
+                        )
+                    except BaseException:
+                        process.kill()
+                        await process.wait()
+                        raise
+                    if process.returncode != 0:
+                        raise RuntimeError(
+                            f"pdftoppm failed on pages {first_page}-{last_page}: {error.decode(errors='replace')}"
+                        )
+                    return await asyncio.to_thread(read_pages, output_dir, page_count)
+
+    async def pages(
+        self,
+        pdf_bytes,
+        pdf_reader=None,
+        max_width=1024,
+        max_height=1024,
+        page_numbers=None,
+    ):
+        """
+        Renders the pages of a PDF, yielding them in order as they are ready.
+
+        Args:
+        pdf_bytes (bytes): The PDF.
+        pdf_reader (pypdf.PdfReader): The PDF already parsed, if the caller has it.
+        max_width (int): The widest a page may be rendered.
+        max_height (int): The tallest a page may be rendered.
+        page_numbers (list): The 1-based numbers of the pages to render, or None
+            for all of them.
+
+        Yields:
+        tuple: (jpeg_bytes, pixel_count) for each page.
+        """
+        if pdf_reader is None:
+            pdf_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+        if page_numbers is None:
+            page_numbers = range(1, len(pdf_reader.pages) + 1)
+        sizes = [
+            page_size(pdf_reader.pages[page_number - 1], max_width, max_height)
+            for page_number in page_numbers
+        ]
+        batches = page_batches(page_numbers, sizes, self.batch_pages)
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+            pdf_file.write(pdf_bytes)
+            pdf_file.flush()
+            renders = [
+                asyncio.ensure_future(
+                    self.render_batch(pdf_file.name, first, last, width, height)
+                )
+                for first, last, (width, height) in batches
+            ]
+            try:
+                for render, (_, _, (width, height)) in zip(renders, batches):
+                    for image_bytes in await render:
+                        yield image_bytes, width * height
+            finally:
+                for render in renders:
+                    render.cancel()
+                await asyncio.gather(*renders, return_exceptions=True)
+
+
+pdf_renderer = PdfRenderer(concurrency=PDF_RENDER_CONCURRENCY)
@@ -0,0 +1,68 @@
+from app.config import PDF_TEXT_MIN_CHARS, PDF_FIGURE_MIN_PIXELS, logger
+
+# Below this share of readable characters a text layer is taken to be garbled,
+# e.g. by a font without a usable ToUnicode map.
+MIN_READABLE_FRACTION = 0.95
+MAX_FORM_DEPTH = 5
+
+
+def count_figures(resources, depth=0):
+    """
+    Counts the raster images in a page's resources big enough to be figures
+    rather than logos or icons, looking inside form XObjects too.
+    """
+    if resources is None or depth > MAX_FORM_DEPTH:
+        return 0
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return 0
+    figures = 0
+    for xobject in xobjects.get_object().values():
+        xobject = xobject.get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            pixels = int(xobject.get("/Width", 0)) * int(xobject.get("/Height", 0))
+            if pixels >= PDF_FIGURE_MIN_PIXELS:
+                figures += 1
+        elif subtype == "/Form":
+            figures += count_figures(xobject.get("/Resources"), depth + 1)
+    return figures
+
+
+def readable_fraction(text):
+    characters = [character for character in text if not character.isspace()]
+    if not characters:
+        return 0
+    readable = sum(
+        1 for character in characters if character.isprintable() and character != "�"
+    )
+    return readable / len(characters)
+
+
+def page_text(page):
+    """
+    Returns a PDF page's text when its text layer can stand in for the page.
+
+    A page qualifies when it has at least PDF_TEXT_MIN_CHARS of readable text
+    and no figures. Scanned pages (no text layer, or one image behind OCR text),
+    pages with garbled text and pages with figures return None and should be
+    rendered instead. Charts drawn with vector paths are not detected.
+
+    Args:
+    page (pypdf.PageObject): The page.
+
+    Returns:
+    str: The page's text, or None if the page should be rendered.
+    """
+    try:
+        if count_figures(page.get("/Resources")):
+            return None
+        text = page.extract_text()
+    except Exception as e:
+        logger.warning(f"Could not read the text layer of a PDF page: {e}")
+        return None
+    if len(text.strip()) < PDF_TEXT_MIN_CHARS:
+        return None
+    if readable_fraction(text) < MIN_READABLE_FRACTION:
+        return None
+    return text
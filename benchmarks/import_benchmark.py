@@ -0,0 +1,71 @@
+"""
+Measures import time and baseline memory for a worker process.
+
+Each scenario runs in a fresh interpreter, which imports what a worker imports at
+boot and then loads the given agents, and reports wall time and peak RSS. Compare
+"boot" with "boot + <bot>" to see what each bot costs a process that hosts it.
+
+Usage:
+    python benchmarks/import_benchmark.py [bot_name ...]
+
+The app's configuration is read as usual, so run it with the same environment
+(or .env file) the bots use.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIO_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app.slackbot.listeners
+from app.slackbot.message_handler import agent_manager
+boot_seconds = time.perf_counter() - start
+agent_manager.warm_up(sys.argv[1:] or [])
+total_seconds = time.perf_counter() - start
+heavy_modules = ["cv2", "pdf2image", "pydub", "PIL", "pypdf", "google.generativeai"]
+print(json.dumps({
+    "boot_seconds": boot_seconds,
+    "total_seconds": total_seconds,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [name for name in heavy_modules if name in sys.modules],
+}))
+"""
+
+
+def run_scenario(bot_names):
+    result = subprocess.run(
+        [sys.executable, "-c", SCENARIO_SCRIPT, *bot_names],
+        cwd=REPO_ROOT,
+        env={**os.environ, "PYTHONPATH": REPO_ROOT},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    sys.path.insert(0, REPO_ROOT)
+    from app.config import SLACK_BOTS
+
+    bot_names = sys.argv[1:] or list(SLACK_BOTS)
+    scenarios = [("boot", [])]
+    scenarios += [(f"boot + {bot_name}", [bot_name]) for bot_name in bot_names]
+    scenarios.append(("boot + all agents", bot_names))
+
+    print(f"{'scenario':<28}{'boot s':>8}{'total s':>9}{'RSS MB':>9}  heavy modules")
+    for name, scenario_bots in scenarios:
+        result = run_scenario(scenario_bots)
+        print(
+            f"{name:<28}{result['boot_seconds']:>8.2f}{result['total_seconds']:>9.2f}"
+            f"{result['max_rss_mb']:>9.1f}  {', '.join(result['heavy_modules']) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
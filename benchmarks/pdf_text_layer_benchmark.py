@@ -0,0 +1,174 @@
+"""
+Compares rendering every PDF page with the text-layer fast path.
+
+For each PDF in the corpus it runs `pdf_to_pages` without the text layer, which
+renders every page, and with it, which sends pages with a good text layer as
+text and renders only the rest. It reports how many pages were rendered, the payload a model
+request would carry (base64 for images, UTF-8 for text) and the wall time.
+
+Usage:
+    python benchmarks/pdf_text_layer_benchmark.py [pdf_dir]
+
+Without a directory it builds a small fixture corpus: a born-digital report, a
+slide deck where some slides carry figures, and a scan with no text layer.
+Rendering needs poppler's pdftoppm, as in the Docker image.
+"""
+
+import asyncio
+import io
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "revenue costs hiring plan quarter growth customers churn pricing market "
+    "product roadmap launch support margin forecast budget team region"
+).split()
+
+
+def add_page(writer, lines=0, image_size=None):
+    from pypdf.generic import DictionaryObject, NameObject, NumberObject, StreamObject
+
+    page = writer.add_blank_page(width=612, height=792)
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    resources = DictionaryObject(
+        {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+    )
+    content = []
+    if lines:
+        content.append("BT /F1 10 Tf 72 740 Td 12 TL")
+        for _ in range(lines):
+            line = " ".join(random.choice(WORDS) for _ in range(12)).capitalize()
+            content.append(f"({line}.) '")
+        content.append("ET")
+    if image_size:
+        width, height = image_size
+        image = StreamObject()
+        image.set_data(os.urandom(width * height))
+        image.update(
+            {
+                NameObject("/Type"): NameObject("/XObject"),
+                NameObject("/Subtype"): NameObject("/Image"),
+                NameObject("/Width"): NumberObject(width),
+                NameObject("/Height"): NumberObject(height),
+                NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+                NameObject("/BitsPerComponent"): NumberObject(8),
+            }
+        )
+        resources[NameObject("/XObject")] = DictionaryObject(
+            {NameObject("/Im1"): writer._add_object(image)}
+        )
+        top = 200 if lines else 36
+        content.append(f"q 468 0 0 {556 - top} 72 {top} cm /Im1 Do Q")
+    page[NameObject("/Resources")] = resources
+    contents = StreamObject()
+    contents.set_data("\n".join(content).encode("latin-1"))
+    page[NameObject("/Contents")] = writer._add_object(contents)
+
+
+def write_pdf(path, pages):
+    import pypdf
+
+    writer = pypdf.PdfWriter()
+    for page in pages:
+        add_page(writer, **page)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def build_corpus(directory):
+    random.seed(0)
+    write_pdf(os.path.join(directory, "report.pdf"), [{"lines": 50}] * 12)
+    write_pdf(
+        os.path.join(directory, "slides.pdf"),
+        [{"lines": 12}, {"lines": 10, "image_size": (600, 400)}] * 4,
+    )
+    write_pdf(os.path.join(directory, "scan.pdf"), [{"image_size": (850, 1100)}] * 5)
+
+
+def base64_size(size):
+    return 4 * math.ceil(size / 3)
+
+
+async def measure(path):
+    import pypdf
+    from app.utils.file_utils import pdf_to_pages
+
+    with open(path, "rb") as f:
+        pdf_bytes = f.read()
+
+    start = time.perf_counter()
+    render_all_bytes = 0
+    async for _, _, image_bytes, _ in pdf_to_pages(pdf_bytes, text_layer=False):
+        render_all_bytes += base64_size(len(image_bytes))
+    render_all_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pdf_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    pages = [page async for page in pdf_to_pages(pdf_bytes, pdf_reader=pdf_reader)]
+    text_layer_seconds = time.perf_counter() - start
+    text_layer_bytes = sum(
+        len(text.encode()) if text is not None else base64_size(len(image_bytes))
+        for _, text, image_bytes, _ in pages
+    )
+    rendered = sum(1 for _, text, _, _ in pages if text is None)
+    return (
+        len(pages),
+        rendered,
+        render_all_bytes,
+        text_layer_bytes,
+        render_all_seconds,
+        text_layer_seconds,
+    )
+
+
+async def run(directory):
+    print(
+        f"{'pdf':<16}{'pages':>6}{'rendered':>9}"
+        f"{'all KB':>10}{'text KB':>10}{'all s':>8}{'text s':>8}"
+    )
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        pages, rendered, all_bytes, text_bytes, all_seconds, text_seconds = (
+            await measure(os.path.join(directory, name))
+        )
+        print(
+            f"{name[:15]:<16}{pages:>6}{rendered:>9}"
+            f"{all_bytes / 1024:>10.0f}{text_bytes / 1024:>10.0f}"
+            f"{all_seconds:>8.2f}{text_seconds:>8.2f}"
+        )
+
+
+def main():
+    sys.path.insert(0, REPO_ROOT)
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.CRITICAL)
+    from app.config import PDFTOPPM_PATH
+
+    if not shutil.which(PDFTOPPM_PATH):
+        sys.exit(f"{PDFTOPPM_PATH} not found; install poppler-utils")
+    if len(sys.argv) > 1:
+        directory = sys.argv[1]
+    else:
+        directory = tempfile.mkdtemp()
+        build_corpus(directory)
+    asyncio.run(run(directory))
+
+
+if __name__ == "__main__":
+    main()
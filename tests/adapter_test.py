@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, patch
 from app.adapters.gpt_adapter import GPTAdapter
+from app.adapters.claude_adapter import ClaudeAdapter
 from app.objects import *
 
 
@@ -88,3 +89,26 @@ async def test_convert_message_with_files():
             result["content"][1]["image_url"]["url"]
             == "data:image/png;base64,ZmFrZV9pbWFnZV9kYXRh"
         )
+
+
+@pytest.mark.asyncio
+async def test_convert_message_labels_pdf_page_images():
+    # Setup: page 1 has a text layer, page 2 was rendered as an image
+    message = TransformedSlackMessage(
+        user_id="U456", bot_user_id="U123", message_ts="1.0"
+    )
+    message.add_text("PDF page 1:\nIntroduction\n")
+    message.add_file(ProcessedFile("jpeg", b"page_two", description="PDF page 2"))
+
+    # Execute
+    gpt_result = await GPTAdapter().convert_message(message)
+    claude_result = await ClaudeAdapter().convert_message(message, 0)
+
+    # Verify
+    for content, image_type in [
+        (gpt_result["content"], "image_url"),
+        (claude_result["content"], "image"),
+    ]:
+        assert [part["type"] for part in content] == ["text", "text", image_type]
+        assert content[0]["text"] == "PDF page 1:\nIntroduction\n"
+        assert content[1]["text"] == "PDF page 2"
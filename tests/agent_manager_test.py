@@ -0,0 +1,52 @@
+import importlib
+import threading
+import pytest
+from unittest.mock import patch
+from app.agents.agent_manager import AgentManager
+
+SLACK_BOTS = {
+    "first": {"agent": "collections.OrderedDict"},
+    "second": {"agent": "collections.Counter"},
+}
+
+
+def test_agents_are_created_on_first_use():
+    with patch("importlib.import_module", wraps=importlib.import_module) as mock_import:
+        agent_manager = AgentManager(SLACK_BOTS)
+        mock_import.assert_not_called()
+
+        agent = agent_manager.get_agent("first")
+        assert agent is agent_manager.get_agent("first")
+        assert mock_import.call_count == 1
+    assert "second" not in agent_manager.agents
+
+
+def test_unknown_bot_has_no_agent():
+    assert AgentManager(SLACK_BOTS).get_agent("missing") is None
+
+
+def test_warm_up_loads_requested_agents():
+    agent_manager = AgentManager(SLACK_BOTS)
+    agent_manager.warm_up([])
+    assert agent_manager.agents == {}
+    agent_manager.warm_up(["second"])
+    assert list(agent_manager.agents) == ["second"]
+    agent_manager.warm_up()
+    assert set(agent_manager.agents) == {"first", "second"}
+
+
+@pytest.mark.asyncio
+async def test_get_agent_async_imports_off_the_event_loop():
+    import_threads = []
+    real_import_module = importlib.import_module
+
+    def import_module(name):
+        import_threads.append(threading.current_thread())
+        return real_import_module(name)
+
+    agent_manager = AgentManager(SLACK_BOTS)
+    with patch("importlib.import_module", side_effect=import_module):
+        agent = await agent_manager.get_agent_async("first")
+        assert agent is await agent_manager.get_agent_async("first")
+    assert import_threads and threading.current_thread() not in import_threads
+    assert len(import_threads) == 1
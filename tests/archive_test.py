@@ -0,0 +1,126 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+import app
+from app import create_database_engine, create_tables, db
+from app.database import dao
+from app.database.archive import archive_old_conversations, archive_cutoff
+from app.database.identity_cache import identity_cache
+from app.database.models import (
+    Conversation,
+    Message,
+    File,
+    message_archive,
+    file_archive,
+    conversation_archive,
+)
+
+pytest.importorskip("aiosqlite")
+
+
+async def count(session, table):
+    return await session.scalar(db.select(db.func.count()).select_from(table))
+
+
+@pytest.mark.asyncio
+async def test_idle_conversations_move_to_archive_tables(tmp_path):
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+    try:
+        await create_tables(engine)
+        for thread_ts in ("1.000001", "2.000001"):
+            await dao.create_message(
+                "C1", thread_ts, "U1", "chatgpt", thread_ts, None, None, "hello"
+            )
+        await dao.create_file(
+            "1.000001", "png", slack_file_id="F1", mime_category="image"
+        )
+
+        now = datetime.utcnow()
+        old = archive_cutoff(now) - timedelta(days=1)
+        async with dao.session_scope() as session:
+            old_conversation = db.select(Conversation.id).filter(
+                Conversation.thread_ts == "1.000001"
+            )
+            await session.execute(
+                db.update(Conversation)
+                .where(Conversation.id.in_(old_conversation))
+                .values(created_at=old)
+            )
+            await session.execute(
+                db.update(Message)
+                .where(Message.conversation_id.in_(old_conversation))
+                .values(created_at=old)
+            )
+
+        assert await archive_old_conversations(now) == 1
+        assert await archive_old_conversations(now) == 0
+
+        async with app.async_session() as session:
+            assert await count(session, Message.__table__) == 1
+            assert await count(session, File.__table__) == 0
+            assert await count(session, message_archive) == 1
+            assert await count(session, file_archive) == 1
+            assert await count(session, conversation_archive) == 1
+        assert identity_cache.get_conversation_id("C1", "1.000001") is None
+        assert identity_cache.get_conversation_id("C1", "2.000001") is not None
+        assert await dao.get_thread_messages("C1", "1.000001") == []
+    finally:
+        identity_cache.clear()
+        await engine.dispose()
+        app.async_session = previous_session
+
+
+@pytest.mark.asyncio
+async def test_reused_ids_can_be_archived_again(tmp_path):
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+    try:
+        await create_tables(engine)
+        now = datetime.utcnow()
+        old = archive_cutoff(now) - timedelta(days=1)
+        archived_ids = []
+        for thread_ts in ("1.000001", "2.000001"):
+            await dao.create_message(
+                "C1", thread_ts, "U1", "chatgpt", thread_ts, None, None, "hello"
+            )
+            await dao.create_file(
+                thread_ts, "png", slack_file_id=f"F{thread_ts}", mime_category="image"
+            )
+            async with dao.session_scope() as session:
+                await session.execute(db.update(Conversation).values(created_at=old))
+                await session.execute(db.update(Message).values(created_at=old))
+                archived_ids.append(
+                    (
+                        await session.scalar(db.select(Conversation.id)),
+                        await session.scalar(db.select(Message.id)),
+                        await session.scalar(db.select(File.id)),
+                    )
+                )
+            assert await archive_old_conversations(now) == 1
+
+        # SQLite hands the ids of the archived rows out again.
+        assert archived_ids[0] == archived_ids[1]
+        async with app.async_session() as session:
+            assert await count(session, conversation_archive) == 2
+            assert await count(session, message_archive) == 2
+            assert await count(session, file_archive) == 2
+            thread_ts_values = await session.scalars(
+                db.select(conversation_archive.c.thread_ts).filter(
+                    conversation_archive.c.id == archived_ids[0][0]
+                )
+            )
+            assert len(thread_ts_values.all()) == 2
+    finally:
+        identity_cache.clear()
+        await engine.dispose()
+        app.async_session = previous_session
@@ -0,0 +1,171 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+import app
+from app import create_database_engine, create_tables
+from app.database import dao
+from app.database.identity_cache import identity_cache
+from app.utils import artifact_store as artifact_store_module
+from app.utils.artifact_store import ArtifactStore, pack_blobs, unpack_blobs
+from app.utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+class FakeTransform:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return self.result
+
+
+def requests(transform, result):
+    return metrics.snapshot().get(
+        f"artifact_store_requests_total{{result={result},transform={transform}}}", 0
+    )
+
+
+def test_blobs_round_trip():
+    metadata = {"file_type": "jpeg", "pixel_count": 3}
+    blobs = [b"first page", b"", b"third page"]
+    assert unpack_blobs(pack_blobs(metadata, blobs)) == (metadata, blobs)
+
+
+@pytest.mark.asyncio
+async def test_blobs_are_computed_once_and_kept_on_disk(tmp_path):
+    render = FakeTransform(({"file_type": "jpeg"}, [b"page 1", b"page 2"]))
+    store = ArtifactStore(directory=str(tmp_path), max_bytes=10000)
+    params = {"max_width": 1024}
+
+    results = await asyncio.gather(
+        store.get_blobs("F1", "video_frames", params, render),
+        store.get_blobs("F1", "video_frames", params, render),
+    )
+    # Another process sharing the directory finds it too.
+    restarted = ArtifactStore(directory=str(tmp_path), max_bytes=10000)
+    results.append(await restarted.get_blobs("F1", "video_frames", params, render))
+
+    assert results == [({"file_type": "jpeg"}, [b"page 1", b"page 2"])] * 3
+    assert render.calls == 1
+    assert requests("video_frames", "miss") == 1
+    assert requests("video_frames", "hit") == 1
+
+
+@pytest.mark.asyncio
+async def test_new_versions_and_parameters_are_recomputed(tmp_path):
+    render = FakeTransform(({}, [b"page"]))
+    store = ArtifactStore(directory=str(tmp_path), max_bytes=10000)
+
+    await store.get_blobs("F1", "video_frames", {"max_width": 1024}, render)
+    await store.get_blobs("F1", "video_frames", {"max_width": 512}, render)
+    with patch.dict(artifact_store_module.TRANSFORM_VERSIONS, {"video_frames": 2}):
+        await store.get_blobs("F1", "video_frames", {"max_width": 1024}, render)
+    assert render.calls == 3
+    # Files without an id are never stored.
+    await store.get_blobs(None, "video_frames", {"max_width": 1024}, render)
+    await store.get_blobs(None, "video_frames", {"max_width": 1024}, render)
+    assert render.calls == 5
+
+
+@pytest.mark.asyncio
+async def test_streamed_blobs_are_computed_once_and_kept_on_disk(tmp_path):
+    store = ArtifactStore(directory=str(tmp_path), max_bytes=10000)
+    params = {"max_width": 1024}
+    first_page_seen = asyncio.Event()
+    calls = []
+
+    async def render():
+        calls.append(1)
+        yield {"page": 1}, b"page 1"
+        # The first page reaches the reader before the second is computed.
+        await first_page_seen.wait()
+        yield {"page": 2}, b"page 2"
+
+    async def read(store):
+        items = []
+        async for item in store.stream_blobs("F1", "pdf_content", params, render):
+            items.append(item)
+            first_page_seen.set()
+        return items
+
+    results = await asyncio.gather(read(store), read(store))
+    restarted = ArtifactStore(directory=str(tmp_path), max_bytes=10000)
+    results.append(await read(restarted))
+
+    assert results == [[({"page": 1}, b"page 1"), ({"page": 2}, b"page 2")]] * 3
+    assert len(calls) == 1
+    assert requests("pdf_content", "miss") == 1
+    assert requests("pdf_content", "hit") == 1
+
+
+@pytest.mark.asyncio
+async def test_streams_that_fail_are_not_stored(tmp_path):
+    store = ArtifactStore(directory=str(tmp_path), max_bytes=10000)
+
+    async def broken():
+        yield {"page": 1}, b"page 1"
+        raise ValueError("bad page")
+
+    with pytest.raises(ValueError):
+        async for _ in store.stream_blobs("F1", "pdf_content", {}, broken):
+            pass
+
+    async def render():
+        yield {"page": 1}, b"fixed"
+
+    items = [item async for item in store.stream_blobs("F1", "pdf_content", {}, render)]
+    assert items == [({"page": 1}, b"fixed")]
+
+
+@pytest.mark.asyncio
+async def test_values_are_kept_in_file_properties(tmp_path):
+    pytest.importorskip("aiosqlite")
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+    store = ArtifactStore(directory=str(tmp_path / "artifacts"), max_bytes=0)
+    try:
+        await create_tables(engine)
+        await dao.create_message(
+            "C1", "1.000001", "U1", "chatgpt", "1.000001", None, None, "hi"
+        )
+        await dao.create_file(
+            "1.000001", "mp3", slack_file_id="F1", mime_category="audio"
+        )
+        await dao.update_file("F1", properties={"audio_duration_seconds": 5})
+
+        transcribe = FakeTransform("hello there")
+        params = {"model": "whisper-1"}
+        assert await store.get_value("F1", "transcript", params, transcribe) == (
+            "hello there"
+        )
+        assert await store.get_value("F1", "transcript", params, transcribe) == (
+            "hello there"
+        )
+        assert transcribe.calls == 1
+
+        retranscribe = FakeTransform("hello again")
+        await store.get_value("F1", "transcript", {"model": "whisper-2"}, retranscribe)
+        file = (await dao.get_files_by_message_ts("1.000001"))[0]
+        # One transcript per file, next to the properties already there.
+        assert file.properties["audio_duration_seconds"] == 5
+        assert [
+            artifact["value"] for artifact in file.properties["artifacts"].values()
+        ] == ["hello again"]
+    finally:
+        await engine.dispose()
+        app.async_session = previous_session
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import pytest
+from app.slackbot.attachment_cache import AttachmentCache
+from app.utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+class FakeDownload:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return self.content
+
+
+def requests_by_result():
+    snapshot = metrics.snapshot()
+    return {
+        result: snapshot.get(f"attachment_cache_requests_total{{result={result}}}", 0)
+        for result in ("memory", "disk", "miss")
+    }
+
+
+@pytest.mark.asyncio
+async def test_files_are_downloaded_once_across_callers(tmp_path):
+    cache = AttachmentCache(memory_bytes=100, directory=str(tmp_path), disk_bytes=100)
+    download = FakeDownload(b"pdf bytes")
+
+    results = await asyncio.gather(
+        cache.get("F1", 1700000000, download), cache.get("F1", 1700000000, download)
+    )
+    assert results == [b"pdf bytes", b"pdf bytes"]
+    assert await cache.get("F1", 1700000000, download) == b"pdf bytes"
+    assert download.calls == 1
+    assert requests_by_result() == {"memory": 1, "disk": 0, "miss": 1}
+    assert metrics.snapshot()["attachment_cache_bytes{tier=memory}"] == 9
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_serves_files_after_memory_eviction(tmp_path):
+    cache = AttachmentCache(memory_bytes=10, directory=str(tmp_path), disk_bytes=100)
+    first, second = FakeDownload(b"a" * 8), FakeDownload(b"b" * 8)
+
+    await cache.get("F1", 1, first)
+    await cache.get("F2", 2, second)
+    assert await cache.get("F1", 1, first) == b"a" * 8
+    assert first.calls == 1
+    assert requests_by_result() == {"memory": 0, "disk": 1, "miss": 2}
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_is_bounded_in_bytes(tmp_path):
+    cache = AttachmentCache(memory_bytes=0, directory=str(tmp_path), disk_bytes=20)
+
+    await cache.get("F0", 0, FakeDownload(b"x" * 8))
+    # Makes F0 the oldest whatever the filesystem's timestamp resolution.
+    for entry in os.scandir(tmp_path):
+        os.utime(entry.path, (0, 0))
+    await cache.get("F1", 1, FakeDownload(b"x" * 8))
+    await cache.get("F2", 2, FakeDownload(b"x" * 8))
+    assert len(os.listdir(tmp_path)) == 2
+    assert metrics.snapshot()["attachment_cache_bytes{tier=disk}"] == 16
+
+    download = FakeDownload(b"x" * 8)
+    await cache.get("F0", 0, download)
+    assert download.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_a_changed_file_is_a_new_entry(tmp_path):
+    cache = AttachmentCache(memory_bytes=100, directory=str(tmp_path), disk_bytes=100)
+    await cache.get("F1", 1, FakeDownload(b"old"))
+    assert await cache.get("F1", 2, FakeDownload(b"new")) == b"new"
@@ -0,0 +1,95 @@
+import pytest
+from app.utils.cache import LRUCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def timer():
+    return FakeTimer()
+
+
+def test_check_and_add_detects_duplicates(timer):
+    cache = LRUCache(maxsize=10, ttl=600, timer=timer)
+    assert cache.check_and_add(("123.456", "chatgpt")) is False
+    assert cache.check_and_add(("123.456", "chatgpt")) is True
+    assert cache.check_and_add(("123.456", "claude")) is False
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_entries_expire_after_ttl(timer):
+    cache = LRUCache(maxsize=10, ttl=600, timer=timer)
+    cache.check_and_add("event")
+    timer.now = 599
+    assert "event" in cache
+    timer.now = 600
+    assert "event" not in cache
+    assert cache.check_and_add("event") is False
+    assert cache.expirations == 1
+
+
+def test_size_cap_evicts_least_recently_used(timer):
+    cache = LRUCache(maxsize=2, ttl=None, timer=timer)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+    assert len(cache) == 2
+
+
+def test_expired_entries_are_purged_before_evicting(timer):
+    cache = LRUCache(maxsize=2, ttl=10, timer=timer)
+    cache.set("a", 1)
+    timer.now = 5
+    cache.set("b", 2)
+    timer.now = 11
+    cache.set("c", 3)
+    assert cache.evictions == 0
+    assert cache.expirations == 1
+    assert cache.get("b") == 2
+
+
+def test_recently_read_entries_still_expire(timer):
+    cache = LRUCache(maxsize=3, ttl=10, timer=timer)
+    cache.set("a", 1)
+    timer.now = 5
+    cache.set("b", 2)
+    timer.now = 6
+    assert cache.get("a") == 1  # "a" is now the most recently used
+    timer.now = 12
+    cache.set("c", 3)
+    assert cache.expirations == 1
+    assert len(cache) == 2
+    assert cache.get("b") == 2
+
+
+def test_pop_and_stats(timer):
+    cache = LRUCache(maxsize=2, ttl=None, timer=timer)
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a", "gone") == "gone"
+    assert cache.stats()["size"] == 0
+
+
+def test_getsizeof_bounds_total_size(timer):
+    cache = LRUCache(maxsize=10, timer=timer, getsizeof=len)
+    cache.set("a", b"1234")
+    cache.set("b", b"12345")
+    cache.set("c", b"123")  # 12 bytes would not fit, so "a" goes
+    assert "a" not in cache
+    assert cache.currsize == 8
+    cache.set("huge", b"x" * 11)
+    assert "huge" not in cache
+    assert cache.pop("b") == b"12345"
+    assert cache.currsize == 3
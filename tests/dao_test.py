@@ -0,0 +1,280 @@
+import pytest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.dialects import mysql
+from app.database import dao
+from app.database.identity_cache import (
+    IdentityCache,
+    _discard_pending,
+    _publish_pending,
+)
+from app.database.models import Message
+from app.database.types import normalize_ts
+
+
+class FakeSession:
+    bind = SimpleNamespace(dialect=mysql.dialect())
+
+    def __init__(self, results=(), rows=()):
+        self.scalar = AsyncMock(side_effect=list(results) + [None] * 10)
+        self.flush = AsyncMock()
+        self.added = []
+        self.statements = []
+        self.rows = list(rows)
+        self.sync_session = SimpleNamespace(info={})
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        rows = self.rows.pop(0) if self.rows else []
+        result = MagicMock()
+        result.all.return_value = rows
+        result.first.return_value = rows[0] if rows else None
+        return result
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    @asynccontextmanager
+    async def begin(self):
+        yield
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def warm_identity_cache(thread_ts="1.000001"):
+    cache = IdentityCache(10)
+    cache.remember_bot("chatgpt", 5)
+    cache.remember_conversation("C1", normalize_ts(thread_ts), 3)
+    cache.remember_link(3, 5)
+    return patch("app.database.dao.identity_cache", cache)
+
+
+class FakeSessionFactory:
+    def __init__(self, session):
+        self.session = session
+        self.opened = 0
+
+    def __call__(self):
+        self.opened += 1
+        return self.session
+
+
+@pytest.mark.asyncio
+async def test_create_message_with_warm_cache_only_inserts():
+    factory = FakeSessionFactory(FakeSession())
+    with patch("app.async_session", factory), warm_identity_cache():
+        message = await dao.create_message(
+            "C1", "1.000001", "U1", "chatgpt", "1.000001", None, None, "hello"
+        )
+
+    session = factory.session
+    assert factory.opened == 1
+    assert session.added == [message]
+    assert message.conversation_id == 3
+    # The duplicate check by ts, then the message_bot link and the usage rollup.
+    assert session.scalar.await_count == 1
+    insert_link, add_usage = session.statements
+    assert insert_link.compile().params["bot_id"] == 5
+    usage_params = add_usage.compile(dialect=mysql.dialect()).params
+    assert usage_params["user_id_m0"] == "U1"
+    assert usage_params["character_count_m0"] == 5
+
+
+@pytest.mark.asyncio
+async def test_calls_share_the_session_they_are_given():
+    existing = Message(id=4, sender_id="U1", message_ts="1.000001")
+    session = FakeSession(results=[existing])
+    with patch("app.async_session", None), warm_identity_cache():
+        async with dao.session_scope(session) as scoped_session:
+            message = await dao.create_message(
+                "C1",
+                "1.000001",
+                "U1",
+                "chatgpt",
+                "1.000001",
+                None,
+                None,
+                "hello",
+                session=scoped_session,
+            )
+
+    assert message is existing
+    assert session.added == []
+    (insert_link,) = session.statements
+    assert insert_link.compile().params == {"message_id": 4, "bot_id": 5}
+
+
+@pytest.mark.asyncio
+async def test_inserted_ids_are_cached_only_when_the_transaction_commits():
+    cache = IdentityCache(10)
+    # Neither row exists yet; each is re-read after its insert.
+    session = FakeSession(results=[None, 5, None, 3])
+    with patch("app.database.dao.identity_cache", cache):
+        bot_id = await dao.get_bot_id(session, "chatgpt")
+        conversation_id = await dao.get_conversation_id(session, bot_id, "C1", "1.1")
+
+    assert (bot_id, conversation_id) == (5, 3)
+    assert cache.get_bot_id("chatgpt") is None
+    assert cache.get_conversation_id("C1", "1.100000") is None
+
+    _publish_pending(session.sync_session)
+    assert cache.get_bot_id("chatgpt") == 5
+    assert cache.get_conversation_id("C1", "1.100000") == 3
+    assert cache.is_linked(3, 5)
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_inserts_are_not_cached():
+    cache = IdentityCache(10)
+    session = FakeSession(results=[None, 5])
+    with patch("app.database.dao.identity_cache", cache):
+        await dao.get_bot_id(session, "chatgpt")
+
+    _discard_pending(session.sync_session)
+    _publish_pending(session.sync_session)
+    assert cache.get_bot_id("chatgpt") is None
+
+
+@pytest.mark.asyncio
+async def test_existing_rows_are_cached_right_away():
+    cache = IdentityCache(10)
+    session = FakeSession(results=[5])
+    with patch("app.database.dao.identity_cache", cache):
+        await dao.get_bot_id(session, "chatgpt")
+
+    assert cache.get_bot_id("chatgpt") == 5
+    assert session.statements == []
+
+
+@pytest.mark.asyncio
+async def test_create_file_skips_message_lookup_when_id_is_known():
+    session = FakeSession()
+    file = await dao.create_file(
+        "1.000001", "png", slack_file_id="F1", message_id=7, session=session
+    )
+
+    assert file.message_id == 7
+    # Only the duplicate check by Slack file ID.
+    assert session.scalar.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_save_thread_messages_inserts_only_new_messages():
+    session = FakeSession(
+        rows=[
+            [("1.000100", 1, 5)],
+            None,
+            [("1.000200", 2, None)],
+        ],
+    )
+    file = {"file_type": "png", "size": 1, "mime_category": "image"}
+    messages = [
+        {"sender_id": "U1", "message_ts": "1.0001", "text": "hi", "files": []},
+        {"sender_id": "U1", "message_ts": "1.000200", "text": "yo", "files": [file]},
+    ]
+
+    with warm_identity_cache("1.000100"):
+        inserted = await dao.save_thread_messages(
+            "chatgpt", "C1", "1.000100", messages, session=session
+        )
+
+    assert inserted == 1
+    (
+        select_stored,
+        insert_messages,
+        select_new,
+        insert_links,
+        insert_files,
+        add_usage,
+    ) = session.statements
+    compiled = insert_messages.compile(dialect=mysql.dialect())
+    assert "ON DUPLICATE KEY UPDATE" in str(compiled)
+    assert compiled.params["message_ts_m0"] == "1.000200"
+    assert "message_ts_m1" not in compiled.params
+    assert insert_links.compile().params == {"message_id_m0": 2, "bot_id_m0": 5}
+    assert insert_files.compile().params["message_id_m0"] == 2
+    usage_params = add_usage.compile(dialect=mysql.dialect()).params
+    assert usage_params["message_count_m0"] == 1
+    assert usage_params["file_count_m0"] == 1
+    assert "user_id_m1" not in usage_params
+
+
+@pytest.mark.asyncio
+async def test_save_thread_messages_skips_files_that_cannot_be_stored(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    import app
+    from app import create_database_engine, create_tables
+    from app.database.identity_cache import identity_cache
+
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+    # A file deleted from Slack comes back as a tombstone with no type.
+    tombstone = {"file_type": None, "size": None, "mime_category": None}
+    image = {"file_type": "png", "size": 1, "mime_category": "image"}
+    messages = [
+        {"sender_id": "U1", "message_ts": "1.000100", "text": "hi", "files": []},
+        {
+            "sender_id": "U1",
+            "message_ts": "1.000200",
+            "text": "look",
+            "files": [tombstone, image],
+        },
+    ]
+    try:
+        await create_tables(engine)
+        inserted = await dao.save_thread_messages("chatgpt", "C1", "1.000100", messages)
+        stored = await dao.get_thread_messages("C1", "1.000100")
+    finally:
+        await engine.dispose()
+        app.async_session = previous_session
+
+    assert inserted == 2
+    assert [message.message_ts for message in stored] == ["1.000100", "1.000200"]
+    assert [file.file_type for file in stored[1].files] == ["png"]
+
+
+@pytest.mark.asyncio
+async def test_delete_message_removes_it_with_its_files(tmp_path):
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    import app
+    from app import create_database_engine, create_tables
+    from app.database.identity_cache import identity_cache
+
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+    image = {"file_type": "png", "size": 1, "mime_category": "image"}
+    messages = [
+        {"sender_id": "U1", "message_ts": "1.000100", "text": "hi", "files": []},
+        {"sender_id": "U1", "message_ts": "1.000200", "text": "oops", "files": [image]},
+    ]
+    try:
+        await create_tables(engine)
+        await dao.save_thread_messages("chatgpt", "C1", "1.000100", messages)
+        deleted = await dao.delete_message("1.000200")
+        deleted_again = await dao.delete_message("1.000200")
+        stored = await dao.get_thread_messages("C1", "1.000100")
+        files = await dao.get_files_by_message_ts("1.000200")
+    finally:
+        await engine.dispose()
+        app.async_session = previous_session
+
+    assert (deleted, deleted_again) == (True, False)
+    assert [message.message_ts for message in stored] == ["1.000100"]
+    assert files == []
@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from app import engine_options
+from app.database import instrumentation
+from app.database.instrumentation import (
+    TimedQueuePool,
+    current_query_function,
+    instrument_engine,
+    timed_query,
+)
+from app.utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_slow_statements_are_counted_and_attributed(engine):
+    @timed_query
+    async def get_answer():
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT 42")).scalar()
+
+    with patch.object(instrumentation, "SLOW_QUERY_SECONDS", 0), patch.object(
+        instrumentation, "SLOW_QUERY_LOG_SAMPLE_RATE", 1
+    ), patch.object(instrumentation.logger, "warning") as warning:
+        assert await get_answer() == 42
+
+    snapshot = metrics.snapshot()
+    assert snapshot["db_slow_queries_total{function=get_answer}"] == 1
+    assert snapshot["db_query_seconds{function=get_answer}"]["count"] == 1
+    assert "Slow query in get_answer" in warning.call_args.args[0]
+    assert current_query_function.get() is None
+
+
+def test_unsampled_slow_statements_are_not_logged(engine):
+    with patch.object(instrumentation, "SLOW_QUERY_SECONDS", 0), patch.object(
+        instrumentation, "SLOW_QUERY_LOG_SAMPLE_RATE", 0
+    ), patch.object(instrumentation.logger, "warning") as warning:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    assert metrics.snapshot()["db_slow_queries_total{function=unknown}"] == 1
+    warning.assert_not_called()
+
+
+def test_active_connections_gauge_follows_checkouts(engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert metrics.snapshot()["db_pool_active_connections"] == 1
+    assert metrics.snapshot()["db_pool_active_connections"] == 0
+
+
+def test_engine_options_come_from_config():
+    with patch("app.DB_POOL_SIZE", 7), patch("app.DB_STATEMENT_TIMEOUT_MS", 2500):
+        options = engine_options("mysql")
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_size"] == 7
+    assert options["connect_args"] == {
+        "init_command": "SET SESSION max_execution_time=2500"
+    }
+
+    with patch("app.DB_STATEMENT_TIMEOUT_MS", 0):
+        assert engine_options("mysql")["connect_args"] == {}
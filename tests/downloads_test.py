@@ -0,0 +1,114 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from unittest.mock import patch
+from app.slackbot import downloads
+from app.slackbot.downloads import SlackFileDownloader
+from app.utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+async def start_file_server(received_tokens):
+    async def serve_file(request):
+        received_tokens.append(request.headers["Authorization"])
+        return web.Response(body=b"file bytes")
+
+    app = web.Application()
+    app.router.add_get("/file", serve_file)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_downloads_reuse_one_session_and_connection_per_token():
+    received_tokens = []
+    server = await start_file_server(received_tokens)
+    downloader = SlackFileDownloader()
+    url = str(server.make_url("/file"))
+    try:
+        assert await downloader.download(url, "xoxb-a") == b"file bytes"
+        assert await downloader.download(url, "xoxb-a") == b"file bytes"
+        assert downloader.session("xoxb-a") is downloader.session("xoxb-a")
+        assert downloader.session("xoxb-a") is not downloader.session("xoxb-b")
+    finally:
+        await downloader.close()
+        await server.close()
+
+    assert received_tokens == ["Bearer xoxb-a", "Bearer xoxb-a"]
+    snapshot = metrics.snapshot()
+    assert snapshot["slack_download_connections_total{reused=false}"] == 1
+    assert snapshot["slack_download_connections_total{reused=true}"] == 1
+    assert snapshot["slack_download_seconds"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_close_closes_every_session():
+    downloader = SlackFileDownloader()
+    session = downloader.session("xoxb-a")
+    await downloader.close()
+    assert session.closed
+    assert downloader.session("xoxb-a") is not session
+    await downloader.close()
+
+
+async def start_streaming_server(body, content_length):
+    async def serve_file(request):
+        response = web.StreamResponse()
+        if content_length:
+            response.content_length = len(body)
+        await response.prepare(request)
+        for start in range(0, len(body), 1000):
+            await response.write(body[start : start + 1000])
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/file", serve_file)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_large_downloads_are_spooled_and_returned_whole():
+    body = bytes(range(256)) * 100
+    server = await start_streaming_server(body, content_length=False)
+    downloader = SlackFileDownloader()
+    try:
+        with patch.object(downloads, "SLACK_DOWNLOAD_CHUNK_SIZE", 512), patch.object(
+            downloads, "SLACK_DOWNLOAD_SPOOL_THRESHOLD", 4096
+        ):
+            content = await downloader.download(
+                str(server.make_url("/file")), "xoxb-a", max_size=len(body)
+            )
+    finally:
+        await downloader.close()
+        await server.close()
+
+    assert content == body
+    assert metrics.snapshot()["slack_download_bytes"]["count"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content_length", [True, False])
+async def test_downloads_stop_once_past_the_size_limit(content_length):
+    body = b"x" * 10000
+    server = await start_streaming_server(body, content_length)
+    downloader = SlackFileDownloader()
+    try:
+        with pytest.raises(ValueError, match="exceeds the limit of 4000 bytes"):
+            await downloader.download(
+                str(server.make_url("/file")), "xoxb-a", max_size=4000
+            )
+    finally:
+        await downloader.close()
+        await server.close()
+
+    assert metrics.snapshot()["slack_download_rejected_total"] == 1
@@ -6,7 +6,6 @@ import pstats
 import io
 import pytest
 
-
 # @pytest.fixture(autouse=True)
 # def profiler(request):
 #     pr = cProfile.Profile()
@@ -20,47 +19,56 @@ import pytest
 #     print(s.getvalue())
 
 
+def blank_pdf(page_count):
+    writer = pypdf.PdfWriter()
+    for _ in range(page_count):
+        writer.add_blank_page(width=612, height=792)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+async def read_pages(pdf_bytes, **kwargs):
+    return [page async for page in pdf_to_pages(pdf_bytes, **kwargs)]
+
+
 @pytest.mark.asyncio
-async def test_pdf_to_images_success():
-    with patch("app.utils.file_utils.convert_from_bytes") as mock_convert:
-        mock_image = MagicMock()
-        mock_image.save = MagicMock()
-        mock_convert.return_value = [mock_image]
-        _, image_bytes = await pdf_to_images(b"sample_df_bytes")
-        assert len(image_bytes) == 1
+async def test_pdf_to_pages_renders_every_page_without_the_text_layer():
+    async def pages(*args):
+        yield b"page one", 100
+        yield b"page two", 50
+
+    with patch("app.utils.file_utils.pdf_renderer.pages", pages):
+        result = await read_pages(blank_pdf(2), text_layer=False)
+    assert result == [(1, None, b"page one", 100), (2, None, b"page two", 50)]
 
 
 @pytest.mark.asyncio
-async def test_pdf_to_images_success():
-    with patch(
-        "app.utils.file_utils.convert_from_bytes", side_effect=Exception("error")
-    ):
-        with pytest.raises(PDFToImageConversionError):
-            await pdf_to_images(b"sample_pdf_bytes")
+async def test_pdf_to_pages_failure():
+    with pytest.raises(PDFToImageConversionError):
+        await read_pages(b"sample_pdf_bytes")
 
 
 @pytest.mark.asyncio
-async def test_pdf_to_images_with_multipage_native():
+async def test_pdf_to_pages_with_multipage_native():
     with open("tests/test_files/multipage_native.pdf", "rb") as pdf_file:
         pdf_bytes = pdf_file.read()
-    _, image_bytes = await pdf_to_images(pdf_bytes)
-    assert len(image_bytes) > 0
+    assert len(await read_pages(pdf_bytes, text_layer=False)) > 0
 
 
 @pytest.mark.asyncio
-async def test_pdf_to_images_with_multipage_scanned():
+async def test_pdf_to_pages_with_multipage_scanned():
     with open("tests/test_files/multipage_scanned.pdf", "rb") as pdf_file:
         pdf_bytes = pdf_file.read()
-    _, image_bytes = await pdf_to_images(pdf_bytes)
-    assert len(image_bytes) > 0
+    assert len(await read_pages(pdf_bytes, text_layer=False)) > 0
 
 
 @pytest.mark.asyncio
-async def test_pdf_to_images_with_singlepage_scanned():
+async def test_pdf_to_pages_with_singlepage_scanned():
     with open("tests/test_files/singlepage_scanned.pdf", "rb") as pdf_file:
         pdf_bytes = pdf_file.read()
     with pytest.raises(PDFToImageConversionError):
-        _, image_bytes = await pdf_to_images(pdf_bytes)
+        await read_pages(pdf_bytes, text_layer=False)
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,117 @@
+import io
+import sys
+import pypdf
+import pytest
+from unittest.mock import patch
+from app.utils import pdf_renderer as pdf_renderer_module
+from app.utils.pdf_renderer import PdfRenderer, page_batches, page_size
+
+# Stands in for pdftoppm: writes what it was asked to render into one file per
+# page, logs each run to RUN_LOG, and fails on the page given in FAIL_PAGE.
+FAKE_PDFTOPPM = f"""#!{sys.executable}
+import os, sys
+args = sys.argv[1:]
+first, last = int(args[args.index("-f") + 1]), int(args[args.index("-l") + 1])
+with open(os.environ["RUN_LOG"], "a") as log:
+    log.write(f"{{first}}-{{last}}\\n")
+if os.environ.get("FAIL_PAGE") and first <= int(os.environ["FAIL_PAGE"]) <= last:
+    sys.exit("broken page")
+width = args[args.index("-scale-to-x") + 1]
+height = args[args.index("-scale-to-y") + 1]
+for page in range(first, last + 1):
+    with open(f"{{args[-1]}}-{{page:02d}}.jpg", "w") as page_file:
+        page_file.write(f"page {{page}} at {{width}}x{{height}}")
+"""
+
+
+def make_pdf(*sizes):
+    writer = pypdf.PdfWriter()
+    for width, height in sizes:
+        writer.add_blank_page(width=width, height=height)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def fake_pdftoppm(tmp_path, monkeypatch):
+    """Returns a function that lists the page ranges pdftoppm was run on."""
+    path = tmp_path / "pdftoppm"
+    path.write_text(FAKE_PDFTOPPM)
+    path.chmod(0o755)
+    run_log = tmp_path / "runs.log"
+    run_log.write_text("")
+    monkeypatch.setenv("RUN_LOG", str(run_log))
+    with patch.object(pdf_renderer_module, "PDFTOPPM_PATH", str(path)):
+        yield lambda: run_log.read_text().split()
+
+
+def test_pages_are_sized_to_fit_the_box():
+    reader = pypdf.PdfReader(io.BytesIO(make_pdf((612, 792), (792, 612))))
+    portrait, landscape = reader.pages
+    assert page_size(portrait, 1024, 1024) == (791, 1024)
+    assert page_size(landscape, 1024, 1024) == (1024, 791)
+    landscape.rotate(90)
+    assert page_size(landscape, 1024, 1024) == (791, 1024)
+
+
+@pytest.mark.asyncio
+async def test_pages_are_rendered_in_order_at_their_target_size(fake_pdftoppm):
+    pdf_bytes = make_pdf((612, 792), (792, 612), (100, 100))
+    renderer = PdfRenderer(concurrency=2)
+
+    pages = [
+        page async for page in renderer.pages(pdf_bytes, max_width=512, max_height=512)
+    ]
+    assert pages == [
+        (b"page 1 at 395x512", 395 * 512),
+        (b"page 2 at 512x395", 512 * 395),
+        (b"page 3 at 512x512", 512 * 512),
+    ]
+    assert sorted(fake_pdftoppm()) == ["1-1", "2-2", "3-3"]
+
+
+@pytest.mark.asyncio
+async def test_consecutive_pages_of_one_size_share_a_process(fake_pdftoppm):
+    pdf_bytes = make_pdf(*[(612, 792)] * 5, (792, 612), (612, 792))
+    renderer = PdfRenderer(concurrency=2, batch_pages=3)
+
+    pages = [
+        image_bytes
+        async for image_bytes, _ in renderer.pages(
+            pdf_bytes,
+            max_width=1024,
+            max_height=1024,
+            page_numbers=[1, 2, 3, 4, 5, 6, 7],
+        )
+    ]
+    assert pages == [f"page {n} at 791x1024".encode() for n in range(1, 6)] + [
+        b"page 6 at 1024x791",
+        b"page 7 at 791x1024",
+    ]
+    assert sorted(fake_pdftoppm()) == ["1-3", "4-5", "6-6", "7-7"]
+
+
+def test_page_batches_break_on_gaps_and_size_changes():
+    small, large = (10, 10), (20, 20)
+    assert page_batches([1, 2, 4, 5, 6], [small] * 5, 10) == [
+        (1, 2, small),
+        (4, 6, small),
+    ]
+    assert page_batches([1, 2, 3], [small, large, large], 10) == [
+        (1, 1, small),
+        (2, 3, large),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_a_failed_page_stops_the_render(fake_pdftoppm, monkeypatch):
+    monkeypatch.setenv("FAIL_PAGE", "2")
+    pdf_bytes = make_pdf((612, 792), (612, 792), (612, 792))
+    renderer = PdfRenderer(concurrency=1, batch_pages=1)
+
+    rendered = []
+    with pytest.raises(RuntimeError, match="broken page"):
+        async for image_bytes, _ in renderer.pages(pdf_bytes):
+            rendered.append(image_bytes)
+    assert rendered == [b"page 1 at 791x1024"]
@@ -0,0 +1,116 @@
+import io
+import pypdf
+import pytest
+from unittest.mock import patch
+from pypdf.generic import DictionaryObject, NameObject, NumberObject, StreamObject
+from app.utils.file_utils import pdf_to_pages
+from app.utils.pdf_text_layer import page_text
+
+PARAGRAPH = "The quarterly report covers revenue, costs and hiring plans. " * 4
+
+
+def add_page(writer, text=None, image_size=None):
+    page = writer.add_blank_page(width=612, height=792)
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    resources = DictionaryObject(
+        {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+    )
+    content = b""
+    if text:
+        content += b"BT /F1 10 Tf 72 720 Td (" + text.encode("latin-1") + b") Tj ET "
+    if image_size:
+        width, height = image_size
+        image = StreamObject()
+        image.set_data(b"\x80" * (width * height * 3))
+        image.update(
+            {
+                NameObject("/Type"): NameObject("/XObject"),
+                NameObject("/Subtype"): NameObject("/Image"),
+                NameObject("/Width"): NumberObject(width),
+                NameObject("/Height"): NumberObject(height),
+                NameObject("/ColorSpace"): NameObject("/DeviceRGB"),
+                NameObject("/BitsPerComponent"): NumberObject(8),
+            }
+        )
+        resources[NameObject("/XObject")] = DictionaryObject(
+            {NameObject("/Im1"): writer._add_object(image)}
+        )
+        content += b"q 400 0 0 400 72 200 cm /Im1 Do Q"
+    page[NameObject("/Resources")] = resources
+    contents = StreamObject()
+    contents.set_data(content)
+    page[NameObject("/Contents")] = writer._add_object(contents)
+
+
+def make_pdf(*pages):
+    writer = pypdf.PdfWriter()
+    for page in pages:
+        add_page(writer, **page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def read_pages(pdf_bytes):
+    return pypdf.PdfReader(io.BytesIO(pdf_bytes)).pages
+
+
+def test_pages_with_a_good_text_layer_are_read_as_text():
+    text_page, logo_page = read_pages(
+        make_pdf({"text": PARAGRAPH}, {"text": PARAGRAPH, "image_size": (32, 32)})
+    )
+    assert page_text(text_page).strip() == PARAGRAPH.strip()
+    # A small image, like a logo, doesn't make the page a figure.
+    assert page_text(logo_page) is not None
+
+
+def test_scanned_figure_short_and_garbled_pages_are_rendered():
+    scanned, figure, short, garbled = read_pages(
+        make_pdf(
+            {"image_size": (400, 400)},
+            {"text": PARAGRAPH, "image_size": (400, 400)},
+            {"text": "Page 2"},
+            {"text": "\x01\x02\x03\x04" * 40},
+        )
+    )
+    assert page_text(scanned) is None
+    assert page_text(figure) is None
+    assert page_text(short) is None
+    assert page_text(garbled) is None
+
+
+@pytest.mark.asyncio
+async def test_only_pages_without_a_usable_text_layer_are_rendered():
+    pdf_bytes = make_pdf(
+        {"text": PARAGRAPH}, {"image_size": (400, 400)}, {"text": PARAGRAPH}
+    )
+    rendered = []
+
+    async def render_pages(pdf_bytes, pdf_reader, max_width, max_height, page_numbers):
+        rendered.extend(page_numbers)
+        for page_number in page_numbers:
+            yield f"page {page_number}".encode(), 100
+
+    with patch("app.utils.file_utils.pdf_renderer.pages", render_pages):
+        pages = [page async for page in pdf_to_pages(pdf_bytes)]
+    assert rendered == [2]
+    assert [
+        (number, text is not None, image, pixel_count)
+        for number, text, image, pixel_count in pages
+    ] == [
+        (1, True, None, 0),
+        (2, False, b"page 2", 100),
+        (3, True, None, 0),
+    ]
+
+    with patch("app.utils.file_utils.PDF_TEXT_LAYER", False), patch(
+        "app.utils.file_utils.pdf_renderer.pages", render_pages
+    ):
+        pages = [page async for page in pdf_to_pages(pdf_bytes)]
+    assert [image for _, _, image, _ in pages] == [b"page 1", b"page 2", b"page 3"]
@@ -0,0 +1,146 @@
+import os
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import db
+from app.database import dao
+from app.database.migrations import LATEST_VERSION, run_migrations, schema_version
+from app.database.models import Bot
+from app.database.types import micros_to_ts, normalize_ts, ts_to_micros
+
+TEST_MYSQL_URL = os.environ.get("TEST_MYSQL_URL")
+
+HOT_QUERIES = {
+    "message_by_ts": lambda: dao.select_message_by_ts("1.000001"),
+    "file_by_slack_id": lambda: dao.select_file("F1"),
+    "files_by_message_ts": lambda: dao.select_files_by_message_ts("1.000001"),
+    "messages_by_thread_ts": lambda: dao.select_messages_by_thread_ts("1.000001"),
+    "thread_messages": lambda: dao.select_thread_messages("C1", "1.000001"),
+    "conversation": lambda: dao.select_conversation("C1", "1.000001"),
+    "stored_messages": lambda: dao.select_stored_messages(
+        1, 1, ["1.000001", "1.000002"]
+    ),
+    "bot_id": lambda: db.select(Bot.id).filter_by(name="chatgpt"),
+    "unfinished_streams": lambda: dao.select_unfinished_streams(
+        1, datetime(2024, 1, 1)
+    ),
+}
+
+
+def compile_query(query, dialect):
+    return str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+@pytest.fixture(scope="module")
+def sqlite_engine():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_ts_columns_round_trip_as_integer_microseconds(sqlite_engine):
+    query = dao.select_message_by_ts("1700000000.0001")
+    assert "1700000000000100" in compile_query(query, sqlite_engine.dialect)
+
+
+def test_ts_conversions():
+    assert ts_to_micros("1700000000.000100") == 1700000000000100
+    assert micros_to_ts(1700000000000100) == "1700000000.000100"
+    assert normalize_ts("1700000000.0001") == "1700000000.000100"
+
+
+def test_new_database_is_stamped_with_the_latest_version(sqlite_engine):
+    with sqlite_engine.begin() as connection:
+        run_migrations(connection)
+        run_migrations(connection)
+        versions = connection.scalars(db.select(schema_version.c.version)).all()
+    assert versions == [LATEST_VERSION]
+
+
+def test_archive_tables_get_their_own_keys_on_sqlite(tmp_path):
+    from sqlalchemy import MetaData, Table, inspect
+    from app.database.models import archive_tables, message_archive
+
+    engine = create_engine(f"sqlite:///{tmp_path}/bot.db")
+    try:
+        with engine.begin() as connection:
+            db.metadata.create_all(connection)
+            # Archive tables as first created, keyed by the hot tables' keys.
+            old_metadata = MetaData()
+            for table in archive_tables:
+                table.drop(connection)
+                hot_table = db.metadata.tables[table.name.removesuffix("_archive")]
+                Table(
+                    table.name,
+                    old_metadata,
+                    *(
+                        db.Column(
+                            column.name,
+                            column.type,
+                            primary_key=column.primary_key,
+                            autoincrement=False,
+                            index=bool(column.foreign_keys),
+                        )
+                        for column in hot_table.columns
+                    ),
+                )
+            old_metadata.create_all(connection)
+            connection.execute(
+                old_metadata.tables["message_archive"].insert(),
+                {"id": 7, "conversation_id": 1, "text": "archived"},
+            )
+            connection.execute(schema_version.insert().values(version=5))
+
+            run_migrations(connection)
+
+            versions = connection.scalars(db.select(schema_version.c.version)).all()
+            assert versions == [5, LATEST_VERSION]
+            for table in archive_tables:
+                inspector = inspect(connection)
+                assert inspector.get_pk_constraint(table.name)[
+                    "constrained_columns"
+                ] == ["archive_id"]
+                assert {
+                    index["name"] for index in inspector.get_indexes(table.name)
+                } == {index.name for index in table.indexes}
+            # The archived row survives, and its id can be archived again.
+            connection.execute(
+                message_archive.insert(),
+                {"id": 7, "conversation_id": 2, "text": "archived again"},
+            )
+            rows = connection.execute(
+                db.select(message_archive.c.id, message_archive.c.text).order_by(
+                    message_archive.c.archive_id
+                )
+            ).all()
+            assert rows == [(7, "archived"), (7, "archived again")]
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_queries_use_indexes_on_sqlite(sqlite_engine, name):
+    sql = compile_query(HOT_QUERIES[name](), sqlite_engine.dialect)
+    with sqlite_engine.connect() as connection:
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    scans = [row[3] for row in plan if row[3].startswith("SCAN ")]
+    assert scans == [], f"{name} scans a table: {plan}"
+
+
+@pytest.mark.skipif(not TEST_MYSQL_URL, reason="TEST_MYSQL_URL is not set")
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", HOT_QUERIES)
+async def test_hot_queries_use_indexes_on_mysql(name):
+    engine = create_async_engine(TEST_MYSQL_URL)
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(db.metadata.create_all)
+            sql = compile_query(HOT_QUERIES[name](), engine.dialect)
+            result = await connection.exec_driver_sql(f"EXPLAIN {sql}")
+            plan = result.mappings().all()
+    finally:
+        await engine.dispose()
+    full_scans = [row for row in plan if row["type"] in ("ALL", "index")]
+    assert full_scans == [], f"{name} scans a table: {plan}"
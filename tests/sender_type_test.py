@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+import app
+from app import create_database_engine, create_tables, db
+from app.database import dao
+from app.database.identity_cache import identity_cache
+from app.database.models import BOT_SENDER, USER_SENDER, Message
+from app.objects import SlackService, slack_message
+
+pytest.importorskip("aiosqlite")
+
+
+def test_thread_rows_carry_sender_type():
+    rows = [
+        SlackService.message_row(slack_message(data, "xoxb", "UBOT"))
+        for data in (
+            {"ts": "1.000001", "user": "U1", "text": "hi"},
+            {"ts": "1.000002", "user": "UBOT", "text": "hello"},
+            {"ts": "1.000003", "user": "UOTHER", "bot_id": "B2", "text": "beep"},
+        )
+    ]
+    assert [row["sender_type"] for row in rows] == [
+        USER_SENDER,
+        BOT_SENDER,
+        BOT_SENDER,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_missing_sender_types_are_filled_once_all_bots_are_known(tmp_path):
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+
+    async def sender_types():
+        async with app.async_session() as session:
+            result = await session.execute(
+                db.select(Message.sender_id, Message.sender_type).order_by(Message.id)
+            )
+            return result.all()
+
+    try:
+        await create_tables(engine)
+        await dao.preload_bot_ids(["chatgpt", "claude"])
+        for index, sender_id in enumerate(["U1", "UGPT", "UCLAUDE"]):
+            ts = f"1.00000{index + 1}"
+            await dao.create_message(
+                "C1", "1.000001", sender_id, "chatgpt", ts, None, None, "text"
+            )
+
+        await dao.record_bot_user_ids({"chatgpt": "UGPT"})
+        assert await dao.fill_missing_sender_types(["chatgpt", "claude"], 2) == 1
+        assert await sender_types() == [
+            ("U1", None),
+            ("UGPT", BOT_SENDER),
+            ("UCLAUDE", None),
+        ]
+
+        await dao.record_bot_user_ids({"claude": "UCLAUDE"})
+        assert await dao.fill_missing_sender_types(["chatgpt", "claude"], 1) == 2
+        assert await sender_types() == [
+            ("U1", USER_SENDER),
+            ("UGPT", BOT_SENDER),
+            ("UCLAUDE", BOT_SENDER),
+        ]
+    finally:
+        identity_cache.clear()
+        await engine.dispose()
+        app.async_session = previous_session
@@ -0,0 +1,51 @@
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from unittest.mock import patch
+import app
+from app import database_uri, setup_database
+from app.database import dao
+from app.database.migrations import LATEST_VERSION, schema_version
+
+pytest.importorskip("aiosqlite")
+
+
+def test_database_uri_follows_backend():
+    with patch("app.DATABASE_BACKEND", "sqlite"), patch(
+        "app.SQLITE_PATH", "/srv/bot.db"
+    ):
+        assert database_uri() == "sqlite+aiosqlite:////srv/bot.db"
+    with patch("app.DATABASE_BACKEND", "postgres"), pytest.raises(ValueError):
+        database_uri()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_runs_the_same_schema_and_dao(tmp_path):
+    path = tmp_path / "data" / "slackbot.db"
+    previous_session = app.async_session
+    with patch("app.DATABASE_BACKEND", "sqlite"), patch("app.SQLITE_PATH", str(path)):
+        await setup_database(Flask(__name__))
+    try:
+        async with app.async_session() as session:
+            journal_mode = await session.scalar(text("PRAGMA journal_mode"))
+            stamped = await session.scalar(
+                app.db.select(app.db.func.max(schema_version.c.version))
+            )
+        assert path.exists()
+        assert journal_mode == "wal"
+        assert stamped == LATEST_VERSION
+
+        await dao.create_message(
+            "C1", "1.000001", "U1", "chatgpt", "1.000001", None, None, "hello"
+        )
+        await dao.create_message(
+            "C1", "1.000001", "B1", "chatgpt", "1.000002", "1.000001", None, "hi"
+        )
+        messages = await dao.get_thread_messages("C1", "1.000001")
+        assert [(m.message_ts, m.text) for m in messages] == [
+            ("1.000001", "hello"),
+            ("1.000002", "hi"),
+        ]
+    finally:
+        await app.async_session.kw["bind"].dispose()
+        app.async_session = previous_session
@@ -0,0 +1,117 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app import (
+    StartupTimer,
+    initialize_bolt_apps,
+    cleanup_bolt_apps,
+    leave_unallowed_channels,
+    log_process_metrics,
+    reconcile_unfinished_streams,
+)
+from app.utils.metrics import metrics
+
+
+@pytest.mark.asyncio
+async def test_initialize_bolt_apps_runs_auth_tests_concurrently():
+    async def slow_auth_test(client):
+        await asyncio.sleep(0.2)
+        return "U123"
+
+    slack_bots = {name: {"bot_token": "xoxb", "app_token": "xapp"} for name in "abc"}
+    timer = StartupTimer()
+    with patch("app.AsyncApp", MagicMock()), patch(
+        "app.AsyncSocketModeHandler", MagicMock()
+    ), patch("app.get_bot_user_id", slow_auth_test):
+        start = time.monotonic()
+        bolt_apps = await initialize_bolt_apps(slack_bots, timer)
+        elapsed = time.monotonic() - start
+
+    assert list(bolt_apps) == ["a", "b", "c"]
+    assert bolt_apps["a"]["bot_user_id"] == "U123"
+    assert elapsed < 0.5
+    assert set(timer.phases) == {"auth_test[a]", "auth_test[b]", "auth_test[c]"}
+
+
+@pytest.mark.asyncio
+async def test_leave_unallowed_channels_uses_member_only_listing():
+    client = AsyncMock()
+    client.users_conversations.side_effect = [
+        {
+            "ok": True,
+            "channels": [{"id": "CALLOWED"}, {"id": "COTHER"}],
+            "response_metadata": {"next_cursor": "next"},
+        },
+        {"ok": True, "channels": [{"id": "CLAST"}], "response_metadata": {}},
+    ]
+    with patch("app.LIST_OF_ALLOWED_CHANNELS", ["CALLOWED"]):
+        await leave_unallowed_channels(client, "chatgpt")
+
+    client.conversations_list.assert_not_called()
+    left = [
+        call.kwargs["channel"] for call in client.conversations_leave.call_args_list
+    ]
+    assert left == ["COTHER", "CLAST"]
+
+
+@pytest.mark.asyncio
+async def test_cleanup_failure_for_one_bot_does_not_stop_others():
+    failing_client = AsyncMock()
+    failing_client.users_conversations.side_effect = Exception("ratelimited")
+    healthy_client = AsyncMock()
+    healthy_client.users_conversations.return_value = {"ok": True, "channels": []}
+
+    await cleanup_bolt_apps(
+        {
+            "chatgpt": {"client": failing_client},
+            "claude": {"client": healthy_client},
+        }
+    )
+    healthy_client.chat_postMessage.assert_called_once()
+    failing_client.chat_postMessage.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reconcile_stores_slack_text_and_removes_typing_indicator():
+    client = AsyncMock()
+    client.conversations_replies.return_value = {
+        "ok": True,
+        "messages": [
+            {"ts": "100.000001", "text": "question"},
+            {"ts": "100.000002", "text": "partial answer\n\n:typing-bubble:"},
+        ],
+    }
+    update_message_text = AsyncMock()
+    unfinished = [("C1", "100.000001", "100.000002", "partial")]
+    with patch(
+        "app.database.dao.get_unfinished_streams", AsyncMock(return_value=unfinished)
+    ), patch("app.database.dao.update_message_text", update_message_text):
+        await reconcile_unfinished_streams(client, "chatgpt", None)
+
+    client.chat_update.assert_called_once_with(
+        channel="C1", ts="100.000002", text="partial answer"
+    )
+    update_message_text.assert_called_once_with(
+        "100.000002", "partial answer", is_streaming=False
+    )
+
+
+def test_startup_timer_report():
+    timer = StartupTimer()
+    with timer.phase("database"):
+        pass
+    assert timer.report().startswith("database=")
+
+
+@pytest.mark.asyncio
+async def test_single_process_metrics_are_logged():
+    metrics.clear()
+    metrics.gauge("work_queue_depth").set(2)
+    with patch("app.METRICS_REPORT_INTERVAL", 0), patch("app.logger") as logger:
+        task = asyncio.create_task(log_process_metrics())
+        while not logger.info.called:
+            await asyncio.sleep(0)
+        task.cancel()
+    metrics.clear()
+    assert "'work_queue_depth': 2" in logger.info.call_args.args[0]
@@ -0,0 +1,51 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.objects import SlackTextMessage
+
+TYPING = "\n\n:typing-bubble:"
+
+
+async def stream(chunks):
+    client = AsyncMock()
+    client.chat_postMessage.return_value = {"ts": "100.000002"}
+    message = await SlackTextMessage.create_and_send(
+        client, "C1", "100.000001", "", TYPING, "100.000001", "chatgpt", "B1"
+    )
+    for chunk in chunks:
+        await message.update_and_post(chunk, TYPING, end_of_stream=False)
+    await message.update_and_post("", "", end_of_stream=True)
+    return message
+
+
+def saved_texts(submit):
+    return [
+        (call.args[0].args[1], call.args[0].keywords["is_streaming"])
+        for call in submit.call_args_list[1:]
+    ]
+
+
+@pytest.mark.asyncio
+async def test_only_the_final_text_is_stored_by_default():
+    submit = AsyncMock()
+    with patch("app.objects.write_queue.submit", submit), patch(
+        "app.objects.SLACK_MESSAGE_UPDATE_INTERVAL", 0
+    ):
+        await stream(["Hello", " there", " friend"])
+
+    create = submit.call_args_list[0].args[0]
+    assert create.keywords["is_streaming"] is True
+    assert saved_texts(submit) == [("Hello there friend", False)]
+
+
+@pytest.mark.asyncio
+async def test_checkpoints_after_byte_threshold():
+    submit = AsyncMock()
+    with patch("app.objects.write_queue.submit", submit), patch(
+        "app.objects.SLACK_MESSAGE_UPDATE_INTERVAL", 0
+    ), patch("app.objects.STREAM_CHECKPOINT_BYTES", 8):
+        await stream(["Hello", " there", " friend"])
+
+    assert saved_texts(submit) == [
+        ("Hello there", True),
+        ("Hello there friend", False),
+    ]
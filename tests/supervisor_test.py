@@ -0,0 +1,119 @@
+import queue
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.supervisor import Supervisor, parse_bot_groups, worker_main
+from app.utils.metrics import merge_snapshots
+
+BOT_NAMES = ["dalle", "chatgpt", "claude", "stable_diffusion", "gemini"]
+
+
+class FakeProcess:
+    def __init__(self, target, args, name):
+        self.args = args
+        self.name = name
+        self.alive = False
+        self.exitcode = None
+        self.pid = 1234
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def crash(self):
+        self.alive = False
+        self.exitcode = 1
+
+
+class FakeContext:
+    def __init__(self):
+        self.processes = []
+
+    def Queue(self):
+        return queue.Queue()
+
+    def Process(self, target, args, name):
+        process = FakeProcess(target, args, name)
+        self.processes.append(process)
+        return process
+
+
+def test_parse_bot_groups_per_bot():
+    assert parse_bot_groups("per_bot", BOT_NAMES) == [[name] for name in BOT_NAMES]
+
+
+def test_parse_bot_groups_gives_unlisted_bots_their_own_worker():
+    groups = parse_bot_groups("chatgpt,claude; dalle,stable_diffusion", BOT_NAMES)
+    assert groups == [["chatgpt", "claude"], ["dalle", "stable_diffusion"], ["gemini"]]
+
+
+def test_parse_bot_groups_rejects_unknown_and_duplicate_bots():
+    with pytest.raises(ValueError):
+        parse_bot_groups("chatgpt;llama", BOT_NAMES)
+    with pytest.raises(ValueError):
+        parse_bot_groups("chatgpt;chatgpt,claude", BOT_NAMES)
+
+
+def test_crashed_worker_is_restarted_with_backoff():
+    context = FakeContext()
+    supervisor = Supervisor([["chatgpt"], ["claude"]], context=context)
+    supervisor.start()
+    assert len(context.processes) == 2
+
+    with patch("app.supervisor.time.monotonic", return_value=10):
+        context.processes[0].crash()
+        supervisor.check_workers()
+    assert len(context.processes) == 2
+    assert supervisor.workers[0].restart_at == 11
+
+    with patch("app.supervisor.time.monotonic", return_value=11):
+        supervisor.check_workers()
+    assert len(context.processes) == 3
+    assert context.processes[2].args[1] == ["chatgpt"]
+    assert supervisor.workers[0].restarts == 1
+    assert supervisor.workers[0].backoff == 2
+
+
+def test_only_the_first_worker_runs_archival():
+    context = FakeContext()
+    supervisor = Supervisor([["chatgpt"], ["claude"]], context=context)
+    supervisor.start()
+    assert [process.args[3] for process in context.processes] == [True, False]
+
+    with patch("app.supervisor.time.monotonic", return_value=10):
+        context.processes[0].crash()
+        supervisor.check_workers()
+    with patch("app.supervisor.time.monotonic", return_value=11):
+        supervisor.check_workers()
+    assert context.processes[2].args[3] is True
+
+
+@pytest.mark.asyncio
+async def test_workers_leave_database_preparation_to_the_supervisor():
+    with patch("app.create_app", new_callable=AsyncMock) as create_app:
+        await worker_main("claude", ["claude"], queue.Queue(), archive=False)
+    create_app.assert_awaited_once_with(
+        ["claude"], prepare=False, archive=False, log_metrics=False
+    )
+
+
+def test_collect_metrics_merges_worker_snapshots():
+    supervisor = Supervisor([["chatgpt"], ["claude"]], context=FakeContext())
+    histogram = {"count": 1, "sum": 0.5, "buckets": {"1": 1, "inf": 1}}
+    supervisor.metrics_queue.put(
+        ("chatgpt", {"work_queue_depth": 2, "wait": histogram})
+    )
+    supervisor.metrics_queue.put(("claude", {"work_queue_depth": 3, "wait": histogram}))
+    supervisor.collect_metrics()
+
+    assert supervisor.aggregated_metrics["work_queue_depth"] == 5
+    assert supervisor.aggregated_metrics["wait"]["count"] == 2
+    assert supervisor.aggregated_metrics["wait"]["buckets"]["1"] == 2
+    assert supervisor.aggregated_metrics["worker_restarts_total{worker=claude}"] == 0
+    # Merging must not mutate the per-worker snapshots it was given.
+    assert histogram["count"] == 1
+
+
+def test_merge_snapshots_of_nothing_is_empty():
+    assert merge_snapshots([]) == {}
@@ -0,0 +1,298 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.config import TYPING_INDICATOR
+from app.exceptions import UserFacingError
+from app.slackbot.thread_cache import ThreadSnapshotCache
+from app.slackbot.message_handler import fetch_thread_messages, load_thread_from_db
+
+CHANNEL = "C123"
+THREAD = "100.000001"
+
+
+def message(ts, text="hi", thread_ts=THREAD):
+    return {"ts": ts, "thread_ts": thread_ts, "text": text, "user": "U1"}
+
+
+def test_store_keeps_only_settled_prefix():
+    cache = ThreadSnapshotCache(maxsize=10, ttl=None)
+    cache.store(
+        CHANNEL,
+        THREAD,
+        [
+            message(THREAD),
+            message("100.000002"),
+            message("100.000003", f"partial\n\n{TYPING_INDICATOR}"),
+            message("100.000004"),
+        ],
+    )
+    assert [m["ts"] for m in cache.get(CHANNEL, THREAD)] == [THREAD, "100.000002"]
+
+
+def test_merge_prefers_fetched_messages_and_appends_new_ones():
+    cache = ThreadSnapshotCache(maxsize=10, ttl=None)
+    snapshot = [message(THREAD, "old parent"), message("100.000002")]
+    fetched = [message(THREAD, "edited parent"), message("100.000003")]
+    merged = cache.merge(snapshot, fetched)
+    assert [m["ts"] for m in merged] == [THREAD, "100.000002", "100.000003"]
+    assert merged[0]["text"] == "edited parent"
+
+
+def test_message_changed_and_deleted_events_update_snapshot():
+    cache = ThreadSnapshotCache(maxsize=10, ttl=None)
+    cache.store(CHANNEL, THREAD, [message(THREAD), message("100.000002")])
+
+    cache.apply_message_changed(
+        {
+            "channel": CHANNEL,
+            "subtype": "message_changed",
+            "message": message("100.000002", "edited"),
+        }
+    )
+    assert cache.get(CHANNEL, THREAD)[1]["text"] == "edited"
+
+    cache.apply_message_deleted(
+        {
+            "channel": CHANNEL,
+            "subtype": "message_deleted",
+            "deleted_ts": "100.000002",
+            "previous_message": message("100.000002"),
+        }
+    )
+    assert [m["ts"] for m in cache.get(CHANNEL, THREAD)] == [THREAD]
+
+    cache.apply_message_deleted(
+        {
+            "channel": CHANNEL,
+            "subtype": "message_deleted",
+            "deleted_ts": THREAD,
+            "previous_message": message(THREAD),
+        }
+    )
+    assert cache.get(CHANNEL, THREAD) is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_thread_messages_only_pages_newer_replies():
+    cache = ThreadSnapshotCache(maxsize=10, ttl=None)
+    client = AsyncMock()
+    client.conversations_replies.side_effect = [
+        {"ok": True, "messages": [message(THREAD), message("100.000002")]},
+        {"ok": True, "messages": [message(THREAD), message("100.000003")]},
+    ]
+    slack_service = MagicMock()
+    slack_service.create_conversation_from_thread = AsyncMock(
+        side_effect=lambda thread_data, *args: thread_data
+    )
+
+    with patch("app.slackbot.message_handler.thread_snapshot_cache", cache), patch(
+        "app.slackbot.message_handler.SlackService", return_value=slack_service
+    ), patch(
+        "app.slackbot.message_handler.load_thread_from_db", AsyncMock(return_value=None)
+    ):
+        await fetch_thread_messages(client, CHANNEL, THREAD, "xoxb", "B1", "chatgpt")
+        thread_data = await fetch_thread_messages(
+            client, CHANNEL, THREAD, "xoxb", "B1", "chatgpt"
+        )
+
+    first_call, second_call = client.conversations_replies.call_args_list
+    assert first_call.kwargs["oldest"] is None
+    assert second_call.kwargs["oldest"] == "100.000002"
+    assert [m["ts"] for m in thread_data] == [THREAD, "100.000002", "100.000003"]
+
+
+@pytest.mark.asyncio
+async def test_threads_loaded_from_the_database_are_limited_in_size():
+    cache = ThreadSnapshotCache(maxsize=10, ttl=None)
+    stored_thread = [message(THREAD), message("100.000002"), message("100.000003")]
+    with patch("app.slackbot.message_handler.thread_snapshot_cache", cache), patch(
+        "app.slackbot.message_handler.SLACK_THREAD_MESSAGE_LIMIT", 2
+    ), patch(
+        "app.slackbot.message_handler.load_thread_from_db",
+        AsyncMock(return_value=stored_thread),
+    ):
+        with pytest.raises(UserFacingError):
+            await fetch_thread_messages(
+                AsyncMock(), CHANNEL, THREAD, "xoxb", "B1", "chatgpt"
+            )
+    assert cache.get(CHANNEL, THREAD) is None
+
+
+def stored_message(ts, files=()):
+    stored = MagicMock()
+    stored.message_ts = ts
+    stored.sender_id = "U1"
+    stored.text = "hi"
+    stored.files = list(files)
+    return stored
+
+
+@pytest.mark.asyncio
+async def test_load_thread_from_db_when_consistent_with_slack():
+    stored_file = MagicMock(properties={"slack": {"id": "F1", "name": "a.png"}})
+    client = AsyncMock()
+    client.conversations_replies.return_value = {
+        "ok": True,
+        "messages": [{"ts": THREAD, "reply_count": 1, "latest_reply": "100.000002"}],
+    }
+    with patch(
+        "app.slackbot.message_handler.get_thread_messages",
+        AsyncMock(
+            return_value=[
+                stored_message(THREAD),
+                stored_message("100.000002", [stored_file]),
+            ]
+        ),
+    ):
+        thread_data = await load_thread_from_db(client, CHANNEL, THREAD)
+
+    assert [m["ts"] for m in thread_data] == [THREAD, "100.000002"]
+    assert thread_data[1]["files"] == [{"id": "F1", "name": "a.png"}]
+    client.conversations_replies.assert_called_once_with(
+        channel=CHANNEL, ts=THREAD, limit=1
+    )
+
+
+@pytest.mark.asyncio
+async def test_load_thread_from_db_falls_back_on_mismatch():
+    client = AsyncMock()
+    client.conversations_replies.return_value = {
+        "ok": True,
+        "messages": [{"ts": THREAD, "reply_count": 2, "latest_reply": "100.000003"}],
+    }
+    with patch(
+        "app.slackbot.message_handler.get_thread_messages",
+        AsyncMock(return_value=[stored_message(THREAD), stored_message("100.000002")]),
+    ):
+        assert await load_thread_from_db(client, CHANNEL, THREAD) is None
+
+
+@pytest.mark.asyncio
+async def test_load_thread_from_db_skips_slack_for_cold_threads():
+    client = AsyncMock()
+    with patch(
+        "app.slackbot.message_handler.get_thread_messages", AsyncMock(return_value=[])
+    ):
+        assert await load_thread_from_db(client, CHANNEL, THREAD) is None
+    client.conversations_replies.assert_not_called()
+
+
+async def answer_from_database(tmp_path, event, reply_count):
+    """
+    Runs process_message for `event` against a SQLite database that already
+    holds the thread's parent and a bot reply.
+
+    Returns:
+    tuple: The Slack client mock and the conversation the agent was given.
+    """
+    from contextlib import asynccontextmanager
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    import app
+    from app import create_database_engine, create_tables
+    from app.database import dao
+    from app.database.identity_cache import identity_cache
+    from app.database.write_behind import WriteBehindQueue
+    from app.slackbot.message_handler import process_message
+
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+    # A running queue holds writes back, as it does in production.
+    queue = WriteBehindQueue(flush_interval=60)
+    queue.start()
+
+    class FakeWorkQueue:
+        @asynccontextmanager
+        async def admit(self, bot_name, on_queued=None):
+            yield
+
+    agent = MagicMock()
+    client = AsyncMock()
+    client.conversations_replies.return_value = {
+        "ok": True,
+        "messages": [
+            {"ts": THREAD, "reply_count": reply_count, "latest_reply": event["ts"]}
+        ],
+    }
+    try:
+        await create_tables(engine)
+        await dao.create_message(
+            CHANNEL, THREAD, "U1", "chatgpt", THREAD, None, None, "hello"
+        )
+        await dao.create_message(
+            CHANNEL, THREAD, "B1", "chatgpt", "100.000002", THREAD, None, "hi"
+        )
+        with patch("app.objects.write_queue", queue), patch(
+            "app.slackbot.message_handler.write_queue", queue, create=True
+        ), patch(
+            "app.slackbot.message_handler.thread_snapshot_cache",
+            ThreadSnapshotCache(maxsize=10, ttl=None),
+        ), patch(
+            "app.slackbot.message_handler.work_queue", FakeWorkQueue()
+        ), patch(
+            "app.slackbot.message_handler.agent_manager.get_agent",
+            return_value=agent,
+        ), patch(
+            "app.slackbot.message_handler.SlackResponseHandler"
+        ) as response_handler:
+            response_handler.return_value.handle_responses = AsyncMock()
+            await process_message(event, "chatgpt", client, CHANNEL, THREAD, "B1")
+    finally:
+        await queue.stop()
+        await engine.dispose()
+        app.async_session = previous_session
+    return client, agent.process_conversation.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_new_message_is_answered_from_the_database(tmp_path):
+    pytest.importorskip("aiosqlite")
+    client, conversation = await answer_from_database(
+        tmp_path,
+        {"type": "message", "ts": "100.000003", "user": "U1", "text": "more"},
+        reply_count=2,
+    )
+
+    client.conversations_replies.assert_called_once_with(
+        channel=CHANNEL, ts=THREAD, limit=1
+    )
+    assert [message.ts for message in conversation.messages] == [
+        THREAD,
+        "100.000002",
+        "100.000003",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_files_of_the_new_message_are_read_back_from_the_database(tmp_path):
+    pytest.importorskip("aiosqlite")
+    upload = {
+        "id": "F1",
+        "created": 1700000000,
+        "name": "report.pdf",
+        "size": 2048,
+        "url_private": "https://files.slack.com/files-pri/T1-F1/report.pdf",
+        "filetype": "pdf",
+        "mimetype": "application/pdf",
+    }
+    client, conversation = await answer_from_database(
+        tmp_path,
+        {
+            "type": "message",
+            "ts": "100.000003",
+            "user": "U1",
+            "text": "summarize this",
+            "files": [upload],
+        },
+        reply_count=2,
+    )
+
+    client.conversations_replies.assert_called_once_with(
+        channel=CHANNEL, ts=THREAD, limit=1
+    )
+    [file] = conversation.messages[-1].files
+    assert (file.id, file.created, file.size) == ("F1", 1700000000, 2048)
+    assert file.url_private == upload["url_private"]
@@ -0,0 +1,94 @@
+import asyncio
+import pytest
+from app.slackbot.message_handler import ThreadScheduler
+
+KEY = ("C123", "1712345678.000100", "chatgpt")
+
+
+@pytest.mark.asyncio
+async def test_single_message_runs_job():
+    scheduler = ThreadScheduler()
+    calls = []
+
+    async def job():
+        calls.append("ran")
+
+    assert await scheduler.run(KEY, job) is True
+    assert calls == ["ran"]
+    assert not scheduler._locks
+
+
+@pytest.mark.asyncio
+async def test_burst_is_coalesced_into_latest_message():
+    scheduler = ThreadScheduler()
+    release = asyncio.Event()
+    calls = []
+
+    def job_factory(name):
+        async def job():
+            calls.append(name)
+            if name == "first":
+                await release.wait()
+
+        return job
+
+    first = asyncio.create_task(scheduler.run(KEY, job_factory("first")))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(scheduler.run(KEY, job_factory("second")))
+    third = asyncio.create_task(scheduler.run(KEY, job_factory("third")))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(first, second, third) == [True, False, True]
+    assert calls == ["first", "third"]
+    assert scheduler.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_threads_do_not_block_each_other():
+    scheduler = ThreadScheduler()
+    release = asyncio.Event()
+
+    async def blocking_job():
+        await release.wait()
+
+    async def quick_job():
+        pass
+
+    blocked = asyncio.create_task(scheduler.run(KEY, blocking_job))
+    await asyncio.sleep(0)
+    other_key = ("C123", "1712345678.000200", "chatgpt")
+    assert await asyncio.wait_for(scheduler.run(other_key, quick_job), 1) is True
+    release.set()
+    assert await blocked is True
+
+
+@pytest.mark.asyncio
+async def test_newer_message_cancels_in_flight_generation():
+    scheduler = ThreadScheduler(cancel_superseded=True)
+    started = asyncio.Event()
+
+    async def slow_job():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def quick_job():
+        pass
+
+    first = asyncio.create_task(scheduler.run(KEY, slow_job))
+    await started.wait()
+    assert await asyncio.wait_for(scheduler.run(KEY, quick_job), 1) is True
+    assert await first is False
+    assert scheduler.superseded == 1
+
+
+@pytest.mark.asyncio
+async def test_job_errors_propagate_to_caller():
+    scheduler = ThreadScheduler()
+
+    async def failing_job():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await scheduler.run(KEY, failing_job)
+    assert not scheduler._locks
@@ -0,0 +1,123 @@
+import pytest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+import app
+from app import create_database_engine, create_tables, db
+from app.database import dao
+from app.database.identity_cache import identity_cache
+from app.database.migrations import backfill_usage_rollups
+from app.database.models import UsageRollup
+from app.database.usage import get_daily_usage, get_top_users, get_usage_totals
+
+pytest.importorskip("aiosqlite")
+
+# 2024-01-01 and 2024-01-02, 00:00 UTC.
+DAY_ONE = "1704067200.000100"
+DAY_TWO = "1704153600.000100"
+
+
+@pytest.mark.asyncio
+async def test_rollups_follow_writes_and_answer_queries(tmp_path):
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path}/bot.db")
+    previous_session = app.async_session
+    app.async_session = sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession
+    )
+    identity_cache.clear()
+    try:
+        await create_tables(engine)
+        await dao.create_message(
+            "C1", DAY_ONE, "U1", "chatgpt", DAY_ONE, None, None, "hello"
+        )
+        # Storing the same message again for another bot doesn't count it twice.
+        await dao.create_message(
+            "C1", DAY_ONE, "U1", "claude", DAY_ONE, None, None, "hello"
+        )
+        await dao.save_thread_messages(
+            "chatgpt",
+            "C1",
+            DAY_ONE,
+            [
+                {
+                    "sender_id": "U1",
+                    "message_ts": DAY_ONE,
+                    "text": "hello",
+                    "files": [],
+                },
+                {
+                    "sender_id": "U2",
+                    "message_ts": DAY_TWO,
+                    "text": "hi",
+                    "files": [
+                        {"file_type": "pdf", "size": 1, "mime_category": "application"}
+                    ],
+                },
+            ],
+        )
+        await dao.create_file(DAY_ONE, "png", slack_file_id="F1", mime_category="image")
+        await dao.update_file("F1", properties={"pixel_count": 100})
+        await dao.update_file("F1", properties={"pixel_count": 150})
+        await dao.update_message_text(DAY_ONE, "hello there")
+        await dao.update_message_text(DAY_ONE, "hello there")
+
+        totals = await get_usage_totals(date(2024, 1, 1), date(2024, 1, 2))
+        assert totals == {
+            "message_count": 2,
+            "character_count": 13,
+            "file_count": 2,
+            "pixel_count": 150,
+            "audio_seconds": 0,
+            "pdf_page_count": 0,
+        }
+        assert (await get_usage_totals(date(2024, 1, 1), date(2024, 1, 2), "claude"))[
+            "message_count"
+        ] == 0
+
+        daily = await get_daily_usage(date(2024, 1, 1), date(2024, 1, 2), "chatgpt")
+        assert [(row["day"], row["character_count"]) for row in daily] == [
+            (date(2024, 1, 1), 11),
+            (date(2024, 1, 2), 2),
+        ]
+        assert await get_top_users(date(2024, 1, 1), date(2024, 1, 2)) == [
+            ("U1", 11),
+            ("U2", 2),
+        ]
+    finally:
+        identity_cache.clear()
+        await engine.dispose()
+        app.async_session = previous_session
+
+
+def test_backfill_rebuilds_rollups_from_stored_rows():
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(db.text("INSERT INTO bot (id, name) VALUES (1, 'chatgpt')"))
+        connection.execute(
+            db.text(
+                "INSERT INTO conversation (id, channel_id, thread_ts) "
+                "VALUES (1, 'C1', 1704067200000100)"
+            )
+        )
+        connection.execute(
+            db.text(
+                "INSERT INTO message (id, conversation_id, sender_id, message_ts, text) "
+                "VALUES (1, 1, 'U1', 1704067200000100, 'hello')"
+            )
+        )
+        connection.execute(db.text("INSERT INTO message_bot VALUES (1, 1)"))
+        connection.execute(
+            db.text(
+                "INSERT INTO file (message_id, mime_category, file_type, properties) "
+                """VALUES (1, 'application', 'pdf', '{"page_count": 3}')"""
+            )
+        )
+        backfill_usage_rollups(connection)
+        row = connection.execute(db.select(UsageRollup)).one()
+    engine.dispose()
+
+    assert (row.day, row.bot_id, row.user_id) == (date(2024, 1, 1), 1, "U1")
+    assert (row.message_count, row.character_count) == (1, 5)
+    assert (row.file_count, row.pdf_page_count) == (1, 3)
@@ -0,0 +1,178 @@
+import asyncio
+import pytest
+from app.slackbot.work_queue import WorkQueue
+from app.exceptions import ServiceBusyError
+from app.utils.metrics import metrics
+
+SLACK_BOTS = {
+    "chatgpt": {"provider": "openai", "max_concurrency": 2},
+    "dalle": {"provider": "openai", "max_concurrency": 1},
+    "claude": {"provider": "anthropic", "max_concurrency": 1},
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+@pytest.mark.asyncio
+async def test_admits_immediately_when_slots_are_free():
+    queue = WorkQueue(SLACK_BOTS, {"openai": 2, "anthropic": 1}, max_depth=5)
+    positions = []
+
+    async def on_queued(position):
+        positions.append(position)
+
+    async with queue.admit("chatgpt", on_queued=on_queued):
+        pass
+
+    assert positions == []
+    snapshot = metrics.snapshot()
+    assert snapshot["work_queue_wait_seconds{bot=chatgpt}"]["count"] == 1
+    assert snapshot["work_queue_service_seconds{bot=chatgpt}"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_provider_limit_is_shared_between_bots():
+    queue = WorkQueue(SLACK_BOTS, {"openai": 1, "anthropic": 1}, max_depth=5)
+    release = asyncio.Event()
+    positions = []
+
+    async def hold(bot_name):
+        async with queue.admit(bot_name):
+            await release.wait()
+
+    async def on_queued(position):
+        positions.append(position)
+
+    async def wait_for_slot():
+        async with queue.admit("dalle", on_queued=on_queued):
+            pass
+
+    holder = asyncio.create_task(hold("chatgpt"))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(wait_for_slot())
+    await asyncio.sleep(0)
+    assert positions == [1]
+    assert queue.depth == 1
+
+    # Other providers are not affected.
+    async with queue.admit("claude"):
+        pass
+
+    release.set()
+    await asyncio.gather(holder, waiter)
+    assert queue.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_is_full():
+    queue = WorkQueue(SLACK_BOTS, {"openai": 1, "anthropic": 1}, max_depth=1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with queue.admit("claude"):
+            await release.wait()
+
+    holders = [asyncio.create_task(hold()) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert queue.depth == 1
+
+    with pytest.raises(ServiceBusyError):
+        async with queue.admit("claude"):
+            pass
+    assert metrics.snapshot()["work_queue_rejected_total{bot=claude}"] == 1
+
+    release.set()
+    await asyncio.gather(*holders)
+    assert queue.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    queue = WorkQueue(SLACK_BOTS, {"openai": 1, "anthropic": 1}, max_depth=5)
+    release = asyncio.Event()
+
+    async def hold():
+        async with queue.admit("claude"):
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    assert queue.depth == 1
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert queue.depth == 0
+    release.set()
+    await holder
+
+
+@pytest.mark.asyncio
+async def test_position_is_reported_in_the_queue_being_waited_on():
+    queue = WorkQueue(SLACK_BOTS, {"openai": 2, "anthropic": 1}, max_depth=5)
+    release = asyncio.Event()
+    positions = []
+
+    async def hold(bot_name):
+        async def on_queued(position):
+            positions.append((bot_name, position))
+
+        async with queue.admit(bot_name, on_queued=on_queued):
+            await release.wait()
+
+    tasks = []
+    for bot_name in ["dalle", "dalle", "chatgpt", "chatgpt"]:
+        tasks.append(asyncio.create_task(hold(bot_name)))
+        await asyncio.sleep(0)
+
+    # The second dalle reply waits for dalle's only slot; the second chatgpt
+    # reply has a bot slot and is first in line for an OpenAI slot.
+    assert positions == [("dalle", 1), ("chatgpt", 1)]
+    assert queue.depth == 2
+    release.set()
+    await asyncio.gather(*tasks)
+    assert queue.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_notice_is_shown_only_to_the_requester():
+    from contextlib import asynccontextmanager
+    from unittest.mock import AsyncMock, MagicMock, patch
+    from app.slackbot.message_handler import generate_response
+
+    class FullWorkQueue:
+        @asynccontextmanager
+        async def admit(self, bot_name, on_queued=None):
+            await on_queued(3)
+            yield
+
+    client = AsyncMock()
+    with patch("app.slackbot.message_handler.work_queue", FullWorkQueue()), patch(
+        "app.slackbot.message_handler.fetch_thread_messages", AsyncMock()
+    ), patch(
+        "app.slackbot.message_handler.agent_manager.get_agent_async",
+        AsyncMock(return_value=MagicMock()),
+    ), patch(
+        "app.slackbot.message_handler.SlackResponseHandler"
+    ) as response_handler:
+        response_handler.return_value.handle_responses = AsyncMock()
+        await generate_response(
+            "chatgpt", client, "C1", "1.000001", "1.000002", "U1", "xoxb", "B1"
+        )
+
+    client.chat_postMessage.assert_not_called()
+    client.chat_postEphemeral.assert_awaited_once()
+    notice = client.chat_postEphemeral.call_args.kwargs
+    assert (notice["channel"], notice["user"], notice["thread_ts"]) == (
+        "C1",
+        "U1",
+        "1.000001",
+    )
+    assert "number 3 in the queue" in notice["text"]
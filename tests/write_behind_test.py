@@ -0,0 +1,105 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+from app.database.write_behind import WriteBehindQueue
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.commits = []
+
+    @asynccontextmanager
+    async def session_scope(self):
+        transaction = []
+        yield transaction
+        self.commits.append(transaction)
+
+    def write(self, value, fail=False):
+        async def write(session):
+            if fail:
+                raise RuntimeError(f"cannot write {value}")
+            session.append(value)
+
+        return write
+
+
+@pytest.fixture
+def database():
+    database = FakeDatabase()
+    with patch("app.database.write_behind.session_scope", database.session_scope):
+        yield database
+
+
+@pytest.mark.asyncio
+async def test_writes_are_committed_in_batches(database):
+    queue = WriteBehindQueue(flush_interval=0.01)
+    queue.start()
+    for value in range(5):
+        await queue.submit(database.write(value))
+    await queue.stop()
+
+    assert database.commits == [[0, 1, 2, 3, 4]]
+
+
+@pytest.mark.asyncio
+async def test_keyed_writes_are_coalesced_and_moved_back(database):
+    queue = WriteBehindQueue(flush_interval=0.01)
+    queue.start()
+    await queue.submit(database.write("text v1"), key="text")
+    await queue.submit(database.write("other"))
+    await queue.submit(database.write("text v2"), key="text")
+    await queue.stop()
+
+    assert database.commits == [["other", "text v2"]]
+
+
+@pytest.mark.asyncio
+async def test_submit_waits_while_the_queue_is_full(database):
+    queue = WriteBehindQueue(max_pending=1, flush_interval=0.05)
+    queue.start()
+    await queue.submit(database.write(1))
+    second = asyncio.create_task(queue.submit(database.write(2)))
+    await asyncio.sleep(0.01)
+    assert not second.done()
+
+    await asyncio.wait_for(second, 1)
+    await queue.stop()
+    assert [value for commit in database.commits for value in commit] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_failing_write_is_dropped_without_losing_its_batch(database):
+    queue = WriteBehindQueue(flush_interval=0.01, retry_backoff=0)
+    queue.start()
+    await queue.submit(database.write("a"))
+    await queue.submit(database.write("poison", fail=True))
+    await queue.submit(database.write("b"))
+    await queue.stop()
+
+    assert database.commits == [["a"], ["b"]]
+
+
+@pytest.mark.asyncio
+async def test_transient_failure_is_retried(database):
+    attempts = []
+
+    async def flaky_write(session):
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError("connection lost")
+        session.append("written")
+
+    queue = WriteBehindQueue(flush_interval=0, retry_backoff=0)
+    queue.start()
+    await queue.submit(flaky_write)
+    await queue.stop()
+
+    assert database.commits == [["written"]]
+
+
+@pytest.mark.asyncio
+async def test_submit_writes_inline_when_not_started(database):
+    queue = WriteBehindQueue()
+    await queue.submit(database.write("inline"))
+    assert database.commits == [["inline"]]